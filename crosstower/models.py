@@ -191,74 +191,112 @@ class Order:
 
 
 class Ticker:
-    """Symbol ticker information"""
+    """Symbol ticker information, parsed once when created. Read-only"""
 
-    def __init__(self, data: dict) -> None:
-        """Symbol ticker information"""
-        self._data = data
+    __slots__ = ('_symbol', '_timestamp', '_ask', '_bid', '_last', '_low', '_high', '_open', '_volume', '_volume_quote')
+
+    def __init__(self, data: dict, symbol: str = None) -> None:
+        """
+        Symbol ticker information
+
+        data : dict
+            One symbol's ticker from the API, prices as strings or numbers
+        symbol : str
+            Symbol name, if `data` doesn't hold it. Batch frames key each ticker by its symbol instead
+        """
+        self._symbol: str = symbol if symbol is not None else data.get('symbol')
+        epoch = int(data['t'])
+        if epoch > 2147483647:
+            # API wants to send milliseconds sometimes
+            # Prevent integer overflow
+            epoch //= 1000
+        self._timestamp: int = epoch
+        try:
+            # Every price is present in nearly every ticker
+            self._ask: float = float(data['a'])
+            self._bid: float = float(data['b'])
+            self._last: float = float(data['c'])
+            self._low: float = float(data['l'])
+            self._high: float = float(data['h'])
+            self._open: float = float(data['o'])
+            self._volume: float = float(data['v'])
+            self._volume_quote: float = float(data['q'])
+        except (KeyError, TypeError):
+            get = data.get
+            self._ask = _price(get('a'))
+            self._bid = _price(get('b'))
+            self._last = _price(get('c'))
+            self._low = _price(get('l'))
+            self._high = _price(get('h'))
+            self._open = _price(get('o'))
+            self._volume = _price(get('v'))
+            self._volume_quote = _price(get('q'))
 
     @property
     def dict(self) -> dict:
-        return self._data
+        """The ticker in the API's format"""
+        return {
+            'symbol': self._symbol, 't': self._timestamp, 'a': self._ask, 'b': self._bid, 'c': self._last,
+            'l': self._low, 'h': self._high, 'o': self._open, 'v': self._volume, 'q': self._volume_quote
+        }
 
     @property
     def csv_line(self) -> str:
-        return f"{self.ask},{self.bid},{self.last},{self.low},{self.high},{self.open},{self.volume},{self.volume_quote},{self.timestamp}\n"
+        return f"{self._ask},{self._bid},{self._last},{self._low},{self._high},{self._open},{self._volume},{self._volume_quote},{self._timestamp}\n"
 
     @property
     def symbol(self) -> str:
         """Symbol name"""
-        return self._data.get('symbol')
+        return self._symbol
 
     @property
     def ask(self) -> float:
         """Best ask price. Can return 'None' if no data."""
-        return float(self._data.get('a'))
+        return self._ask
 
     @property
     def bid(self) -> float:
         """Best bid price. Can return 'None' if no data."""
-        return float(self._data.get('b'))
+        return self._bid
 
     @property
     def last(self) -> float:
         """Last trade price. Can return 'None' if no data."""
-        return self._data.get('c')
+        return self._last
 
     @property
     def open(self) -> float:
         """Last trade price 24 hours ago. Can return 'None' if no data."""
-        return self._data.get('o')
+        return self._open
 
     @property
     def high(self) -> float:
         """Highest trade price within 24 hours"""
-        return self._data.get('h')
+        return self._high
 
     @property
     def low(self) -> float:
         """Lowest trade price within 24 hours"""
-        return self._data.get('l')
+        return self._low
 
     @property
     def volume(self) -> float:
         """Total trading amount within 24 hours in base currency"""
-        return self._data.get('v')
+        return self._volume
 
     @property
     def volume_quote(self) -> float:
         """Total trading amount within 24 hours in quote currency"""
-        return self._data.get('q')
+        return self._volume_quote
 
     @property
     def timestamp(self) -> int:
-        """Last update or refresh ticker timestamp"""
-        epoch = int(self._data.get('t'))
-        if epoch > 2147483647:
-            # API wants to send milliseconds sometimes
-            # Prevent integer overflow
-            epoch = int(epoch/1000)
-        return epoch
+        """Last update or refresh ticker timestamp, in epoch seconds"""
+        return self._timestamp
+
+
+def _price(value) -> float:
+    return float(value) if value is not None else None
 
 
 class Balance:
@@ -1,8 +1,11 @@
 import json
 from time import time as now
+from typing import List
 
 from utils.config import CrosstowerConfig
 from websocket import create_connection, WebSocket
+from websockets import connect as Connection
+from websockets.exceptions import ConnectionClosed
 from crosstower.socket_api.utils import handle_response
 from crosstower.models import Ticker
 
@@ -11,10 +14,22 @@ class ConnectionException(Exception):
     pass
 
 
+def parse_tickers(response: str, symbols: List[str]) -> List[Ticker]:
+    '''
+    Every subscribed symbol's ticker in one `ticker/1s/batch` frame, each tagged with its symbol.
+    Frames only hold the symbols that changed, so some may be missing.
+    The frame is parsed once, each Ticker converts its fields as it is created.
+    '''
+    full_data: dict = handle_response(response).get('data') or {}
+    return [Ticker(full_data[symbol], symbol) for symbol in symbols if full_data.get(symbol)]
+
+
 class TickerWebsocket:
 
-    def __init__(self, symbol: str = CrosstowerConfig.DEFAULT_SYMBOL) -> None:
-        self.symbol = symbol
+    def __init__(self, symbols: List[str] = None) -> None:
+        # Every symbol shares the one subscription
+        self.symbols: List[str] = list(symbols) if symbols else [CrosstowerConfig.DEFAULT_SYMBOL]
+        self.symbol = self.symbols[0]
         self.uri = CrosstowerConfig.SOCKET_V3_URL + '/public'
         self.connection: WebSocket = None
 
@@ -27,7 +42,7 @@ class TickerWebsocket:
             "method": "subscribe",
             "ch": "ticker/1s/batch",
             "params": {
-                "symbols": [self.symbol]
+                "symbols": self.symbols
             },
             "id": int(now())
         }))
@@ -45,17 +60,84 @@ class TickerWebsocket:
 
     def get_ticker(self) -> Ticker:
         '''
-        Synchronously retrieves ticker data from the queue.
+        Synchronously retrieves ticker data from the queue, for the first symbol only.
+        '''
+        tickers = [ticker for ticker in self.get_tickers() if ticker.symbol == self.symbol]
+        return tickers[0] if tickers else None
+
+    def get_tickers(self) -> List[Ticker]:
+        '''
+        Synchronously retrieves the next frame of ticker data, one ticker per symbol it holds.
         '''
         response = self.connection.recv()
         if not response:
             raise ConnectionException
-        full_data: dict = handle_response(response).get('data')
-        symbol_ticker: dict = full_data.get(self.symbol)
-        if not symbol_ticker:
-            return None
-        return Ticker(symbol_ticker)
+        return parse_tickers(response, self.symbols)
 
     def stop(self) -> None:
         self.connection.close()
-    
\ No newline at end of file
+    
+
+
+class AsyncTickerWebsocket:
+
+    '''
+    asyncio counterpart to TickerWebsocket, built on the `websockets` library
+    '''
+
+    def __init__(self, symbols: List[str] = None) -> None:
+        # Every symbol shares the one subscription
+        self.symbols: List[str] = list(symbols) if symbols else [CrosstowerConfig.DEFAULT_SYMBOL]
+        self.symbol = self.symbols[0]
+        self.uri = CrosstowerConfig.SOCKET_V3_URL + '/public'
+        self.connection: Connection = None
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    async def subscribe(self) -> bool:
+        '''
+        Starts subscription to ticker stream, returns True if successful
+        '''
+        self.connection = await Connection(self.uri)
+        await self.connection.send(json.dumps({
+            "method": "subscribe",
+            "ch": "ticker/1s/batch",
+            "params": {
+                "symbols": self.symbols
+            },
+            "id": int(now())
+        }))
+        result = await self.connection.recv()
+        return json.loads(result).get('result')
+
+    async def get_ticker(self) -> Ticker:
+        '''
+        Waits for the next ticker message, for the first symbol only. Raises ConnectionException once the connection is closed, from either end.
+        '''
+        tickers = [ticker for ticker in await self.get_tickers() if ticker.symbol == self.symbol]
+        return tickers[0] if tickers else None
+
+    async def get_tickers(self) -> List[Ticker]:
+        '''
+        Waits for the next ticker message, returning one ticker per symbol it holds.
+        Raises ConnectionException once the connection is closed, from either end.
+        '''
+        if not self.connection:
+            raise ConnectionException
+        try:
+            response = await self.connection.recv()
+        except ConnectionClosed:
+            raise ConnectionException
+        if not response:
+            raise ConnectionException
+        return parse_tickers(response, self.symbols)
+
+    async def close(self) -> None:
+        '''
+        Closes the connection, if open. A pending get_ticker() raises ConnectionException.
+        '''
+        connection, self.connection = self.connection, None
+        if connection:
+            await connection.close()
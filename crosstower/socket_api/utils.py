@@ -1,11 +1,24 @@
 import json
 
+try:
+    # Optional, parses ticker frames several times faster than the json module
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(response):
+    '''
+    Parse a JSON message, with orjson when it is installed
+    '''
+    if orjson is not None:
+        return orjson.loads(response)
+    return json.loads(response)
+
 
 def handle_response(response: str) -> dict:
-    response = json.loads(response)
+    response = loads(response)
     if response.get('error'):
         err = f"API responded with error {response['error']['code']}: '{response['error']['message']}'"
         raise Exception(err)
     return response
-
-
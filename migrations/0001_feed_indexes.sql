@@ -0,0 +1,14 @@
+-- Newest-ticker lookups (get_latest_tickers) and time-range counts
+CREATE INDEX IF NOT EXISTS ticker_feed_timestamp_idx ON ticker_feed (timestamp);
+
+-- Latest order/prediction lookups
+CREATE INDEX IF NOT EXISTS order_feed_timestamp_idx ON order_feed (timestamp);
+CREATE INDEX IF NOT EXISTS prediction_feed_timestamp_idx ON prediction_feed (timestamp);
+
+-- Queue scans only ever look at QUEUED rows, which stay a tiny fraction of each table
+CREATE INDEX IF NOT EXISTS order_feed_queued_idx ON order_feed (timestamp) WHERE status = 'QUEUED';
+CREATE INDEX IF NOT EXISTS prediction_feed_queued_idx ON prediction_feed (timestamp) WHERE status = 'QUEUED';
+
+-- Status updates look rows up by uuid, which is unique per order & prediction
+CREATE UNIQUE INDEX IF NOT EXISTS order_feed_uuid_idx ON order_feed (uuid);
+CREATE UNIQUE INDEX IF NOT EXISTS prediction_feed_uuid_idx ON prediction_feed (uuid);
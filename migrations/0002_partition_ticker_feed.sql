@@ -0,0 +1,26 @@
+-- Turn ticker_feed into a table range-partitioned on timestamp.
+-- Rows from before the current month stay in ticker_feed_legacy, which is attached as the oldest partition.
+-- Later partitions are created ahead of time by utils.partitions.TickerPartitions, see PostgresConfig.TICKER_PARTITION_INTERVAL
+
+ALTER TABLE ticker_feed RENAME TO ticker_feed_legacy;
+ALTER INDEX ticker_feed_timestamp_idx RENAME TO ticker_feed_legacy_timestamp_idx;
+
+CREATE TABLE ticker_feed (LIKE ticker_feed_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp);
+CREATE INDEX ticker_feed_timestamp_idx ON ticker_feed (timestamp);
+
+-- Catches rows outside every partition (ex. a NULL timestamp) rather than failing the insert
+CREATE TABLE ticker_feed_default PARTITION OF ticker_feed DEFAULT;
+
+DO $$
+DECLARE
+  current_start TIMESTAMP := date_trunc('month', NOW()::timestamp);
+BEGIN
+  EXECUTE format(
+    'CREATE TABLE %I PARTITION OF ticker_feed FOR VALUES FROM (%L) TO (%L)',
+    'ticker_feed_p' || to_char(current_start, 'YYYYMMDD'), current_start, current_start + INTERVAL '1 month'
+  );
+  -- Rows from this month onwards (or without a timestamp) move out of the legacy table, so it can be attached
+  INSERT INTO ticker_feed SELECT * FROM ticker_feed_legacy WHERE timestamp >= current_start OR timestamp IS NULL;
+  DELETE FROM ticker_feed_legacy WHERE timestamp >= current_start OR timestamp IS NULL;
+  EXECUTE format('ALTER TABLE ticker_feed ATTACH PARTITION ticker_feed_legacy FOR VALUES FROM (MINVALUE) TO (%L)', current_start);
+END $$;
@@ -0,0 +1,6 @@
+-- When a prediction was claimed by a worker, and how many times, so stuck PROCESSING rows can be requeued
+ALTER TABLE prediction_feed ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
+ALTER TABLE prediction_feed ADD COLUMN IF NOT EXISTS claim_count INTEGER NOT NULL DEFAULT 0;
+
+-- The requeue sweep only looks at PROCESSING rows
+CREATE INDEX IF NOT EXISTS prediction_feed_processing_idx ON prediction_feed (claimed_at) WHERE status = 'PROCESSING';
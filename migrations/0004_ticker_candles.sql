@@ -0,0 +1,30 @@
+-- OHLCV candles of the ask price, rolled up from ticker_feed at each of PostgresConfig.CANDLE_RESOLUTIONS (in seconds).
+-- Athena merges new tickers into them as they are written, see Postgres.update_candles.
+-- volume is the exchange's rolling 24h volume as of the last ticker in the candle.
+CREATE TABLE IF NOT EXISTS ticker_feed_candles (
+  resolution INTEGER NOT NULL,
+  bucket TIMESTAMP NOT NULL,
+  open DOUBLE PRECISION,
+  high DOUBLE PRECISION,
+  low DOUBLE PRECISION,
+  close DOUBLE PRECISION,
+  volume DOUBLE PRECISION,
+  ticker_count INTEGER NOT NULL,
+  first_timestamp TIMESTAMP NOT NULL,
+  last_timestamp TIMESTAMP NOT NULL,
+  PRIMARY KEY (resolution, bucket)
+);
+
+-- Backfill from the tickers already stored
+INSERT INTO ticker_feed_candles (resolution, bucket, open, high, low, close, volume, ticker_count, first_timestamp, last_timestamp)
+SELECT resolution, TO_TIMESTAMP(bucket_epoch)::timestamp,
+  (ARRAY_AGG(price ORDER BY timestamp))[1], MAX(price), MIN(price), (ARRAY_AGG(price ORDER BY timestamp DESC))[1],
+  (ARRAY_AGG(volume ORDER BY timestamp DESC))[1], COUNT(*), MIN(timestamp), MAX(timestamp)
+FROM (
+  SELECT resolution, timestamp, ask::float8 AS price, volume::float8 AS volume,
+    FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint / resolution * resolution AS bucket_epoch
+  FROM ticker_feed, UNNEST(ARRAY[60, 300, 3600, 86400]) AS resolution
+  WHERE timestamp IS NOT NULL
+) AS rows
+GROUP BY resolution, bucket_epoch
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,26 @@
+-- Prices, quantities & weights as double precision rather than NUMERIC, and prediction_history as float8[] rather than TEXT[].
+-- These are 8 bytes wide on disk and decode straight to Python floats, rather than through Decimal or str.
+-- prediction_timestamp only ever holds epoch seconds, so it becomes a BIGINT.
+-- The timestamp columns stay TIMESTAMP: ticker_feed is partitioned on its timestamp (see 0002), and the queue & retention queries compare them with NOW().
+-- Each table is rewritten once. Partitions already detached by the retention job keep the old types.
+ALTER TABLE ticker_feed
+  ALTER COLUMN ask TYPE DOUBLE PRECISION,
+  ALTER COLUMN bid TYPE DOUBLE PRECISION,
+  ALTER COLUMN last TYPE DOUBLE PRECISION,
+  ALTER COLUMN low TYPE DOUBLE PRECISION,
+  ALTER COLUMN high TYPE DOUBLE PRECISION,
+  ALTER COLUMN open TYPE DOUBLE PRECISION,
+  ALTER COLUMN volume TYPE DOUBLE PRECISION,
+  ALTER COLUMN volume_quote TYPE DOUBLE PRECISION;
+
+ALTER TABLE order_feed
+  ALTER COLUMN quantity TYPE DOUBLE PRECISION,
+  ALTER COLUMN usd_balance TYPE DOUBLE PRECISION,
+  ALTER COLUMN btc_balance TYPE DOUBLE PRECISION,
+  ALTER COLUMN current_price TYPE DOUBLE PRECISION;
+
+ALTER TABLE prediction_feed
+  ALTER COLUMN prediction_timestamp TYPE BIGINT,
+  ALTER COLUMN prediction_weight TYPE DOUBLE PRECISION,
+  ALTER COLUMN prediction_history TYPE DOUBLE PRECISION[] USING prediction_history::float8[],
+  ALTER COLUMN prediction_percent TYPE DOUBLE PRECISION;
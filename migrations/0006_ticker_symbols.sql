@@ -0,0 +1,10 @@
+-- Tickers & candles for every scraped symbol share one table each, keyed by symbol.
+-- Rows from before this migration belong to the one symbol scraped so far, CrosstowerConfig.DEFAULT_SYMBOL, which stays the column default.
+-- A constant default doesn't rewrite the tables.
+ALTER TABLE ticker_feed ADD COLUMN IF NOT EXISTS symbol VARCHAR(20) NOT NULL DEFAULT 'BTCUSD_TR';
+
+-- Per-symbol newest-ticker lookups. ticker_feed_timestamp_idx stays for counts, retention & archival, which span every symbol
+CREATE INDEX IF NOT EXISTS ticker_feed_symbol_timestamp_idx ON ticker_feed (symbol, timestamp);
+
+ALTER TABLE ticker_feed_candles ADD COLUMN IF NOT EXISTS symbol VARCHAR(20) NOT NULL DEFAULT 'BTCUSD_TR';
+ALTER TABLE ticker_feed_candles DROP CONSTRAINT ticker_feed_candles_pkey, ADD PRIMARY KEY (symbol, resolution, bucket);
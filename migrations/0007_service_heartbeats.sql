@@ -0,0 +1,14 @@
+-- One row per service, upserted every few seconds by utils.heartbeat.Heartbeat.
+-- PostgresMonitor reads these rather than counting & scanning the data tables.
+--   beat_at        : Last time the service's process published, so it is still running
+--   progress_at    : Last time it got work done (tickers written, a prediction queued, an order handled)
+--   progress_count : Units of work done since started_at
+--   counters       : Any other per-service counters, ex. {"tickers": 1200, "dropped": 3}
+CREATE TABLE IF NOT EXISTS service_heartbeats (
+  service VARCHAR(64) PRIMARY KEY,
+  started_at TIMESTAMP NOT NULL,
+  beat_at TIMESTAMP NOT NULL,
+  progress_at TIMESTAMP,
+  progress_count BIGINT NOT NULL DEFAULT 0,
+  counters JSONB NOT NULL DEFAULT '{}'
+);
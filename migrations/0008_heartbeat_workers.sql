@@ -0,0 +1,7 @@
+-- One heartbeat row per worker process rather than per service, so one healthy worker can't hide a dead one.
+--   worker  : hostname:pid of the process. Rows from before this migration keep an empty worker until the service restarts
+--   tick_at : Last time the service's main loop woke up. beat_at is published from a background thread, so it keeps moving
+--             even if the loop hangs. Services that can sit idle (Hermes) are monitored on this instead
+ALTER TABLE service_heartbeats ADD COLUMN IF NOT EXISTS worker VARCHAR(128) NOT NULL DEFAULT '';
+ALTER TABLE service_heartbeats ADD COLUMN IF NOT EXISTS tick_at TIMESTAMP;
+ALTER TABLE service_heartbeats DROP CONSTRAINT service_heartbeats_pkey, ADD PRIMARY KEY (service, worker);
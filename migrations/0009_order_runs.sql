@@ -0,0 +1,25 @@
+-- The current run of consecutive same-side orders, as one row. Hermes locks it, sizes each order from it, and writes it
+-- back in the same transaction as the order, see Postgres.get_order_run & olympus/helper_objects/order_run.py.
+--   quantities : Absolute quantities of the oldest orders in the run, oldest first. Only the first
+--                TradingConfig.ORDER_RUN_SUM_LIMIT + 1 (11) are ever needed, so no more are kept
+CREATE TABLE IF NOT EXISTS order_feed_run (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  side VARCHAR(10),
+  count INTEGER NOT NULL DEFAULT 0,
+  quantities DOUBLE PRECISION[] NOT NULL DEFAULT '{}'
+);
+
+-- Backfill from the orders already recorded: every order newer than the last one on the opposite side.
+-- Aggregating over no orders still gives one (empty) row, so the row always exists from here on
+INSERT INTO order_feed_run (side, count, quantities)
+SELECT MIN(side), COUNT(*), COALESCE((ARRAY_AGG(ABS(quantity) ORDER BY timestamp ASC))[1:11], '{}')
+FROM (
+  SELECT side, quantity, timestamp,
+    BOOL_OR(side <> newest_side) OVER (ORDER BY timestamp DESC ROWS UNBOUNDED PRECEDING) AS before_run
+  FROM (
+    SELECT side, quantity, timestamp, FIRST_VALUE(side) OVER (ORDER BY timestamp DESC) AS newest_side
+    FROM order_feed
+  ) AS orders
+) AS flagged
+WHERE NOT before_run
+ON CONFLICT (id) DO NOTHING;
@@ -0,0 +1,8 @@
+-- Heartbeats are published & read as epoch seconds. Stored in TIMESTAMP columns, they were shifted by the session's
+-- TimeZone on the way in and not on the way out, so every age was off by the UTC offset unless the server ran in UTC.
+-- TIMESTAMPTZ stores the instant itself. Existing rows are read in the session TimeZone, as they were written in it.
+ALTER TABLE service_heartbeats
+  ALTER COLUMN started_at TYPE TIMESTAMPTZ,
+  ALTER COLUMN beat_at TYPE TIMESTAMPTZ,
+  ALTER COLUMN progress_at TYPE TIMESTAMPTZ,
+  ALTER COLUMN tick_at TYPE TIMESTAMPTZ;
@@ -1,14 +1,17 @@
-import os
 import traceback
-from queue import Queue
+from queue import Empty, Queue
 from threading import Thread
 from time import sleep
 from time import time as now
+from typing import Dict, List
 
 from crosstower.models import Ticker
 from crosstower.socket_api.public import ConnectionException, TickerWebsocket
 from utils import DiscordWebhook, Logger, Postgres
 from utils.config import CrosstowerConfig, ScraperConfig
+from utils.csv_sink import CsvSink
+from utils.heartbeat import Heartbeat
+from utils.partitions import TickerPartitions
 from olympus.primordial_chaos import PrimordialChaos
 
 
@@ -17,9 +20,12 @@ class Athena(PrimordialChaos):
     Scrape CrossTower API for crypto price history
     '''
 
-    def __init__(self, custom_csv_path: str = None, custom_symbol: str = None, custom_interval: int = 1):
+    def __init__(self, custom_csv_path: str = None, custom_symbol: str = None, custom_interval: int = 1, custom_batch_size: int = None, custom_batch_latency: float = None,
+                 custom_symbols: List[str] = None):
         '''
-        If csv_path is None, default SQL connection will be used
+        If csv_path is None, default SQL connection will be used.
+        In SQL mode, a batch size above 1 drains the queue in micro-batches, written with one bulk insert each.
+        Every one of `custom_symbols` is scraped over the same socket, each filtered by the interval on its own. CSV mode only writes the first.
         '''
         super().__init__()
         self.log = Logger.setup(__name__)
@@ -31,8 +37,19 @@ class Athena(PrimordialChaos):
         self.connection_attempts: int = 0
         # Set timestamp for last update
         self.last_time = now()
+        # Timestamp of the last ticker accepted for writing, per symbol
+        self.latest: Dict[str, int] = {}
 
-        self.websocket = TickerWebsocket()
+        if custom_symbols:
+            self.symbols: List[str] = list(custom_symbols)
+        elif custom_symbol:
+            self.symbols = [custom_symbol]
+        else:
+            self.symbols = [CrosstowerConfig.DEFAULT_SYMBOL]
+        self.symbol = self.symbols[0]
+        self.websocket = TickerWebsocket(self.symbols)
+        self.batch_size: int = custom_batch_size if custom_batch_size else ScraperConfig.SQL_BATCH_SIZE
+        self.batch_latency: float = custom_batch_latency if custom_batch_latency else ScraperConfig.SQL_BATCH_MAX_LATENCY
 
         # Constantly fetch new tickers
         self.ticker_thread: Thread = Thread(target=self.ticker_loop, daemon=True)
@@ -40,17 +57,18 @@ class Athena(PrimordialChaos):
         self.watchdog_thread: Thread = Thread(target=self.watchdog_loop)
         # Add them all to superclass so they can be started/stopped
         if self.csv_path:
+            self.csv_sink = CsvSink(self.csv_path)
             self.csv_thread: Thread = Thread(target=self.csv_loop)
             self.all_threads = [self.csv_thread, self.ticker_thread, self.watchdog_thread]
         else:
             self.postgres = Postgres()
-            self.sql_thread: Thread = Thread(target=self.sql_loop)
+            # Creates ticker table partitions ahead of the incoming tickers
+            self.partitions = TickerPartitions(self.postgres)
+            self.sql_thread: Thread = Thread(target=self.sql_batch_loop if self.batch_size > 1 else self.sql_loop)
             self.all_threads = [self.sql_thread, self.ticker_thread, self.watchdog_thread]
+        # Only published in SQL mode, the watchdog reads it in either mode
+        self.heartbeat = Heartbeat('Athena', None if self.csv_path else self.postgres)
 
-        if custom_symbol:
-            self.symbol = custom_symbol
-        else:
-            self.symbol = CrosstowerConfig.DEFAULT_SYMBOL
         if custom_interval:
             self.interval = custom_interval
         else:
@@ -78,20 +96,20 @@ class Athena(PrimordialChaos):
             self.alert_with_error('[__subscribe] Failed to subscribe to socket')
             raise ConnectionException
 
-    def __get_response(self, attempt_threshold = 3) -> Ticker:
+    def __get_response(self, attempt_threshold = 3) -> List[Ticker]:
         '''
         It takes a websocket, and attempts to receive a response from it. If it receives a response, it
-        parses it and returns a Ticker object. If it doesn't receive a response, it returns None
+        parses it and returns a Ticker object for each symbol in it.
         
         :param websocket: Connection
         :param attempt_threshold: The number of times the client will attempt to receive a response from the
         server before giving up, defaults to 3 (optional)
-        :return: A Ticker object
+        :return: A list of Ticker objects, possibly empty
         '''
         request_attempts = 0
         while True:
             try:
-                return self.websocket.get_ticker()
+                return self.websocket.get_tickers()
             except Exception as err:
                 trace = traceback.format_exc()
                 self.log.debug(f'[__get_response] Error while awaiting response: {trace}')
@@ -105,7 +123,7 @@ class Athena(PrimordialChaos):
     def __ticker_loop_attempt(self, connection_attempt: int, socket_restart_attempt: int = 0):
         '''
         This function is a asynchronous. It creates a connection to the websocket, subscribes to the ticker channel, 
-        and then waits for a response from the websocket. If the response is a ticker, it is put into the queue
+        and then waits for a response from the websocket. Every ticker in the response is put into the queue
         
         :param connection_attempt: The current attempt number. Used to kill old connections.
         '''
@@ -117,15 +135,14 @@ class Athena(PrimordialChaos):
                 self.abort = True
                 return
             try:
-                ticker = self.__get_response()
+                tickers = self.__get_response()
             except ConnectionException:
                 self.log.debug('[__ticker_loop_attempt] ConnectionException raised. Restarting socket...')
                 socket_restart_attempt += 1
                 self.websocket.reconnect()
                 continue
-            if not ticker:
-                continue
-            self.queue.put(ticker)
+            for ticker in tickers:
+                self.queue.put(ticker)
 
 
     def ticker_loop(self):
@@ -147,7 +164,7 @@ class Athena(PrimordialChaos):
 
     def watchdog_loop(self):
         '''
-        Monitor a running scraper. If the last line of the log file is the same as the current line, and the time since the last update
+        Monitor a running scraper. If the heartbeat has counted no new tickers written, and the time since the last update
         is longer than the interval, then restart the socket
         
         :param path: The path to the log file
@@ -179,49 +196,57 @@ class Athena(PrimordialChaos):
 
     def csv_loop(self):
         '''
-        If the queue is populated, get the ticker from the queue, 
-        and if the ticker's timestamp is more than
-        interval seconds away from the latest timestamp,
-        then write the ticker to the csv file
+        Wait for tickers on the queue, taking up to CSV_BATCH_SIZE at once, and write those for the first symbol
+        whose timestamp is more than interval seconds away from the latest timestamp to the csv file.
+        Lines go through self.csv_sink, which flushes & rotates the file per the ScraperConfig.CSV_* settings
         '''
-        # Make file if not exist
-        if not os.path.exists(self.csv_path):
-            self.log.debug(f'Creating csv file at {self.csv_path}')
-            with open(self.csv_path, 'w') as csv_file:
-                csv_file.write('')
         try:
-            latest = None
-            self.log.debug('Running CSV loop...')
+            self.log.debug(f'Running CSV loop, writing to {self.csv_path}...')
             while not self.abort:
-                if self.queue.qsize() > 0:
-                    ticker: Ticker = self.queue.get()
-                    if not latest or (ticker.timestamp - latest) >= self.interval:
-                        latest = ticker.timestamp
-                        with open(self.csv_path, 'a') as file:
-                            file.write(ticker.csv_line)
-                            file.close()
+                try:
+                    tickers: List[Ticker] = [self.queue.get(timeout=1)]
+                except Empty:
+                    # Buffered lines still reach the file while the socket is quiet
+                    self.csv_sink.write_lines([])
+                    continue
+                while len(tickers) < ScraperConfig.CSV_BATCH_SIZE:
+                    try:
+                        tickers.append(self.queue.get_nowait())
+                    except Empty:
+                        break
+                # One symbol per file, the CSV has no symbol column
+                lines = [ticker.csv_line for ticker in tickers if ticker.symbol in (None, self.symbol) and self.__accept(ticker)]
+                self.csv_sink.write_lines(lines)
+                if lines:
+                    self.heartbeat.progress(len(lines), tickers=len(lines))
         except KeyboardInterrupt:
             self.log.debug('Keyboard interrupt received. Aborting...')
             self.abort = True
         except Exception as err:
             self.alert_with_error(f'[csv_loop] {err}\n{traceback.format_exc()}')
             raise err
+        finally:
+            self.csv_sink.close()
 
     def sql_loop(self):
         """
         Get the latest ticker from the queue, if it's been at least
-        self.interval seconds since the last ticker was inserted, insert it into the database
+        self.interval seconds since the last ticker of its symbol was inserted, insert it into the database
         """
         try:
-            latest = None
             self.log.debug('Running SQL loop...')
             while not self.abort:
-                if self.queue.qsize() > 0:
-                    ticker: Ticker = self.queue.get()
-                    if not latest or (ticker.timestamp - latest) >= self.interval:
-                        latest = ticker.timestamp
+                try:
+                    # Wakes as soon as a ticker is queued, the timeout only lets the loop check for abort
+                    ticker: Ticker = self.queue.get(timeout=1)
+                except Empty:
+                    continue
+                if self.__accept(ticker):
+                    self.partitions.ensure(ticker.timestamp)
+                    with self.postgres.transaction():
                         self.postgres.insert_ticker(ticker)
-                    sleep(1)
+                        self.postgres.update_candles([ticker])
+                    self.heartbeat.progress(1, tickers=1)
         except KeyboardInterrupt:
             self.log.debug('Keyboard interrupt received. Aborting...')
             self.abort = True
@@ -229,21 +254,55 @@ class Athena(PrimordialChaos):
             self.alert_with_error(f'[sql_loop] {err}\n{traceback.format_exc()}')
             raise err
 
-    def __get_latest_local_ticker(self):
-        if self.csv_path:
-            with open(self.csv_path, 'rb') as f:
-                for i in range(-2, 0):
-                    try:
-                        f.seek(i, os.SEEK_END)
-                        while f.read(1) != b'\n':
-                            f.seek(i, os.SEEK_CUR)
-                        return f.readline().decode()
-                    except OSError:
-                        continue
-                return ""
-        else:
-            latest = self.postgres.get_latest_tickers(row_count=1)
-            if type(latest) is list and len(latest) > 0:
-                return latest[0]
-            else:
-                return None
+    def sql_batch_loop(self):
+        """
+        Collect tickers from the queue into a batch, filtering each symbol by self.interval as they arrive.
+        The batch is bulk inserted once it holds self.batch_size tickers,
+        or once its oldest ticker has waited self.batch_latency seconds
+        """
+        batch = []
+        try:
+            deadline = None
+            self.log.debug(f'Running SQL batch loop (batch size: {self.batch_size}, max latency: {self.batch_latency}s)...')
+            while not self.abort:
+                timeout = max(deadline - now(), 0) if batch else self.batch_latency
+                try:
+                    ticker: Ticker = self.queue.get(timeout=timeout)
+                except Empty:
+                    ticker = None
+                if ticker and self.__accept(ticker):
+                    if not batch:
+                        deadline = now() + self.batch_latency
+                    batch.append(ticker)
+                if batch and (len(batch) >= self.batch_size or now() >= deadline):
+                    self.partitions.ensure(batch[-1].timestamp)
+                    self.__write_batch(batch)
+                    batch = []
+            # Don't drop whatever was collected before aborting
+            self.__write_batch(batch)
+        except KeyboardInterrupt:
+            self.log.debug('Keyboard interrupt received. Aborting...')
+            self.abort = True
+        except Exception as err:
+            self.alert_with_error(f'[sql_batch_loop] {err}\n{traceback.format_exc()}')
+            raise err
+
+    def __accept(self, ticker: Ticker) -> bool:
+        latest = self.latest.get(ticker.symbol)
+        if latest and (ticker.timestamp - latest) < self.interval:
+            return False
+        self.latest[ticker.symbol] = ticker.timestamp
+        return True
+
+    def __write_batch(self, batch: List[Ticker]):
+        if not batch:
+            return
+        # The tickers & their candles commit together
+        with self.postgres.transaction():
+            self.postgres.insert_tickers_bulk(batch)
+            self.postgres.update_candles(batch)
+        self.heartbeat.progress(len(batch), tickers=len(batch))
+
+    def __get_latest_local_ticker(self) -> int:
+        # Tickers written so far, from memory rather than reading back the CSV or the ticker table
+        return self.heartbeat.progress_count
@@ -0,0 +1,271 @@
+import asyncio
+import traceback
+from threading import Thread
+from time import time as now
+from typing import Dict, List
+
+from crosstower.models import Ticker
+from crosstower.socket_api.public import AsyncTickerWebsocket, ConnectionException
+from utils import DiscordWebhook, Logger, Postgres
+from utils.config import CrosstowerConfig, ScraperConfig
+from utils.heartbeat import Heartbeat
+from utils.partitions import TickerPartitions
+from utils.postgres_async import AsyncPostgres
+from olympus.primordial_chaos import PrimordialChaos
+
+
+class AsyncAthena(PrimordialChaos):
+    '''
+    Scrape CrossTower API for crypto price history into Postgres, on a single event loop.
+
+    Three tasks share one bounded queue:
+        receive  : Keeps the websocket subscribed to every symbol & queues each ticker, reconnecting in place when the connection drops
+        persist  : Filters each symbol by `interval`, then writes tickers of every symbol together in batches of up to `batch_size`,
+                   each batch & its candles in one transaction. A batch that fails to write is kept & written again later
+        watchdog : Closes the socket when no ticker has arrived for `timeout_threshold` seconds, so receive reconnects
+
+    The loop runs on one thread, so `run()`, `stop()` & `abort` behave like Athena's. `stop()` cancels the receive & watchdog
+    tasks, and queues STOP for the persist task, which writes everything queued before it and then exits.
+    '''
+
+    STOP = object()
+    '''Queued to end the persist task once it has written every ticker ahead of it.'''
+
+    def __init__(self, custom_symbol: str = None, custom_interval: int = 1, custom_batch_size: int = None, custom_batch_latency: float = None,
+                 custom_queue_size: int = None, custom_symbols: List[str] = None):
+        super().__init__()
+        self.log = Logger.setup(__name__)
+        self.discord = DiscordWebhook('Athena')
+        if custom_symbols:
+            self.symbols: List[str] = list(custom_symbols)
+        else:
+            self.symbols = [custom_symbol if custom_symbol else CrosstowerConfig.DEFAULT_SYMBOL]
+        self.symbol = self.symbols[0]
+        self.interval = custom_interval if custom_interval else 1
+        self.timeout_threshold = self.interval * ScraperConfig.SOCKET_TIMEOUT_INTERVAL_MULTIPLIER
+        self.batch_size: int = custom_batch_size if custom_batch_size else ScraperConfig.SQL_BATCH_SIZE
+        self.batch_latency: float = custom_batch_latency if custom_batch_latency else ScraperConfig.SQL_BATCH_MAX_LATENCY
+        self.queue_size: int = custom_queue_size if custom_queue_size else ScraperConfig.TICKER_QUEUE_SIZE
+
+        self.websocket = AsyncTickerWebsocket(self.symbols)
+        self.async_postgres = AsyncPostgres()
+        # Partition maintenance & the ticker scraper's other jobs still use the blocking client
+        self.postgres = Postgres()
+        self.partitions = TickerPartitions(self.postgres)
+        # Published from its own thread with the blocking client, never from the event loop
+        self.heartbeat = Heartbeat('Athena', self.postgres)
+
+        # Counts the number of socket (re)connections
+        self.connection_attempts: int = 0
+        # Tickers dropped because the queue was full, or a batch that failed to write grew too large to keep
+        self.dropped: int = 0
+        # Batch writes failed in a row, only the first of them is alerted
+        self.write_failures: int = 0
+        # Set timestamp for last ticker received
+        self.last_time = now()
+        # Timestamp of the last ticker accepted for writing, per symbol
+        self.latest: Dict[str, int] = {}
+
+        self.loop: asyncio.AbstractEventLoop = None
+        self.queue: asyncio.Queue = None
+        self.tasks: List[asyncio.Task] = []
+        self.cancelled: bool = False
+        self.loop_thread: Thread = Thread(target=self.event_loop)
+        self.all_threads = [self.loop_thread]
+
+    def event_loop(self):
+        '''
+        Run the receive, persist & watchdog tasks until stopped, or until one of them fails
+        '''
+        try:
+            asyncio.run(self.main())
+        except asyncio.CancelledError:
+            self.log.debug('Tasks cancelled')
+        except KeyboardInterrupt:
+            self.log.debug('Keyboard interrupt received. Aborting...')
+        except Exception as err:
+            self.alert_with_error(f'[event_loop] {err}\n{traceback.format_exc()}')
+            raise err
+        finally:
+            self.abort = True
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        # Made here so it belongs to this loop
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.tasks = [asyncio.create_task(coroutine) for coroutine in (self.receive_loop(), self.persist_loop(), self.watchdog_loop())]
+        if self.abort:
+            self.__cancel_tasks()
+        try:
+            await asyncio.gather(*self.tasks)
+        finally:
+            self.__cancel_tasks()
+            # Lets the persist task finish its last write
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+            await self.websocket.close()
+            await self.async_postgres.close()
+
+    def stop(self):
+        '''
+        Stop the tasks, see the class docstring (does not wait for them to finish)
+        '''
+        super().stop()
+        try:
+            if self.loop and not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(self.__cancel_tasks)
+        except RuntimeError:
+            # The loop closed in the meantime
+            pass
+
+    async def receive_loop(self):
+        '''
+        Subscribe to the ticker channel & queue every ticker received, of every symbol. A dropped or closed connection is reopened in place,
+        backing off between attempts, until SOCKET_MAX_RECONNECTS attempts in a row have failed.
+        '''
+        failures = 0
+        self.log.debug('Running receive loop...')
+        while True:
+            try:
+                if not self.websocket.connected:
+                    await self.__subscribe()
+                tickers = await self.websocket.get_tickers()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                failures += 1
+                self.log.debug(f'[receive_loop] Error while awaiting response: {traceback.format_exc()}')
+                if failures > ScraperConfig.SOCKET_MAX_RECONNECTS:
+                    raise ConnectionException(f'Socket failed {failures} times in a row')
+                self.log.warn(f'[receive_loop] Socket failed, reconnecting (attempt {failures})...')
+                await self.websocket.close()
+                await asyncio.sleep(min(2 ** failures, 30))
+                continue
+            failures = 0
+            if not tickers:
+                continue
+            self.last_time = now()
+            for ticker in tickers:
+                self.put_ticker(ticker)
+
+    def put_ticker(self, ticker: Ticker):
+        '''
+        Queue a ticker without waiting. When the queue is full the oldest ticker is dropped,
+        so a slow database delays writes rather than stalling the socket.
+        '''
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.heartbeat.count(dropped=1)
+            self.log.warn(f'Ticker queue full, dropped the oldest ticker ({self.dropped} dropped so far)')
+        self.queue.put_nowait(ticker)
+
+    async def persist_loop(self):
+        '''
+        Collect tickers from the queue into a batch, filtering each symbol by self.interval as they arrive.
+        The batch is written once it holds self.batch_size tickers, or once its oldest ticker has waited self.batch_latency seconds
+        '''
+        batch: List[Ticker] = []
+        deadline = None
+        # After a failed write, the batch is held until this time before it is written again
+        retry_at = 0
+        self.log.debug(f'Running persist loop (batch size: {self.batch_size}, max latency: {self.batch_latency}s)...')
+        while True:
+            timeout = max(max(deadline, retry_at) - now(), 0) if batch else None
+            try:
+                # Ended by STOP rather than cancelled, wait_for can swallow a cancel that lands just as a ticker arrives
+                ticker = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                ticker = None
+            if ticker is self.STOP:
+                # Don't drop whatever was collected before stopping
+                await self.write_batch(batch)
+                return
+            if ticker and self.__accept(ticker):
+                if not batch:
+                    deadline = now() + self.batch_latency
+                batch.append(ticker)
+            if batch and (len(batch) >= self.batch_size or now() >= deadline) and now() >= retry_at:
+                if await self.write_batch(batch):
+                    batch = []
+                    retry_at = 0
+                else:
+                    # Kept & written again later, with any tickers that arrive meanwhile
+                    retry_at = now() + self.batch_latency
+                    self.__trim(batch)
+
+    async def write_batch(self, batch: List[Ticker]) -> bool:
+        '''
+        Write a batch of tickers & their candles in one transaction. A failure is logged & alerted rather than raised,
+        so the persist task outlives a database outage
+
+        :return: False if the batch was not written
+        '''
+        if not batch:
+            return True
+        try:
+            # Only reaches the database near the end of the known partitions
+            if batch[-1].timestamp >= self.partitions.covered_until:
+                await self.loop.run_in_executor(None, self.partitions.ensure, batch[-1].timestamp)
+            # The tickers & their candles commit together
+            async with self.async_postgres.transaction():
+                await self.async_postgres.insert_tickers_bulk(batch)
+                await self.async_postgres.update_candles(batch)
+        except Exception as err:
+            self.write_failures += 1
+            message = f'[write_batch] Failed to write {len(batch)} tickers ({self.write_failures} failures in a row), keeping them for the next write: {err}'
+            if self.write_failures == 1:
+                self.alert_with_error(f'{message}\n{traceback.format_exc()}')
+            else:
+                self.log.error(message)
+            return False
+        if self.write_failures:
+            self.log.info(f'[write_batch] Writing again after {self.write_failures} failures')
+            self.write_failures = 0
+        self.heartbeat.progress(len(batch), tickers=len(batch))
+        return True
+
+    async def watchdog_loop(self):
+        '''
+        Close the socket when no new ticker has arrived for timeout_threshold seconds. The receive loop then reconnects.
+        '''
+        self.last_time = now()
+        self.log.debug('Running watchdog loop...')
+        while True:
+            await asyncio.sleep(ScraperConfig.WATCHDOG_INTERVAL)
+            if now() - self.last_time > self.timeout_threshold:
+                self.log.debug(f'No new data received for {self.timeout_threshold} seconds. Restarting socket...')
+                self.last_time = now()
+                await self.websocket.close()
+
+    async def __subscribe(self):
+        self.connection_attempts += 1
+        self.log.debug(f'Subscribing to socket, attempt {self.connection_attempts}...')
+        if not await self.websocket.subscribe():
+            raise ConnectionException('Failed to subscribe to socket')
+
+    def __accept(self, ticker: Ticker) -> bool:
+        latest = self.latest.get(ticker.symbol)
+        if latest and (ticker.timestamp - latest) < self.interval:
+            return False
+        self.latest[ticker.symbol] = ticker.timestamp
+        return True
+
+    def __trim(self, batch: List[Ticker]):
+        # A batch held through a long outage keeps at most queue_size tickers, dropping the oldest like the queue does
+        excess = len(batch) - self.queue_size
+        if excess > 0:
+            del batch[:excess]
+            self.dropped += excess
+            self.heartbeat.count(dropped=excess)
+            self.log.warn(f'Unwritten batch full, dropped the oldest {excess} tickers ({self.dropped} dropped so far)')
+
+    def __cancel_tasks(self):
+        if self.cancelled or not self.tasks:
+            return
+        self.cancelled = True
+        receive, persist, watchdog = self.tasks
+        receive.cancel()
+        watchdog.cancel()
+        if persist.done():
+            return
+        self.put_ticker(self.STOP)
@@ -1,5 +1,6 @@
 import asyncio
 import json
+from io import StringIO
 from os import remove
 from threading import Thread
 from typing import Tuple
@@ -9,10 +10,12 @@ from time import time as now
 from utils import DiscordWebhook, Logger, Postgres
 from utils.config import ScraperConfig, PredictionConfig
 from utils.environment import env
+from utils.heartbeat import Heartbeat
 
 from olympus.helper_objects import PredictionVector
 from olympus.helper_objects.prediction_queue import \
     PredictionQueueDB as PredictionQueue
+from olympus.helper_objects.ticker_batch import TickerBatch
 from olympus.primordial_chaos import PrimordialChaos
 from olympus.prometheus import Predict
 
@@ -73,6 +76,8 @@ class Delphi(PrimordialChaos):
         self.prediction_cycle_seconds = self.interval_size * self.iterations
 
         self.prediction_queue: PredictionQueue = override_prediction_queue if override_prediction_queue else PredictionQueue(override_postgres=self.postgres)
+        # Only published in SQL mode
+        self.heartbeat = Heartbeat('Delphi', self.postgres)
         self.abort = False
         self.is_active = False
         self.latest_timestamp = None
@@ -84,7 +89,7 @@ class Delphi(PrimordialChaos):
             rows = file.readlines()
             file.close()
 
-        tmp_rows = [ScraperConfig.DEFAULT_CSV_HEADERS]
+        tmp_rows = [ScraperConfig.DEFAULT_ASK_CSV_HEADERS]
         for index in range(-100, 0):
             # Remove newlines
             row = rows[index].strip() if index == -1 else rows[index]
@@ -99,17 +104,13 @@ class Delphi(PrimordialChaos):
         return latest_price, latest_timestamp
     
     def __fetch_new_data_from_psql(self) -> Tuple[float, int]:
-        rows = self.postgres.get_latest_tickers(row_count=self.seq_len)
-        tmp_rows = [ScraperConfig.DEFAULT_CSV_HEADERS]
-        
-        for index, ticker in enumerate(rows):
-            # Ditch newline if it's the last row
-            row = ticker.csv_line.strip() if index == len(rows) - 1 else ticker.csv_line
-            tmp_rows.append(row)
-        
-        self.__create_tmp_csv_with_lines(tmp_rows)
-        latest_ticker = rows[-1]
-        return latest_ticker.ask, latest_ticker.timestamp
+        # The prediction engine only reads price & timestamp, so that's all the tmp CSV gets
+        tickers = TickerBatch.from_array(self.postgres.get_latest_tickers_array(row_count=self.seq_len, columns=['ask']))
+        lines = StringIO()
+        tickers.to_csv(lines, columns=['ask', 'timestamp'])
+        # Ditch newline on the last row
+        self.__create_tmp_csv_with_lines([ScraperConfig.PRICE_CSV_HEADERS, lines.getvalue().rstrip('\n')])
+        return float(tickers['ask'][-1]), int(tickers['timestamp'][-1])
 
     def __latest_data_handler(self) -> Tuple[float, int]:
         if self.sql_mode:
@@ -132,7 +133,10 @@ class Delphi(PrimordialChaos):
     def __add_prediction_to_tmp_csv(self, prediction: float, timestamp: int):
         with open(self.tmp_csv_path, 'a') as file:
             # Training model only cares about first column
-            file.write(f'\n{prediction},10.0,10.0,10.0,10.0,10.0,10.0,10.0,{timestamp}')
+            if self.sql_mode:
+                file.write(f'\n{prediction},{timestamp}')
+            else:
+                file.write(f'\n{prediction},10.0,10.0,10.0,10.0,10.0,10.0,10.0,{timestamp}')
             self.log.debug('Added prediction to csv')
 
     def __weigh_price_delta_against_threshold(self, prediction, current):
@@ -212,6 +216,7 @@ class Delphi(PrimordialChaos):
                 )
             )
             self.log.debug('Submitted prediction to queue')
+            self.heartbeat.progress(1, predictions=1)
             
             # Delete self.temp_csv_path
             remove(self.tmp_csv_path)
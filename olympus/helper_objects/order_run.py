@@ -0,0 +1,51 @@
+from typing import List
+
+from utils.config import TradingConfig
+
+
+class OrderRun:
+
+    '''
+    The current run of consecutive same-side orders. Hermes reads it & writes it back as each order is recorded (see Postgres.get_order_run).
+    Holds just enough to size the next order: the side, the length, and the quantities of the first few orders in the run.
+    '''
+
+    def __init__(self, side: str = None, count: int = 0, quantities: List[float] = None, sum_limit: int = None) -> None:
+        '''
+        :param quantities: Absolute quantities of the oldest orders in the run, oldest first
+        :param sum_limit: How many orders (after the first) are summed when the run is reversed
+        '''
+        self.side: str = side
+        self.count: int = count
+        self.sum_limit: int = sum_limit if sum_limit is not None else TradingConfig.ORDER_RUN_SUM_LIMIT
+        # Orders past the summed window never affect the reversal quantity, so they aren't kept
+        self.quantities: List[float] = list(quantities[:self.sum_limit + 1]) if quantities else []
+
+    def add(self, side: str, quantity: float) -> None:
+        '''
+        Record an order, extending the run or starting a new one
+        '''
+        if side != self.side:
+            self.side = side
+            self.count = 0
+            self.quantities = []
+        self.count += 1
+        if len(self.quantities) <= self.sum_limit:
+            self.quantities.append(abs(quantity))
+
+    def reverses(self, side: str) -> bool:
+        '''
+        True when an order on this side would end a run worth summing
+        '''
+        return self.side is not None and side != self.side and self.count > 1
+
+    @property
+    def reversal_quantity(self) -> float:
+        '''
+        Quantity added to an order that reverses the run.
+        Skips the first order of the run, which was itself the summed order that started it.
+        '''
+        return sum(self.quantities[1:self.sum_limit + 1])
+
+    def __repr__(self) -> str:
+        return f'OrderRun({self.side} x{self.count}, reversal quantity {self.reversal_quantity})'
@@ -1,7 +1,11 @@
+from time import time as now
+from typing import List
+
 from olympus.helper_objects.prediction_vector import PredictionVector
 from utils import Logger, Postgres
-from utils.config import PostgresConfig
+from utils.config import PostgresConfig, PredictionConfig
 from utils.postgres import PostgresPredictionVector
+from utils.postgres_listener import PostgresListener
 
 
 class PredictionQueueDB:
@@ -17,28 +21,63 @@ class PredictionQueueDB:
         '''
         self.log = Logger.setup(self.__class__.__name__)
         self.postgres = override_postgres if override_postgres is not None else Postgres()
+        # Only opened once something blocks on get(), producers never need it
+        self.listener = PostgresListener(self.postgres.pool.dsn, self.postgres.prediction_channel)
+        self.poll_interval = PredictionConfig.PREDICTION_QUEUE_POLL_INTERVAL
+        self.visibility_timeout = PredictionConfig.PREDICTION_QUEUE_VISIBILITY_TIMEOUT
+        self.max_claims = PredictionConfig.PREDICTION_QUEUE_MAX_CLAIMS
+        self.last_requeue_check = 0
 
     def put(self, prediction_vector: PredictionVector):
         if type(prediction_vector) is not PredictionVector:
             self.log.error('Tried to submit non-PredictionVector to queue')
             raise Exception("What's up guy? Bad type submitted to prediction queue!")
         self.postgres.insert_prediction_vector(prediction_vector)
+        self.postgres.notify(self.postgres.prediction_channel, prediction_vector.uuid)
 
-    def get(self) -> PostgresPredictionVector:
+    def get(self, timeout: float = None) -> PostgresPredictionVector:
         """
         Pop the first prediction in the queue that is not being processed
-        :return: A prediction object.
+        :param timeout: Seconds to block for a prediction to be queued. Wakes on the NOTIFY sent by put(),
+        and checks the table every `poll_interval` seconds regardless. Without a timeout, returns immediately.
+        :return: A prediction object, or None if the queue stayed empty.
         """
-        self.log.debug('Getting prediction from DB')
-        results = self.postgres.get_queued_predictions()
-        if len(results) > 0:
-            first_prediction = results[0]
-            if first_prediction:
-                self.log.debug('Got prediction from DB, setting to "processing"')
-                self.postgres.update_prediction_status(first_prediction.uuid, PostgresConfig.STATUS_PROCESSING)
-                return first_prediction
-        self.log.debug('No predictions in DB, returning None')
-        return None
+        if timeout is None:
+            return self.__pop()
+        deadline = now() + timeout
+        # Subscribe (and drain stale notifications) before checking, so a put() between the check & the wait still wakes us
+        self.listener.wait(0)
+        while True:
+            prediction = self.__pop()
+            remaining = deadline - now()
+            if prediction or remaining <= 0:
+                return prediction
+            self.listener.wait(min(remaining, self.poll_interval))
+
+    def stop_listening(self):
+        '''
+        Close the LISTEN connection used by blocking get() calls
+        '''
+        self.listener.close()
+
+    def requeue_expired(self) -> int:
+        '''
+        Return predictions stuck in processing for longer than the visibility timeout to the queue
+        :return: The number of predictions requeued or failed
+        '''
+        self.last_requeue_check = now()
+        expired = self.postgres.requeue_expired_predictions(self.visibility_timeout, self.max_claims)
+        for uuid, status in expired:
+            self.log.warning(f'Prediction {uuid} was processing for over {self.visibility_timeout} seconds, set to {status}')
+        return len(expired)
+
+    def __pop(self) -> PostgresPredictionVector:
+        if now() - self.last_requeue_check >= self.poll_interval:
+            self.requeue_expired()
+        prediction = self.postgres.claim_queued_prediction()
+        if prediction:
+            self.log.debug('Claimed prediction from DB')
+        return prediction
     
     def close(self, prediction_vector: PredictionVector, failed: bool = False):
         '''
@@ -54,9 +93,24 @@ class PredictionQueueDB:
             self.postgres.update_prediction_status(prediction_vector.uuid, PostgresConfig.STATUS_COMPLETE)
         
     
+    def depth(self) -> int:
+        '''
+        Number of queued predictions, counted in the database rather than loaded
+        '''
+        return self.postgres.get_prediction_queue_stats().depth
+
+    def oldest_age(self) -> float:
+        '''
+        Seconds the oldest queued prediction has been waiting, or None if the queue is empty
+        '''
+        return self.postgres.get_prediction_queue_stats().oldest_age
+
+    def peek(self, count: int = 1) -> List[PostgresPredictionVector]:
+        '''
+        The next predictions to be handed out, oldest first, without claiming them
+        '''
+        return self.postgres.peek_queued_predictions(count)
+
     @property
     def size(self) -> int:
-        result = self.postgres.get_queued_predictions()
-        if type(result) is list:
-            return len(result)
-        return 0
+        return self.depth()
@@ -0,0 +1,181 @@
+from typing import Dict, Iterable, List, TextIO, Union
+
+import numpy as np
+
+from crosstower.socket_api.utils import handle_response
+from utils.config import PostgresConfig
+
+PRICE_COLUMNS = PostgresConfig.TICKER_ARRAY_COLUMNS
+
+# Websocket ticker keys, in the order of PRICE_COLUMNS
+WS_PRICE_KEYS = ('a', 'b', 'c', 'l', 'h', 'o', 'v', 'q')
+
+
+class TickerBatch:
+
+    '''
+    A window of tickers held as one contiguous array per column: int64 `timestamp` (epoch seconds),
+    a float64 array per price column (PostgresConfig.TICKER_ARRAY_COLUMNS, missing prices are NaN), and `symbol`.
+    Read a column with `batch['ask']`. Slicing shares the parent's arrays, appending to a slice copies them first.
+
+    Build one from Postgres rows, websocket frames, a `get_latest_tickers_array` result, or by appending tickers one at a time.
+    '''
+
+    def __init__(self, capacity: int = 0) -> None:
+        self.__size = 0
+        self.__columns: Dict[str, np.ndarray] = self.__allocate(capacity)
+
+    @classmethod
+    def from_columns(cls, timestamp: Iterable[int], symbol: Iterable[str] = None, **prices: Iterable[float]) -> 'TickerBatch':
+        '''
+        A batch from whole columns. Price columns left out are NaN, and `symbol` defaults to None
+        '''
+        timestamp = np.asarray(timestamp, dtype=np.int64)
+        batch = cls(len(timestamp))
+        batch.__size = len(timestamp)
+        batch.__columns['timestamp'][:] = timestamp
+        for column in PRICE_COLUMNS:
+            batch.__columns[column][:] = prices.pop(column) if column in prices else np.nan
+        if prices:
+            raise Exception(f"Unknown ticker columns: {', '.join(prices)}")
+        if symbol is not None:
+            batch.__columns['symbol'][:] = symbol
+        return batch
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> 'TickerBatch':
+        '''
+        A batch from a NumPy structured array with a `timestamp` field, ex. a `Postgres.get_latest_tickers_array` result
+        '''
+        return cls.from_columns(**{name: array[name] for name in array.dtype.names})
+
+    @classmethod
+    def from_db_rows(cls, rows: List[tuple], symbol: str = None) -> 'TickerBatch':
+        '''
+        A batch from ticker rows as selected by `PostgresStatements.select_latest_tickers`: epoch timestamp, then every price column
+        '''
+        array = np.array(rows, dtype=np.float64).reshape(len(rows), len(PRICE_COLUMNS) + 1)
+        return cls.from_columns(array[:, 0], [symbol] * len(rows), **{column: array[:, i + 1] for i, column in enumerate(PRICE_COLUMNS)})
+
+    @classmethod
+    def from_ws_frames(cls, frames: Iterable[str], symbols: List[str]) -> 'TickerBatch':
+        '''
+        A batch of every subscribed symbol's ticker in a run of `ticker/1s/batch` frames, oldest frame first.
+        Each frame is parsed once, and its values go straight into the columns without a Ticker per symbol.
+        '''
+        timestamps, batch_symbols = [], []
+        prices: List[list] = [[] for _ in WS_PRICE_KEYS]
+        for frame in frames:
+            data: dict = handle_response(frame).get('data') or {}
+            for symbol in symbols:
+                ticker = data.get(symbol)
+                if not ticker:
+                    continue
+                timestamps.append(int(ticker['t']))
+                batch_symbols.append(symbol)
+                for values, key in zip(prices, WS_PRICE_KEYS):
+                    values.append(ticker.get(key))
+        timestamp = np.array(timestamps, dtype=np.int64)
+        # API wants to send milliseconds sometimes
+        timestamp = np.where(timestamp > 2147483647, timestamp // 1000, timestamp)
+        # Prices arrive as strings, NumPy parses them (and None as NaN) in one pass per column
+        return cls.from_columns(
+            timestamp, batch_symbols, **{column: np.array(values, dtype=np.float64) for column, values in zip(PRICE_COLUMNS, prices)}
+        )
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def __getitem__(self, key: Union[str, slice, np.ndarray]) -> Union[np.ndarray, 'TickerBatch']:
+        '''
+        batch['ask'] : One column, as a read-only view
+        batch[10:20] : The tickers in a range, sharing this batch's arrays
+        batch[mask]  : The tickers picked by a boolean or index array, copied
+        '''
+        if isinstance(key, str):
+            column = self.__columns[key][:self.__size]
+            column.flags.writeable = False
+            return column
+        batch = TickerBatch()
+        batch.__columns = {name: column[:self.__size][key] for name, column in self.__columns.items()}
+        batch.__size = len(batch.__columns['timestamp'])
+        return batch
+
+    @property
+    def timestamp(self) -> np.ndarray:
+        return self['timestamp']
+
+    @property
+    def symbol(self) -> np.ndarray:
+        return self['symbol']
+
+    def append(self, ticker) -> None:
+        '''
+        Add a Ticker or PostgresTicker to the end. Capacity doubles when full, so appending is amortized O(1)
+        '''
+        if self.__size == len(self.__columns['timestamp']):
+            self.__grow(self.__size + 1)
+        index = self.__size
+        columns = self.__columns
+        columns['timestamp'][index] = ticker.timestamp
+        for column in PRICE_COLUMNS:
+            value = getattr(ticker, column)
+            columns[column][index] = value if value is not None else np.nan
+        columns['symbol'][index] = getattr(ticker, 'symbol', None)
+        self.__size += 1
+
+    def extend(self, tickers: Union[Iterable, 'TickerBatch']) -> None:
+        '''
+        Add tickers to the end, another TickerBatch is copied column by column
+        '''
+        if not isinstance(tickers, TickerBatch):
+            for ticker in tickers:
+                self.append(ticker)
+            return
+        size = self.__size + len(tickers)
+        if size > len(self.__columns['timestamp']):
+            self.__grow(size)
+        for name, column in self.__columns.items():
+            column[self.__size:size] = tickers[name]
+        self.__size = size
+
+    def to_array(self, columns: Iterable[str] = PRICE_COLUMNS) -> np.ndarray:
+        '''
+        The batch as a NumPy structured array, in the same format as `Postgres.get_latest_tickers_array`
+        '''
+        columns = list(columns)
+        array = np.empty(self.__size, dtype=np.dtype([('timestamp', np.int64)] + [(column, np.float64) for column in columns]))
+        array['timestamp'] = self['timestamp']
+        for column in columns:
+            array[column] = self[column]
+        return array
+
+    def to_csv(self, file: TextIO, columns: Iterable[str] = (*PRICE_COLUMNS, 'timestamp'), header: str = None) -> int:
+        '''
+        Write the batch as CSV rows, by default in the same format as `Ticker.csv_line`. Each column is formatted in one pass.
+
+        :param header: Written first, if given, ex. ScraperConfig.PRICE_CSV_HEADERS
+        :return: Number of rows written
+        '''
+        if header:
+            file.write(header)
+        if not self.__size:
+            return 0
+        formatted = [self[column].astype(str) for column in columns]
+        file.write('\n'.join(map(','.join, zip(*formatted))))
+        file.write('\n')
+        return self.__size
+
+    def __grow(self, size: int):
+        columns = self.__allocate(max(size, 2 * len(self.__columns['timestamp'])))
+        for name, column in columns.items():
+            column[:self.__size] = self.__columns[name][:self.__size]
+        self.__columns = columns
+
+    @staticmethod
+    def __allocate(capacity: int) -> Dict[str, np.ndarray]:
+        columns = {'timestamp': np.zeros(capacity, dtype=np.int64)}
+        for column in PRICE_COLUMNS:
+            columns[column] = np.full(capacity, np.nan)
+        columns['symbol'] = np.full(capacity, None, dtype=object)
+        return columns
@@ -5,10 +5,11 @@ from time import sleep
 
 
 from utils.config import PostgresConfig
-from utils.config import TradingConfig
+from utils.config import PredictionConfig, TradingConfig
 from crosstower.models import Balance, Order
 from crosstower.socket_api.private import OrderListener, Trading
 from utils import DiscordWebhook, Logger, Postgres, GoogleSheets
+from utils.heartbeat import Heartbeat
 
 from olympus.helper_objects import PredictionVector
 from olympus.helper_objects.prediction_queue import \
@@ -29,6 +30,7 @@ class Hermes(PrimordialChaos):
         self.postgres = Postgres()
         self.abort = False
         self.submitted_order_count = 0 # Used for tracking activity status
+        self.heartbeat = Heartbeat(self.__class__.__name__, self.postgres)
         
         self.order_listener: OrderListener = override_orderListener if override_orderListener is not None else OrderListener()
         self.trading_account: Trading = override_tradingAccount if override_tradingAccount else Trading()
@@ -41,6 +43,7 @@ class Hermes(PrimordialChaos):
 
     def run(self):
         self.log.debug('Starting all threads')
+        self.heartbeat.start()
         self.order_listener.start()
         self.__main_loop()
 
@@ -122,7 +125,7 @@ class Hermes(PrimordialChaos):
             return None
         return Order.create(trade_quantity, side, TradingConfig.TRADING_SYMBOL, uuid=prediction.uuid)
 
-    def __submit_order(self, order: Order, current_btc_price: float, crypto_balance: float, fiat_balance: float) -> None:
+    def __record_order(self, order: Order, current_btc_price: float, crypto_balance: float, fiat_balance: float) -> None:
         """
         Submit order to the database.
         If the last order was in the opposite direction, sum the past orders 
@@ -130,24 +133,21 @@ class Hermes(PrimordialChaos):
         :param order: The order to submit
         :type order: Order
         """
+        # Locked until the caller's transaction commits, so other Hermes workers size their orders from the run this one leaves
+        order_run = self.postgres.get_order_run(lock=True)
+        if order_run.reverses(order.side):
+            self.log.debug(f'Opposite direction as last order, adding quantity of past orders ({order_run})')
+            order.quantity += order_run.reversal_quantity
+        self.postgres.insert_order(order, current_btc_price, crypto_balance, fiat_balance)
+        order_run.add(order.side, order.quantity)
+        self.postgres.update_order_run(order_run)
+
+    def __submit_order(self, order: Order) -> None:
+        """
+        Submit a recorded order to the exchange. Its status is updated by the order listener as it is filled.
+        """
         submitted = self.__order_status_processing
         completed = self.__order_status_complete
-        new_order_side = order.side
-        try:
-            order_stack = self.postgres.get_latest_stack_of_same_orders()
-        except IndexError:
-            order_stack = []
-        last_order_side = order_stack[0].side if len(order_stack) > 0 else None
-        if last_order_side != new_order_side and len(order_stack) > 1:
-            self.log.debug('Opposite direction as last order, summing & inversing past orders')
-            past_quantity = 0
-            # Skip the first order, which was the last summed order
-            # Inverse the rest of the orders
-            orders_to_sum = order_stack[1:11]
-            for past_order in orders_to_sum:
-                past_quantity += abs(past_order.quantity)
-            order.quantity += past_quantity
-        self.postgres.insert_order(order, current_btc_price, crypto_balance, fiat_balance)
         self.order_listener.submit_order(order, submitted, completed)
         self.log.debug(f'Executed order: {order.side} {order.symbol} {order.quantity}')
         self.submitted_order_count += 1
@@ -166,27 +166,41 @@ class Hermes(PrimordialChaos):
         self.log.debug('Starting main loop')
         try:
             while not self.abort:
-                if self.prediction_queue.size > 0:
-                    prediction = self.prediction_queue.get()
+                # Blocks until Delphi queues a prediction, waking periodically to check for abort
+                prediction = self.prediction_queue.get(timeout=PredictionConfig.PREDICTION_QUEUE_POLL_INTERVAL)
+                # PostgresMonitor watches these ticks, so they stop if this loop hangs or the order listener has died
+                if self.order_listener.is_alive():
+                    self.heartbeat.tick()
+                if prediction and self.postgres.has_order(prediction.uuid):
+                    # Requeued after its worker stalled, but the order already went through
+                    self.log.warning(f'Order for prediction {prediction.uuid} already exists, not submitting it again')
+                    self.prediction_queue.close(prediction)
+                elif prediction:
                     self.log.debug('Got prediction from queue')
                     balances = self.trading_account.get_trading_balance([TradingConfig.CRYPTO_SYMBOL, TradingConfig.FIAT_SYMBOL])
                     crypto_balance, fiat_balance = self.__parse_balances(balances)
                     current_btc_price = self.postgres.get_latest_tickers(1)[0].ask
                     self.log.debug('Got balances and current price')
                     order = self.__create_order(prediction, current_btc_price, crypto_balance, fiat_balance)
+                    # Record the order & close its prediction in one commit. The exchange comes after, since the
+                    # listener's status updates (from another thread) need the committed order row.
+                    with self.postgres.transaction():
+                        if order:
+                            self.__record_order(order, current_btc_price, crypto_balance, fiat_balance)
+                        self.prediction_queue.close(prediction, failed=(order is None))
                     if order:
-                        self.__submit_order(order, current_btc_price, crypto_balance, fiat_balance)
-                    self.prediction_queue.close(prediction, failed=(order is None))
+                        self.__submit_order(order)
+                    self.heartbeat.progress(1, predictions=1, orders=1 if order else 0)
                     sleep(1)
                     # try:
                     #     self.gsheets.update_order_feed()
                     # except:
                     #     self.log.error("Could not rotate order feed. Prob expired token?")
-                sleep(0.2)
         except KeyboardInterrupt:
             self.log.debug('Keyboard interrupt received, aborting')
             self.abort = True
         except Exception:
             self.alert_with_error(f'Error in main loop: \n{traceback.format_exc()}')
             self.stop()
+        self.prediction_queue.stop_listening()
         self.log.debug('Exiting loop')
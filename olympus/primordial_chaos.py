@@ -11,9 +11,13 @@ class PrimordialChaos:
         self.discord: DiscordWebhook = None
         self.abort: bool = False
         self.all_threads: List[Thread] = []
+        # utils.heartbeat.Heartbeat, set by subclasses. Published while the service runs
+        self.heartbeat = None
 
     def run(self):
         self.log.debug('Starting...')
+        if self.heartbeat:
+            self.heartbeat.start()
         for thread in self.all_threads:
             thread.start()
     
@@ -37,6 +41,8 @@ class PrimordialChaos:
         self.__check_log_status()
         self.log.debug('Aborting...')            
         self.abort = True
+        if self.heartbeat:
+            self.heartbeat.stop()
 
     def alert_with_error(self, error_message: str):
         self.__check_log_status()
@@ -1,4 +1,9 @@
-CREATE TABLE ticker_feed (
+-- The original tables only, as first created. This is NOT the current schema.
+-- Every change since (indexes, partitioning, native column types, symbols, candles, heartbeats) is a numbered file in
+-- migrations/, applied on top of this by `python -m utils.migrations`. The current schema is this file then each migration in order.
+-- Run by the Postgres container on a new database, and by the migration runner before the first migration.
+
+CREATE TABLE IF NOT EXISTS ticker_feed (
   timestamp TIMESTAMP DEFAULT NOW(),
   ask NUMERIC,
   bid NUMERIC,
@@ -10,7 +15,7 @@ CREATE TABLE ticker_feed (
   volume_quote NUMERIC
 );
 
-CREATE TABLE order_feed (
+CREATE TABLE IF NOT EXISTS order_feed (
   timestamp TIMESTAMP DEFAULT NOW(),
   quantity NUMERIC,
   side VARCHAR(10),
@@ -21,7 +26,7 @@ CREATE TABLE order_feed (
   current_price NUMERIC
 );
 
-CREATE TABLE prediction_feed (
+CREATE TABLE IF NOT EXISTS prediction_feed (
   timestamp TIMESTAMP DEFAULT NOW(),
   prediction_timestamp NUMERIC,
   prediction_weight NUMERIC,
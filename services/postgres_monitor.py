@@ -1,12 +1,11 @@
 import subprocess
 from time import sleep
 from time import time as now
-from typing import List
+from typing import Callable, Dict, List
 
-from crosstower.models import Order
-from olympus.helper_objects.prediction_vector import PredictionVector
 from utils import DiscordWebhook, Logger, Postgres, config
 from utils.config import PostgresConfig, ScraperConfig, PredictionConfig
+from utils.heartbeat import Heartbeat, HeartbeatState
 
 
 class PostgresSubservice:
@@ -23,7 +22,7 @@ class PostgresSubservice:
 class PostgresMonitor:
 
     '''
-    Ensures the ticker database is being continuously updated.
+    Ensures the ticker database is being continuously updated, and the other services are alive, from their heartbeats.
     '''
 
     def __init__(self) -> None:
@@ -33,6 +32,10 @@ class PostgresMonitor:
         self.ticker_scraper_subservice = PostgresSubservice('TickerScraper')
         self.order_listener_subservice = PostgresSubservice('OrderListener')
         self.prediction_engine_subservice = PostgresSubservice('PredictionEngine')
+        # One per worker process of each service, by name, created as workers first appear
+        self.worker_subservices: Dict[str, PostgresSubservice] = {}
+        # Last time each service had any worker publishing, by subservice name
+        self.last_seen: Dict[str, float] = {}
         self.abort = False
 
     # Public methods
@@ -42,18 +45,7 @@ class PostgresMonitor:
         self.discord.send_status(f"PostgresMonitor has started a new run (Git hash: `{hash}`)")
         self.log.debug("PostgresMonitor has started a new run.")
         right_now = now()
-
-        self.last_good_ticker_count: int = self.postgres.get_ticker_count()
-        self.last_good_ticker_time: int = right_now
-        
-        queued_orders = self.postgres.get_queued_orders()
-        self.last_good_queued_order: Order = queued_orders[-1] if queued_orders else None
-        self.last_good_queued_order_time: int = right_now
-
-        queued_predictions = self.postgres.get_queued_predictions()
-        self.last_good_queued_prediction: PredictionVector = queued_predictions[-1] if queued_predictions else None
-        self.last_good_queued_prediction_time: int = right_now
-
+        self.prediction_backlog_alerted = False
         self.start_time = right_now
         self.latest_update = right_now
 
@@ -62,10 +54,13 @@ class PostgresMonitor:
 
         while not self.abort:
             try:
-                self.__ticker_check()
-                self.__order_check()
-                self.__prediction_check()
-                self.__status_update()
+                # Every worker's liveness comes from one small read of the heartbeat table
+                Heartbeat.expire(self.postgres)
+                heartbeats = Heartbeat.read_all(self.postgres)
+                self.__ticker_check(heartbeats.get('Athena', []))
+                self.__order_check(heartbeats.get('Hermes', []))
+                self.__prediction_check(heartbeats.get('Delphi', []))
+                self.__status_update(heartbeats)
                 sleep(ScraperConfig.TICKER_INTERVAL/2)
             except KeyboardInterrupt:
                 self.log.debug('KeyboardInterrupt')
@@ -80,83 +75,94 @@ class PostgresMonitor:
 
     # Monitoring methods
 
-    def __ticker_check(self):
-        latest_count = self.postgres.get_ticker_count()
-        latest_time: int = now()
-
-        if latest_count == self.last_good_ticker_count:
-            self.ticker_scraper_subservice = self.__handle_timeout_and_update_subservice(
-                subservice=self.ticker_scraper_subservice, 
-                time_since_last_update=int(latest_time - self.last_good_ticker_time),
-                unresponsive_threshold=int(ScraperConfig.TICKER_INTERVAL*2),
-                abandon_threshold=int(PostgresConfig.UNRESPONSIVE_TIMEOUT_THRESHOLD)
-            )
-        else:
-            self.last_good_ticker_count = latest_count
-            self.last_good_ticker_time = latest_time
-            self.ticker_scraper_subservice = self.__handle_service_revival_if_inactive(self.ticker_scraper_subservice)
-            
-    def __order_check(self):
-        queued_orders = self.postgres.get_queued_orders()
-        if not queued_orders:
-            self.log.debug("No queued orders, continuing..")
-            return
-        
-        latest_queued_order = queued_orders[-1]
-        latest_time = now()
-        if latest_queued_order.uuid == self.last_good_queued_order.uuid:
-            self.order_listener_subservice = self.__handle_timeout_and_update_subservice(
-                subservice=self.order_listener_subservice, 
-                time_since_last_update=int(latest_time - self.last_good_queued_order_time),
-                unresponsive_threshold=int(ScraperConfig.TICKER_INTERVAL*2),
-                abandon_threshold=int(PostgresConfig.UNRESPONSIVE_TIMEOUT_THRESHOLD)
-            )
-        else:
-            self.last_good_queued_order = latest_queued_order
-            self.last_good_queued_order_time = latest_time
-            self.order_listener_subservice = self.__handle_service_revival_if_inactive(self.order_listener_subservice)
-
-    def __prediction_check(self):
-        try:
-            queued_predictions = self.postgres.get_queued_predictions()
-        except IndexError:
-            self.log.debug("No queued predictions, continuing..")
-            return
-        if not queued_predictions:
-            self.log.debug("No queued predictions, continuing..")
-            return
-        
-        latest_queued_prediction = queued_predictions[-1]
-        latest_time = now()
+    def __ticker_check(self, heartbeats: List[HeartbeatState]):
+        # Athena reports progress for every batch of tickers written
+        self.__worker_checks(
+            subservice=self.ticker_scraper_subservice,
+            heartbeats=heartbeats,
+            age=lambda heartbeat: heartbeat.progress_age,
+            unresponsive_threshold=int(ScraperConfig.TICKER_INTERVAL*2),
+            abandon_threshold=int(PostgresConfig.UNRESPONSIVE_TIMEOUT_THRESHOLD)
+        )
+
+    def __order_check(self, heartbeats: List[HeartbeatState]):
+        # Hermes only makes progress when a prediction arrives, but its main loop ticks on every queue poll while it & its order listener are alive
+        self.__worker_checks(
+            subservice=self.order_listener_subservice,
+            heartbeats=heartbeats,
+            age=lambda heartbeat: heartbeat.tick_age,
+            unresponsive_threshold=int(ScraperConfig.TICKER_INTERVAL*2),
+            abandon_threshold=int(PostgresConfig.UNRESPONSIVE_TIMEOUT_THRESHOLD)
+        )
+
+    def __prediction_check(self, heartbeats: List[HeartbeatState]):
+        queue = self.postgres.get_prediction_queue_stats()
+        self.__prediction_backlog_check(queue.depth, queue.oldest_age)
         prediction_gap = ScraperConfig.TICKER_INTERVAL*PredictionConfig.PREDICTION_ITERATION_COUNT
-
-        if latest_queued_prediction.uuid == self.last_good_queued_prediction.uuid:
-            self.prediction_engine_subservice = self.__handle_timeout_and_update_subservice(
-                subservice=self.prediction_engine_subservice, 
-                time_since_last_update=int(latest_time - self.last_good_queued_prediction_time),
-                unresponsive_threshold=int(prediction_gap*2),
-                abandon_threshold=int(prediction_gap*4)
-            )
-        else:
-            self.last_good_queued_prediction = latest_queued_prediction
-            self.last_good_queued_prediction_time = latest_time
-            self.prediction_engine_subservice = self.__handle_service_revival_if_inactive(self.prediction_engine_subservice)
+        # Delphi reports progress for every prediction it queues
+        self.__worker_checks(
+            subservice=self.prediction_engine_subservice,
+            heartbeats=heartbeats,
+            age=lambda heartbeat: heartbeat.progress_age,
+            unresponsive_threshold=int(prediction_gap*2),
+            abandon_threshold=int(prediction_gap*4)
+        )
+
+    def __prediction_backlog_check(self, depth: int, oldest_age: float):
+        if depth > PredictionConfig.PREDICTION_QUEUE_MAX_SIZE and not self.prediction_backlog_alerted:
+            msg = f"Prediction queue is backed up: {depth} queued, oldest waiting {int(oldest_age)} seconds"
+            self.discord.send_alert(msg)
+            self.log.error(msg)
+            self.prediction_backlog_alerted = True
+        elif depth <= PredictionConfig.PREDICTION_QUEUE_MAX_SIZE and self.prediction_backlog_alerted:
+            self.log.info(f"Prediction queue is back down to {depth}")
+            self.prediction_backlog_alerted = False
 
     # Helper methods
 
-    def __status_update(self):
+    def __status_update(self, heartbeats: Dict[str, List[HeartbeatState]]):
         if now() - self.latest_update > config.General.STATUS_UPDATE_INTERVAL:
             try:
-                self.discord.send_status(
-                    f"**PostgresMonitor has been running for {int((now() - self.start_time) / 60)} minutes.**"
-                    + f"\nTotal ticker count: {self.postgres.get_ticker_count()}"
-                    + f"\nLatest ticker timestamp: {self.postgres.get_latest_tickers(1)[0].timestamp}"
-                    + f"\nTickers stored in last hour: {self.postgres.get_ticker_count_for_last_hour()}"
-                )
+                # Ticker totals come from the scrapers' heartbeats, counting the ticker table would scan it
+                scrapers = heartbeats.get('Athena', [])
+                tickers = sum(heartbeat.counters.get('tickers', 0) for heartbeat in scrapers)
+                latest = max((heartbeat.progress_at for heartbeat in scrapers if heartbeat.progress_at is not None), default=None)
+                lines = [
+                    f"**PostgresMonitor has been running for {int((now() - self.start_time) / 60)} minutes.**",
+                    f"Tickers stored by running scrapers: {tickers}",
+                    f"Latest ticker stored: {int(latest) if latest is not None else 'none yet'}"
+                ]
+                for service, workers in sorted(heartbeats.items()):
+                    for heartbeat in workers:
+                        counters = ', '.join(f'{name}: {value}' for name, value in sorted(heartbeat.counters.items()))
+                        lines.append(f"{service} ({heartbeat.worker}): last progress {int(heartbeat.progress_age)}s ago ({counters})")
+                self.discord.send_status('\n'.join(lines))
             except:
                 self.log.error("Failed to send status message to discord.")
             self.latest_update = now()
 
+    def __worker_checks(self, subservice: PostgresSubservice, heartbeats: List[HeartbeatState], age: Callable[[HeartbeatState], float],
+                        unresponsive_threshold: int, abandon_threshold: int):
+        '''
+        Check each of a service's workers on its own, so one healthy worker can't hide a dead one.
+        With no workers publishing, the service itself is timed from when one was last seen (or monitoring started)
+        '''
+        if not heartbeats:
+            last_seen = self.last_seen.get(subservice.name, self.start_time)
+            self.__heartbeat_check(subservice, int(now() - last_seen), unresponsive_threshold, abandon_threshold)
+            return
+        self.last_seen[subservice.name] = now()
+        self.__handle_service_revival_if_inactive(subservice)
+        for heartbeat in heartbeats:
+            name = f'{subservice.name} ({heartbeat.worker})'
+            worker = self.worker_subservices.setdefault(name, PostgresSubservice(name))
+            self.__heartbeat_check(worker, int(age(heartbeat)), unresponsive_threshold, abandon_threshold)
+
+    def __heartbeat_check(self, subservice: PostgresSubservice, time_since_last_update: int, unresponsive_threshold: int, abandon_threshold: int) -> PostgresSubservice:
+        if time_since_last_update > unresponsive_threshold:
+            return self.__handle_timeout_and_update_subservice(subservice, time_since_last_update, unresponsive_threshold, abandon_threshold)
+        return self.__handle_service_revival_if_inactive(subservice)
+
     def __handle_timeout_and_update_subservice(self, subservice: PostgresSubservice, time_since_last_update: int, unresponsive_threshold: int, abandon_threshold: int) -> PostgresSubservice:
         if time_since_last_update > unresponsive_threshold and not subservice.ignore_inactivity:
             if time_since_last_update > abandon_threshold:
@@ -1,6 +1,10 @@
 from utils import Logger, DiscordWebhook
+from utils.archive import TickerArchive
+from utils.config import PostgresConfig, ScraperConfig
 from olympus.athena import Athena
+from olympus.athena_async import AsyncAthena
 from time import sleep
+from time import time as now
 
 
 class TickerScraper:
@@ -8,18 +12,46 @@ class TickerScraper:
     def __init__(self) -> None:
         self.log = Logger.setup(self.__class__.__name__)
         self.discord = DiscordWebhook(self.__class__.__name__)
-        self.athena = Athena(custom_interval=60)
+        if ScraperConfig.ASYNC_SCRAPER:
+            self.athena = AsyncAthena(custom_interval=60, custom_symbols=ScraperConfig.SYMBOLS)
+        else:
+            self.athena = Athena(custom_interval=60, custom_symbols=ScraperConfig.SYMBOLS)
+        self.archive = TickerArchive(self.athena.postgres)
+        self.last_retention_check = 0
 
     def run(self) -> None:
         self.discord.send_status(f"TickerScraper has started a new run (Git hash: `{Logger.git_hash()}`)")
         self.athena.run()
         try:
             while not self.athena.abort:
+                if now() - self.last_retention_check > PostgresConfig.TICKER_RETENTION_CHECK_INTERVAL:
+                    self.apply_retention()
                 sleep(10)
         except KeyboardInterrupt:
             self.athena.stop()
             self.log.debug('KeyboardInterrupt')
 
+    def apply_retention(self) -> None:
+        '''
+        Archive old tickers to Parquet, then remove ticker partitions older than the retention period.
+        Failures are reported, but don't stop the scraper.
+        '''
+        self.last_retention_check = now()
+        try:
+            archived = self.archive.archive()
+            if archived:
+                self.discord.send_status(f"Archived {len(archived)} day(s) of tickers to {self.archive.path}")
+        except Exception as err:
+            self.log.error(f'Ticker archival failed: {err}')
+            self.discord.send_alert(f'Ticker archival failed: {err}')
+        try:
+            removed = self.athena.partitions.apply_retention()
+            if removed:
+                self.discord.send_status(f"Removed {len(removed)} old ticker partition(s): {', '.join(removed)}")
+        except Exception as err:
+            self.log.error(f'Ticker partition retention failed: {err}')
+            self.discord.send_alert(f'Ticker partition retention failed: {err}')
+
 if __name__ == '__main__':
     scraper = TickerScraper()
     scraper.run()
@@ -2,3 +2,14 @@
 POSTGRES_TEST_TICKER_TABLE = '_ticker_feed_testing'
 POSTGRES_TEST_ORDER_TABLE = '_order_feed_testing'
 POSTGRES_TEST_PREDICTION_TABLE = '_prediction_feed_testing'
+POSTGRES_TEST_HEARTBEAT_TABLE = '_service_heartbeats_testing'
+POSTGRES_TEST_MIGRATIONS_TABLE = '_schema_migrations_testing'
+
+# Production table -> testing table. The testing tables are built by running schema.sql & migrations/ with these renames
+POSTGRES_TEST_TABLE_NAMES = {
+    'ticker_feed': POSTGRES_TEST_TICKER_TABLE,
+    'order_feed': POSTGRES_TEST_ORDER_TABLE,
+    'prediction_feed': POSTGRES_TEST_PREDICTION_TABLE,
+    'service_heartbeats': POSTGRES_TEST_HEARTBEAT_TABLE,
+    'schema_migrations': POSTGRES_TEST_MIGRATIONS_TABLE,
+}
@@ -1,9 +1,11 @@
 import unittest
 
 from testing.test_athena import TestAthena
+from testing.test_athena_async import TestAsyncAthena
 from testing.test_delphi import TestDelphi
 from testing.test_hermes import TestHermes
 from testing.test_postgres import TestPostgres
+from testing.test_postgres_async import TestAsyncPostgres
 from testing.test_services_manager import TestServicesManager
 
 
@@ -19,8 +21,10 @@ class __TestModule:
 
 TEST_MODULES = {
     'athena': __TestModule(TestAthena),
+    'athena_async': __TestModule(TestAsyncAthena),
     'delphi': __TestModule(TestDelphi),
     'hermes': __TestModule(TestHermes),
     'postgres': __TestModule(TestPostgres),
+    'postgres_async': __TestModule(TestAsyncPostgres),
     'services': __TestModule(TestServicesManager)
 }
@@ -1,3 +1,6 @@
+import json
+import os
+from glob import glob
 from unittest import TestCase
 import unittest
 from time import sleep
@@ -5,8 +8,12 @@ from olympus.athena import Athena
 from threading import Thread
 import testing.utils as utils
 import testing.config as constants
+import crosstower.socket_api.utils as socket_utils
 from crosstower.models import Ticker
+from crosstower.socket_api.public import parse_tickers
 from mock import MockDiscord
+from utils.csv_sink import CsvSink
+from utils.partitions import TickerPartitions
 
 class TestAthena(TestCase):
 
@@ -47,9 +54,77 @@ class TestAthena(TestCase):
         self.athena.abort = True
         thread.join()
         
+    def test_csv_loop(self):
+        thread = Thread(target=self.athena.csv_loop)
+        thread.start()
+        for i in range(5):
+            self.athena.queue.put(utils.get_basic_ticker(timestamp=123456789 + i))
+        # Other symbols aren't written to the file
+        self.athena.queue.put(utils.get_basic_ticker(timestamp=123456800, symbol='ETHUSD_TR'))
+        sleep(2)
+        self.assertEqual(utils.count_rows_from_file(self.filename), 5)
+        self.assertEqual(self.athena.csv_sink.last_line, utils.get_basic_ticker(timestamp=123456793).csv_line)
+        self.athena.abort = True
+        thread.join()
+        self.assertIsNone(self.athena.csv_sink.file)
+
+    def test_csv_sink(self):
+        sink = CsvSink(self.filename, header='header\n', flush_interval=60, rotate_bytes=150)
+        sink.write(utils.get_basic_ticker().csv_line)
+        # Buffered until the flush interval passes, or the file is rotated
+        self.assertEqual(utils.count_rows_from_file(self.filename), 0)
+        sink.flush()
+        self.assertEqual(utils.count_rows_from_file(self.filename), 2)
+        sink.write_lines([utils.get_basic_ticker(timestamp=123456790 + i).csv_line for i in range(5)])
+        self.assertIsNone(sink.file)
+        rotated = glob(f'{os.path.splitext(self.filename)[0]}.*.csv')
+        self.assertEqual(len(rotated), 1)
+        self.assertEqual(sink.lines_written, 6)
+        sink.write(utils.get_basic_ticker(timestamp=123456800).csv_line)
+        sink.close()
+        with open(self.filename) as file:
+            self.assertEqual(file.read(), 'header\n' + utils.get_basic_ticker(timestamp=123456800).csv_line)
+        with open(rotated[0]) as file:
+            self.assertEqual(len(file.readlines()), 7)
+        # Rotating twice within a second keeps every file
+        sink.write(utils.get_basic_ticker(timestamp=123456801).csv_line)
+        second = sink.rotate()
+        sink.write(utils.get_basic_ticker(timestamp=123456802).csv_line)
+        third = sink.rotate()
+        rotations = [rotated[0], second, third]
+        self.assertEqual(sorted(glob(f'{os.path.splitext(self.filename)[0]}.*.csv')), sorted(rotations))
+        for path, lines in zip(rotations, [7, 3, 2]):
+            with open(path) as file:
+                self.assertEqual(len(file.readlines()), lines)
+            os.remove(path)
+
+    def test_parse_tickers(self):
+        frame = json.dumps({'ch': 'ticker/1s/batch', 'data': {
+            'BTCUSD_TR': {'t': 1650000000123, 'a': '40001.50', 'b': '40000.50', 'c': '40001.00', 'o': '39500', 'h': '41000', 'l': '39000', 'v': '12.5', 'q': None},
+            'LTCUSD_TR': {'t': 1650000000, 'a': '100', 'b': '99'}
+        }})
+        fast_json = socket_utils.orjson
+        try:
+            for backend in {fast_json, None}:
+                socket_utils.orjson = backend
+                tickers = parse_tickers(frame, ['BTCUSD_TR', 'ETHUSD_TR', 'LTCUSD_TR'])
+                # Symbols missing from the frame are skipped
+                self.assertEqual([ticker.symbol for ticker in tickers], ['BTCUSD_TR', 'LTCUSD_TR'])
+                bitcoin, litecoin = tickers
+                self.assertEqual((bitcoin.timestamp, bitcoin.ask, bitcoin.bid, bitcoin.open, bitcoin.volume, bitcoin.volume_quote),
+                                 (1650000000, 40001.5, 40000.5, 39500.0, 12.5, None))
+                self.assertEqual((litecoin.timestamp, litecoin.ask, litecoin.last), (1650000000, 100.0, None))
+                self.assertEqual(bitcoin.csv_line, '40001.5,40000.5,40001.0,39000.0,41000.0,39500.0,12.5,None,1650000000\n')
+        finally:
+            socket_utils.orjson = fast_json
+        with self.assertRaises(AttributeError):
+            tickers[0].ask = 1.0
+        self.assertEqual(Ticker(tickers[0].dict).csv_line, tickers[0].csv_line)
+
     def test_sql_loop(self):
         self.athena.csv_path = None
         self.athena.postgres = utils.PostgresTesting.setUp()
+        self.athena.partitions = TickerPartitions(self.athena.postgres)
         thread = Thread(target=self.athena.sql_loop)
         thread.start()
         test_ticker = utils.get_basic_ticker()
@@ -63,6 +138,28 @@ class TestAthena(TestCase):
         self.athena.postgres = None
         self.athena.csv_path = self.filename
 
+    def test_sql_batch_loop(self):
+        self.athena.csv_path = None
+        self.athena.postgres = utils.PostgresTesting.setUp()
+        self.athena.partitions = TickerPartitions(self.athena.postgres)
+        self.athena.batch_size = 5
+        self.athena.batch_latency = 2
+        thread = Thread(target=self.athena.sql_batch_loop)
+        thread.start()
+        for i in range(7):
+            self.athena.queue.put(utils.get_basic_ticker(timestamp=123456789 + i))
+        sleep(1)
+        # First full batch is written immediately, the remainder waits for batch_latency
+        self.assertEqual(len(self.athena.postgres.get_latest_tickers(10)), 5)
+        sleep(2)
+        self.assertEqual(len(self.athena.postgres.get_latest_tickers(10)), 7)
+        self.assertEqual(self.athena.heartbeat.progress_count, 7)
+        self.athena.abort = True
+        thread.join()
+        self.athena.postgres.tearDown()
+        self.athena.postgres = None
+        self.athena.csv_path = self.filename
+
     def test_superclass(self):
         self.athena.run()
         sleep(2)
@@ -0,0 +1,200 @@
+import asyncio
+import unittest
+from time import sleep
+from unittest import IsolatedAsyncioTestCase
+
+import testing.config as constants
+import testing.utils as utils
+from crosstower.socket_api.public import ConnectionException
+from mock import MockDiscord
+from olympus.athena_async import AsyncAthena
+from utils.config import ScraperConfig
+from utils.heartbeat import Heartbeat
+from utils.partitions import TickerPartitions
+from utils.postgres_async import AsyncPostgres
+
+
+class ScriptedWebsocket:
+
+    '''
+    Stands in for AsyncTickerWebsocket. Each connection serves the next script in turn,
+    a script being a list of frames (a ticker, or a list of tickers), ending the connection once it runs out.
+    '''
+
+    def __init__(self, scripts: list) -> None:
+        self.scripts = scripts
+        self.connections = 0
+        self.current: list = None
+
+    @property
+    def connected(self) -> bool:
+        return self.current is not None
+
+    async def subscribe(self) -> bool:
+        self.current = list(self.scripts[self.connections]) if self.connections < len(self.scripts) else []
+        self.connections += 1
+        return True
+
+    async def get_tickers(self):
+        await asyncio.sleep(0.01)
+        if not self.current:
+            self.current = None
+            raise ConnectionException
+        frame = self.current.pop(0)
+        return frame if isinstance(frame, list) else [frame]
+
+    async def close(self) -> None:
+        self.current = None
+
+
+class TestAsyncAthena(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.athena = AsyncAthena(custom_batch_size=5, custom_batch_latency=1, custom_queue_size=10)
+        self.athena.discord = MockDiscord('TestAsyncAthena')
+        self.athena.postgres = utils.PostgresTesting.setUp()
+        self.athena.partitions = TickerPartitions(self.athena.postgres)
+        self.athena.heartbeat = Heartbeat('Athena', self.athena.postgres, table_override=constants.POSTGRES_TEST_HEARTBEAT_TABLE)
+        self.athena.async_postgres = AsyncPostgres(
+            ticker_table_override=constants.POSTGRES_TEST_TICKER_TABLE,
+            order_table_override=constants.POSTGRES_TEST_ORDER_TABLE,
+            prediction_table_override=constants.POSTGRES_TEST_PREDICTION_TABLE
+        )
+        self.athena.loop = asyncio.get_running_loop()
+        self.athena.queue = asyncio.Queue(maxsize=self.athena.queue_size)
+
+    async def asyncTearDown(self):
+        await self.athena.async_postgres.close()
+        self.athena.postgres.tearDown()
+        self.athena = None
+
+    async def test_persist_loop(self):
+        task = asyncio.create_task(self.athena.persist_loop())
+        for i in range(7):
+            self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456789 + i))
+        await asyncio.sleep(0.5)
+        # First full batch is written immediately, the remainder waits for batch_latency
+        self.assertEqual(self.athena.postgres.get_ticker_count(), 5)
+        await asyncio.sleep(1)
+        self.assertEqual(self.athena.postgres.get_ticker_count(), 7)
+        self.assertEqual(len(self.athena.postgres.get_candles('1m', 0, 2 ** 31)), 1)
+        # Stopping writes whatever is left rather than dropping it
+        self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456800))
+        self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456800))
+        self.athena.put_ticker(AsyncAthena.STOP)
+        await asyncio.wait_for(task, 5)
+        # The duplicate timestamp is filtered by the interval
+        self.assertEqual(self.athena.postgres.get_ticker_count(), 8)
+        self.assertEqual(self.athena.heartbeat.progress_count, 8)
+
+    async def test_persist_loop_write_fails(self):
+        # The first write fails, as if the database went away. The batch is kept & written once it is due again
+        insert = self.athena.async_postgres.insert_tickers_bulk
+        writes = []
+        async def fail_once(batch):
+            writes.append(len(batch))
+            if len(writes) == 1:
+                raise Exception('Connection lost')
+            await insert(batch)
+        self.athena.async_postgres.insert_tickers_bulk = fail_once
+        task = asyncio.create_task(self.athena.persist_loop())
+        for i in range(5):
+            self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456789 + i))
+        await asyncio.sleep(0.5)
+        self.assertFalse(task.done())
+        self.assertEqual((self.athena.postgres.get_ticker_count(), self.athena.write_failures), (0, 1))
+        self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456800))
+        await asyncio.sleep(1)
+        self.assertEqual(writes, [5, 6])
+        self.assertEqual((self.athena.postgres.get_ticker_count(), self.athena.write_failures), (6, 0))
+        self.assertEqual(self.athena.heartbeat.progress_count, 6)
+        self.athena.put_ticker(AsyncAthena.STOP)
+        await asyncio.wait_for(task, 5)
+
+    async def test_queue_drops_oldest(self):
+        for i in range(13):
+            self.athena.put_ticker(utils.get_basic_ticker(timestamp=123456789 + i))
+        self.assertEqual(self.athena.queue.qsize(), 10)
+        self.assertEqual(self.athena.dropped, 3)
+        self.assertEqual(self.athena.heartbeat.counters, {'dropped': 3})
+        self.assertEqual(self.athena.queue.get_nowait().timestamp, 123456789 + 3)
+
+    async def test_receive_reconnects(self):
+        self.athena.websocket = ScriptedWebsocket([
+            [utils.get_basic_ticker(timestamp=123456789 + i) for i in range(3)],
+            [utils.get_basic_ticker(timestamp=123456792 + i) for i in range(2)]
+        ])
+        task = asyncio.create_task(self.athena.receive_loop())
+        await asyncio.sleep(2.5)
+        self.assertEqual(self.athena.websocket.connections, 2)
+        self.assertEqual(self.athena.queue.qsize(), 5)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+    async def test_symbols(self):
+        self.athena.websocket = ScriptedWebsocket([[
+            [utils.get_basic_ticker(timestamp=123456789 + i, symbol=symbol) for symbol in ('BTCUSD_TR', 'ETHUSD_TR')] for i in range(3)
+        ]])
+        receive = asyncio.create_task(self.athena.receive_loop())
+        persist = asyncio.create_task(self.athena.persist_loop())
+        await asyncio.sleep(0.5)
+        receive.cancel()
+        self.athena.put_ticker(AsyncAthena.STOP)
+        await asyncio.wait_for(persist, 5)
+        # Every frame is fanned out, and each symbol has its own interval filter
+        self.assertEqual(self.athena.postgres.get_ticker_count(), 6)
+        self.assertEqual(self.athena.latest, {'BTCUSD_TR': 123456791, 'ETHUSD_TR': 123456791})
+        ethereum = AsyncPostgres(constants.POSTGRES_TEST_TICKER_TABLE, symbol='ETHUSD_TR')
+        try:
+            self.assertEqual(len(await ethereum.get_latest_tickers(10)), 3)
+            self.assertEqual((await ethereum.get_candles('1m', 0, 2 ** 31))[0].ticker_count, 3)
+        finally:
+            await ethereum.close()
+
+    async def test_receive_gives_up(self):
+        self.athena.websocket = ScriptedWebsocket([])
+        max_reconnects = ScraperConfig.SOCKET_MAX_RECONNECTS
+        ScraperConfig.SOCKET_MAX_RECONNECTS = 1
+        try:
+            with self.assertRaises(ConnectionException):
+                await self.athena.receive_loop()
+        finally:
+            ScraperConfig.SOCKET_MAX_RECONNECTS = max_reconnects
+
+    async def test_watchdog_loop(self):
+        self.athena.websocket = ScriptedWebsocket([[utils.get_basic_ticker()]])
+        await self.athena.websocket.subscribe()
+        self.athena.timeout_threshold = 0.2
+        watchdog_interval = ScraperConfig.WATCHDOG_INTERVAL
+        ScraperConfig.WATCHDOG_INTERVAL = 0.1
+        try:
+            task = asyncio.create_task(self.athena.watchdog_loop())
+            await asyncio.sleep(0.5)
+            self.assertFalse(self.athena.websocket.connected)
+            task.cancel()
+        finally:
+            ScraperConfig.WATCHDOG_INTERVAL = watchdog_interval
+
+    def test_run_and_stop(self):
+        self.athena.websocket = ScriptedWebsocket([[utils.get_basic_ticker(timestamp=123456789 + i) for i in range(3)]])
+        self.athena.batch_latency = 60
+        # Runs on its own thread & event loop, so needs a pool of its own
+        self.athena.async_postgres = AsyncPostgres(constants.POSTGRES_TEST_TICKER_TABLE)
+        self.athena.run()
+        sleep(1)
+        # Published while running, and removed once stopped
+        heartbeats = Heartbeat.read_all(self.athena.postgres, constants.POSTGRES_TEST_HEARTBEAT_TABLE)['Athena']
+        self.assertEqual([heartbeat.worker for heartbeat in heartbeats], [self.athena.heartbeat.worker])
+        self.assertLess(heartbeats[0].beat_age, 5)
+        self.athena.stop()
+        self.athena.loop_thread.join(timeout=10)
+        self.assertFalse(self.athena.loop_thread.is_alive())
+        self.assertTrue(self.athena.abort)
+        # Stopping flushed the partial batch
+        self.assertEqual(self.athena.postgres.get_ticker_count(), 3)
+        self.assertEqual(Heartbeat.read_all(self.athena.postgres, constants.POSTGRES_TEST_HEARTBEAT_TABLE), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
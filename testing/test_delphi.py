@@ -5,12 +5,15 @@ from time import time as now
 from unittest import TestCase
 from mock.mock_discord import MockDiscord
 
+import pandas as pd
+
 from olympus.delphi import Delphi
 from olympus.helper_objects.prediction_queue import \
     PredictionQueueDB as PredictionQueue
 
 import testing.utils as utils
 from testing.utils import PostgresTesting
+from utils.heartbeat import Heartbeat
 import testing.config as constants
 
 class TestDelphi(TestCase):
@@ -28,10 +31,12 @@ class TestDelphi(TestCase):
         )
         self.delphi.interval_size = 3
         self.delphi.discord = MockDiscord('TestDelphi')
+        self.delphi.heartbeat = Heartbeat('Delphi', self.postgres, table_override=constants.POSTGRES_TEST_HEARTBEAT_TABLE)
 
     def tearDown(self):
         utils.delete_file(self.delphi.tmp_csv_path)
         self.delphi = None
+        self.postgres.query(f'DELETE FROM {constants.POSTGRES_TEST_HEARTBEAT_TABLE}', False)
         self.postgres.tearDown()
 
     def test_init(self):
@@ -58,6 +63,25 @@ class TestDelphi(TestCase):
         self.assertEqual(len(sql_delphi.tmp_csv_path), 23)
         utils.delete_file(sql_delphi.tmp_csv_path)
 
+    def test_sql_mode_csv(self):
+        # SQL mode writes only price & timestamp, which the model loader picks out by name
+        self.delphi.sql_mode = True
+        self.delphi.postgres = self.postgres
+        tickers = [utils.get_basic_ticker(timestamp=1650000000 + i) for i in range(self.delphi.seq_len)]
+        self.postgres.insert_tickers_bulk(tickers)
+        latest = self.delphi._Delphi__latest_data_handler()
+        self.assertEqual(latest, (tickers[-1].ask, tickers[-1].timestamp))
+        df = pd.read_csv(self.delphi.tmp_csv_path)
+        self.assertEqual(list(df.columns), ['price', 'timestamp'])
+        self.assertEqual(list(df.price), [ticker.ask for ticker in tickers])
+        self.assertEqual(list(df.timestamp), [ticker.timestamp for ticker in tickers])
+        self.delphi.predictor.intake_preprocess()
+        self.assertEqual(self.delphi.predictor.X_test.shape, (1, self.delphi.seq_len - 1, 1))
+        # Predictions are appended in the same two columns
+        self.delphi._Delphi__add_prediction_to_tmp_csv(2.5, 1650000100)
+        df = pd.read_csv(self.delphi.tmp_csv_path)
+        self.assertEqual((len(df), df.price.iloc[-1], df.timestamp.iloc[-1]), (self.delphi.seq_len + 1, 2.5, 1650000100))
+
     def test_run_loop_sql_mode(self):
         self.delphi.sql_mode = True
         self.delphi.postgres = PostgresTesting(
@@ -1,3 +1,4 @@
+from threading import Thread
 from time import sleep
 from unittest import TestCase
 
@@ -7,6 +8,8 @@ from olympus.hermes import Hermes
 from olympus.helper_objects import PredictionVector
 from olympus.helper_objects.prediction_queue import PredictionQueueDB
 from utils import Postgres
+from utils.config import PredictionConfig
+from utils.heartbeat import Heartbeat
 
 from testing import config, utils
 from testing.utils import PostgresTesting
@@ -26,6 +29,8 @@ class TestHermes(TestCase):
                 "available": 5
             }
         ])
+        # Runs even if setUp fails part way, unlike tearDown
+        self.addCleanup(utils.delete_file, self.params_file)
         self.testing_api = TestingAPI(self.params_file, MockDiscord('TestingAPIOrderListener'))
         self.postgres = PostgresTesting.setUp()
         self.postgres.insert_ticker(utils.get_basic_ticker())
@@ -37,12 +42,25 @@ class TestHermes(TestCase):
         )
         self.hermes.discord = MockDiscord('Hermes')
         self.hermes.postgres = self.postgres
+        self.hermes.heartbeat = Heartbeat('Hermes', self.postgres, table_override=config.POSTGRES_TEST_HEARTBEAT_TABLE)
         self.hermes.gsheets = MockGoogleSheets('Hermes')
 
     def tearDown(self):
+        self.postgres.query(f'DELETE FROM {config.POSTGRES_TEST_HEARTBEAT_TABLE}', False)
         self.postgres.tearDown()
         self.hermes = None
-        utils.delete_file(self.params_file)
+
+    def start_hermes(self) -> Thread:
+        # run() blocks in the main loop until stopped, so it gets a thread of its own
+        runner = Thread(target=self.hermes.run, daemon=True)
+        runner.start()
+        return runner
+
+    def stop_hermes(self, runner: Thread):
+        self.hermes.stop()
+        # The main loop notices abort the next time its queue poll times out
+        runner.join(timeout=PredictionConfig.PREDICTION_QUEUE_POLL_INTERVAL + 5)
+        self.assertFalse(runner.is_alive())
 
     def test_init(self):
         self.assertFalse(self.hermes.abort, False)
@@ -50,18 +68,19 @@ class TestHermes(TestCase):
         self.assertEqual(self.hermes.trading_account, self.testing_api.trading)
 
     def test_submit(self):
-        self.hermes.run()
+        runner = self.start_hermes()
         self.hermes.submit_prediction_to_queue(utils.get_basic_prediction())
         sleep(5)
-        self.hermes.stop()
+        self.stop_hermes(runner)
         balances = utils.get_json_from_file(self.params_file)
         self.assertEqual(balances[1]['currency'], "BTC")
         self.assertNotEqual(balances[1]['available'], 5.0)
 
     def test_run(self):
-        self.hermes.run()
+        runner = self.start_hermes()
+        sleep(1)
         self.assertEqual(self.hermes.abort, False)
-        self.hermes.stop()
+        self.stop_hermes(runner)
         self.assertEqual(self.hermes.abort, True)
         self.hermes.join_threads()
         sleep(3)
@@ -69,25 +88,27 @@ class TestHermes(TestCase):
             self.assertFalse(thread.is_alive())
 
     def test_order_status_update(self):
-        self.hermes.run()
+        runner = self.start_hermes()
         prediction = utils.get_basic_prediction()
         self.hermes.submit_prediction_to_queue(prediction)
         sleep(3)
-        self.hermes.stop()
+        self.stop_hermes(runner)
         order_rows = self.hermes.postgres.get_queued_orders()
         self.assertEqual(len(order_rows), 0)
         test_postgres: PostgresTesting = self.hermes.postgres
         completed_rows = test_postgres.query(f"SELECT * FROM {config.POSTGRES_TEST_ORDER_TABLE} WHERE status = 'COMPLETE'", fetch_result=True)
         self.assertEqual(len(completed_rows), 1)
         self.assertEqual(self.hermes.submitted_order_count, 1)
+        self.assertEqual(self.hermes.heartbeat.counters, {'predictions': 1, 'orders': 1})
+        self.assertIsNotNone(self.hermes.heartbeat.tick_at)
         self.assertEqual(completed_rows[0][4], prediction.uuid)
 
     def test_prediction_queue_db(self):
-        self.hermes.run()
+        runner = self.start_hermes()
         prediction = utils.get_basic_prediction()
         self.hermes.submit_prediction_to_queue(prediction)
         sleep(5)
-        self.hermes.stop()
+        self.stop_hermes(runner)
         postgres: PostgresTesting = self.hermes.postgres
         rows = postgres.query(f'SELECT * FROM {config.POSTGRES_TEST_PREDICTION_TABLE}', fetch_result=True)
         self.assertEqual(len(rows), 1)
@@ -1,14 +1,36 @@
+import json
+import os
 import uuid
+from calendar import timegm
 from cgi import test
+from io import StringIO
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
 from time import time as now
-from unittest import TestCase
-from unittest.mock import Mock
+from time import tzset
+from unittest import TestCase, skipUnless
+from unittest.mock import Mock, patch
 
+import numpy as np
 from mock import MockDiscord
 
 import testing.config as constants
+from crosstower.models import Order, Ticker
 from testing.utils import PostgresTesting
 from testing import utils
+from olympus.helper_objects.order_run import OrderRun
+from olympus.helper_objects.prediction_queue import PredictionQueueDB
+from olympus.helper_objects.ticker_batch import TickerBatch
+from tools.export_training_data import export_training_data, training_query
+from utils.archive import TickerArchive
+from utils.config import PostgresConfig, TradingConfig
+from utils.environment import env
+from utils.heartbeat import Heartbeat
+from utils.migrations import PostgresMigrations
+from utils.partitions import TickerPartitions
+from utils.postgres_metrics import PostgresQueryMetrics, label_for_sql
+from utils.postgres_pool import PoolTimeout, PostgresPool
 
 class TestPostgres(TestCase):
 
@@ -18,12 +40,11 @@ class TestPostgres(TestCase):
 
     def tearDown(self):
         self.postgres.tearDown()
-        self.postgres.conn.close()
         self.postgres = None
     
     def test_init(self):
-        self.assertEqual(self.postgres.conn.closed, False)
-        self.assertEqual(self.postgres.conn.autocommit, False)
+        self.assertEqual(self.postgres.pool.closed, False)
+        self.assertEqual(self.postgres.pool, PostgresTesting.setUp().pool)
         self.assertEqual(self.postgres.ticker_table_name, constants.POSTGRES_TEST_TICKER_TABLE)
         self.assertEqual(self.postgres.order_table_name, constants.POSTGRES_TEST_ORDER_TABLE)
         self.assertEqual(self.postgres.prediction_table_name, constants.POSTGRES_TEST_PREDICTION_TABLE)
@@ -36,7 +57,66 @@ class TestPostgres(TestCase):
         first_ticker = rows[0]
         self.assertEqual(first_ticker.timestamp, ticker.timestamp)
         self.assertEqual(first_ticker.ask, ticker.ask)
-        self.assertEqual(self.postgres.conn.closed, False)
+        self.assertEqual(self.postgres.pool.closed, False)
+
+    def test_insert_tickers_bulk(self):
+        tickers = [utils.get_basic_ticker(timestamp=123456789 + i) for i in range(25)]
+        self.postgres.insert_tickers_bulk(tickers)
+        rows = self.postgres.get_latest_tickers(30)
+        self.assertEqual(len(rows), 25)
+        self.assertEqual(rows[0].timestamp, tickers[0].timestamp)
+        self.assertEqual(rows[-1].timestamp, tickers[-1].timestamp)
+        self.assertEqual(rows[-1].ask, tickers[-1].ask)
+
+    def test_ticker_rows_are_compact(self):
+        ticker = utils.get_basic_ticker()
+        self.postgres.insert_ticker(ticker)
+        row = self.postgres.get_latest_tickers(1)[0]
+        self.assertFalse(hasattr(row, '__dict__'))
+        self.assertEqual(row.csv_line, f"{row.ask},{row.bid},{row.last},{row.low},{row.high},{row.open},{row.volume},{row.volume_quote},{ticker.timestamp}\n")
+
+    def test_get_latest_tickers_array(self):
+        tickers = [utils.get_basic_ticker(timestamp=123456789 + i) for i in range(25)]
+        self.postgres.insert_tickers_bulk(tickers)
+        array = self.postgres.get_latest_tickers_array(10, columns=['ask', 'volume'])
+        self.assertEqual(array.dtype.names, ('timestamp', 'ask', 'volume'))
+        self.assertEqual(len(array), 10)
+        # Oldest first, same as get_latest_tickers
+        self.assertEqual(list(array['timestamp']), [ticker.timestamp for ticker in tickers[-10:]])
+        self.assertEqual(array['ask'][-1], tickers[-1].ask)
+        self.assertEqual(array['volume'][-1], float(tickers[-1].volume))
+        self.assertEqual(len(self.postgres.get_latest_tickers_array(30)), 25)
+        self.assertRaises(Exception, self.postgres.get_latest_tickers_array, 10, ['ask; DROP TABLE ticker_feed'])
+        self.postgres.tearDown()
+        self.assertEqual(len(self.postgres.get_latest_tickers_array(10)), 0)
+
+    def test_ticker_batch(self):
+        tickers = [utils.get_basic_ticker(timestamp=123456789 + i) for i in range(10)]
+        batch = TickerBatch()
+        batch.extend(tickers[:4])
+        batch.extend(TickerBatch.from_columns([123456789 + i for i in range(4, 10)], ['ETHUSD_TR'] * 6, ask=[2.0] * 6, volume=[4.0] * 6))
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(len(batch[2:5]), 3)
+        with self.postgres.transaction():
+            self.postgres.insert_tickers_bulk(batch)
+            self.postgres.update_candles(batch)
+        self.assertEqual(self.postgres.get_ticker_count(), 10)
+        latest = self.postgres.get_latest_tickers_batch(10)
+        self.assertEqual(list(latest['timestamp']), [ticker.timestamp for ticker in tickers[:4]])
+        lines = StringIO()
+        self.assertEqual(latest.to_csv(lines), 4)
+        self.assertEqual(lines.getvalue(), ''.join(ticker.csv_line for ticker in tickers[:4]))
+        # Missing prices are stored as NULL
+        ethereum = PostgresTesting(constants.POSTGRES_TEST_TICKER_TABLE, symbol='ETHUSD_TR')
+        self.assertEqual(ethereum.get_latest_tickers(1)[0].bid, None)
+        self.assertEqual(ethereum.get_candles('1m', 0, 2 ** 31)[0].ticker_count, 6)
+        self.assertEqual(list(TickerBatch.from_array(ethereum.get_latest_tickers_array(6, ['ask']))['ask']), [2.0] * 6)
+        frame = json.dumps({'ch': 'ticker/1s/batch', 'data': {'BTCUSD_TR': tickers[0].dict, 'ETHUSD_TR': {'t': 1650000000123, 'a': '3.5'}}})
+        frames = TickerBatch.from_ws_frames([frame, frame], ['BTCUSD_TR', 'ETHUSD_TR'])
+        self.assertEqual(list(frames['symbol']), ['BTCUSD_TR', 'ETHUSD_TR'] * 2)
+        self.assertEqual(list(frames['timestamp']), [tickers[0].timestamp, 1650000000] * 2)
+        self.assertEqual(frames['ask'][1], 3.5)
+        self.assertTrue(np.isnan(frames['bid'][1]))
 
     def test_insert_order(self):
         order = utils.get_basic_order()
@@ -63,10 +143,25 @@ class TestPostgres(TestCase):
         self.assertEqual(first_prediction.status, 'QUEUED')
         self.assertEqual(str(first_prediction.prediction_history[0]), str(prediction.prediction_history[0]))
 
+    def test_native_column_types(self):
+        prediction = utils.get_basic_prediction()
+        prediction.prediction_history = list(np.array(prediction.prediction_history, dtype=np.float32))
+        self.postgres.insert_prediction_vector(prediction)
+        self.postgres.insert_ticker(utils.get_basic_ticker())
+        stored_prediction = self.postgres.get_queued_predictions()[0]
+        ticker = self.postgres.get_latest_tickers(1)[0]
+        self.assertIsInstance(stored_prediction.timestamp, int)
+        self.assertIsInstance(stored_prediction.prediction_timestamp, int)
+        self.assertIsInstance(stored_prediction.weight, float)
+        self.assertTrue(all(type(value) is float for value in stored_prediction.prediction_history))
+        self.assertEqual(stored_prediction.prediction_history, [float(value) for value in prediction.prediction_history])
+        self.assertIsInstance(ticker.timestamp, int)
+        self.assertTrue(all(type(getattr(ticker, field)) is float for field in ('ask', 'bid', 'last', 'volume', 'volume_quote')))
+
     def test_query_and_get_latest_tickers(self):
         for i in range(0, 10):
             query =  f"""INSERT INTO {constants.POSTGRES_TEST_TICKER_TABLE} (timestamp, ask, bid, last, low, high, open, volume, volume_quote) 
-            VALUES ({i}, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)"""
+            VALUES (TO_TIMESTAMP({i}), 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)"""
             self.postgres.query(query, fetch_result=False)
         rows = self.postgres.get_latest_tickers(10)
         self.assertEqual(len(rows), 10)
@@ -88,4 +183,501 @@ class TestPostgres(TestCase):
         self.postgres.update_prediction_status(prediction.uuid, 'COMPLETE')
         rows = self.postgres.get_queued_predictions()
         self.assertEqual(len(rows), 0)
-        
+
+    def test_migrations_available(self):
+        migrations = PostgresMigrations(override_postgres=self.postgres).available()
+        versions = [version for version, _ in migrations]
+        self.assertGreater(len(migrations), 0)
+        self.assertEqual(versions, sorted(set(versions)))
+        self.assertTrue(all(filename.endswith('.sql') for _, filename in migrations))
+
+    def test_migrations_apply(self):
+        # The base schema & every migration, against scratch copies of the tables
+        prefix = '_migrations_test_'
+        names = {name: prefix + name for name in ['ticker_feed', 'order_feed', 'prediction_feed', 'service_heartbeats', 'schema_migrations']}
+        migrations = PostgresMigrations(override_postgres=self.postgres, table_names=names)
+        self.assertEqual(migrations.rename('CREATE INDEX ticker_feed_candles_idx ON ticker_feed_candles'),
+                         f'CREATE INDEX {prefix}ticker_feed_candles_idx ON {prefix}ticker_feed_candles')
+        available = migrations.available()
+        try:
+            self.assertEqual(migrations.pending(), available)
+            self.assertEqual(migrations.apply(), [filename for _, filename in available])
+            self.assertEqual(migrations.pending(), [])
+            self.assertEqual(migrations.applied(), [version for version, _ in available])
+            # Nothing left to do the second time
+            self.assertEqual(migrations.apply(), [])
+            self.assertTrue(TickerPartitions(PostgresTesting(ticker_table_override=names['ticker_feed'])).is_partitioned())
+            columns = self.postgres._query("SELECT column_name FROM information_schema.columns WHERE table_name = %s", True, (f'{prefix}ticker_feed_candles',))
+            self.assertIn('symbol', [row[0] for row in columns])
+        finally:
+            tables = self.postgres._query("SELECT relname FROM pg_class WHERE relname LIKE %s AND relkind IN ('r', 'p')", True, (prefix.replace('_', '\\_') + '%',))
+            if tables:
+                self.postgres.query(f"DROP TABLE IF EXISTS {', '.join(row[0] for row in tables)} CASCADE", False)
+
+    def test_pool_concurrent_queries(self):
+        errors = []
+        def run_queries():
+            try:
+                for i in range(10):
+                    self.postgres.get_ticker_count()
+            except Exception as e:
+                errors.append(e)
+        threads = [Thread(target=run_queries) for i in range(PostgresConfig.POOL_MAX_SIZE * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        stats = self.postgres.pool_stats
+        self.assertEqual(stats['in_use'], 0)
+        self.assertLessEqual(stats['idle'], PostgresConfig.POOL_MAX_SIZE)
+
+    def test_pool_discards_closed_connection(self):
+        # Closed while borrowed, so discarded on checkin
+        discarded = self.postgres.pool_stats['discarded']
+        with self.postgres.pool.connection() as conn:
+            conn.close()
+        self.assertEqual(self.postgres.pool_stats['discarded'], discarded + 1)
+        # Closed while idle in the pool (ex. by a server restart), so discarded on the next checkout
+        with self.postgres.pool.connection() as conn:
+            pass
+        discarded = self.postgres.pool_stats['discarded']
+        conn.close()
+        self.assertEqual(self.postgres.get_ticker_count(), 0)
+        self.assertEqual(self.postgres.pool_stats['discarded'], discarded + 1)
+        with self.postgres.pool.connection() as replacement:
+            self.assertIsNot(replacement, conn)
+            self.assertFalse(replacement.closed)
+
+    def test_pool_checkout_timeout(self):
+        pool = PostgresPool(self.postgres.pool.dsn, min_size=0, max_size=1, checkout_timeout=0.5)
+        conn = pool.checkout()
+        self.assertRaises(PoolTimeout, pool.checkout)
+        pool.checkin(conn)
+        self.assertEqual(pool.checkout(), conn)
+        self.assertEqual(pool.stats['timeouts'], 1)
+        pool.close()
+
+    def test_candles(self):
+        start = 1650000000 - 1650000000 % 86400
+        tickers = []
+        for i in range(120):
+            data = utils.get_basic_ticker(timestamp=start + 60 * i).dict
+            data['a'] = str(100 + i)
+            data['v'] = str(1000 + i)
+            tickers.append(Ticker(data))
+        self.postgres.insert_tickers_bulk(tickers)
+        # Batches can arrive out of order
+        self.postgres.update_candles(tickers[60:])
+        self.postgres.update_candles(tickers[:60])
+        minutes = self.postgres.get_candles('1m', start, start + 7200)
+        self.assertEqual(len(minutes), 120)
+        self.assertEqual((minutes[0].timestamp, minutes[0].open, minutes[0].close, minutes[0].ticker_count), (start, 100, 100, 1))
+        hours = self.postgres.get_candles('1h', start, start + 7200)
+        self.assertEqual([(candle.timestamp, candle.open, candle.high, candle.low, candle.close, candle.volume, candle.ticker_count) for candle in hours],
+                         [(start, 100, 159, 100, 159, 1059, 60), (start + 3600, 160, 219, 160, 219, 1119, 60)])
+        # Rolled up from the 5m candles, and bucketed from the raw tickers
+        quarters = self.postgres.get_candles('15m', start, start + 7200)
+        self.assertEqual(len(quarters), 8)
+        self.assertEqual((quarters[1].timestamp, quarters[1].open, quarters[1].close, quarters[1].ticker_count), (start + 900, 115, 129, 15))
+        raw = self.postgres.get_candles(90, start, start + 7200)
+        self.assertEqual(sum(candle.ticker_count for candle in raw), 120)
+        self.assertEqual((raw[1].timestamp, raw[1].open, raw[1].close), (start + 90, 102, 102))
+        self.assertEqual(self.postgres.get_candles('1d', start, start + 86400)[0].ticker_count, 120)
+        self.assertEqual(self.postgres.get_candles('1m', start + 7200, start + 9000), [])
+        self.assertRaises(Exception, self.postgres.get_candles, 'soon', start, start + 7200)
+
+    def test_symbols(self):
+        start = 1650000000 - 1650000000 % 86400
+        btc = [utils.get_basic_ticker(timestamp=start + 60 * i) for i in range(10)]
+        eth = [utils.get_basic_ticker(timestamp=start + 60 * i, symbol='ETHUSD_TR') for i in range(5)]
+        # Both symbols are written in one batch, each under its own symbol
+        self.postgres.insert_tickers_bulk(btc + eth)
+        self.postgres.update_candles(btc + eth)
+        ethereum = PostgresTesting(constants.POSTGRES_TEST_TICKER_TABLE, symbol='ETHUSD_TR')
+        self.assertEqual(self.postgres.get_ticker_count(), 15)
+        self.assertEqual(len(self.postgres.get_latest_tickers(20)), 10)
+        self.assertEqual(len(ethereum.get_latest_tickers(20)), 5)
+        self.assertEqual(len(ethereum.get_tickers_array(start, start + 600)), 5)
+        self.assertEqual(self.postgres.get_candles('1h', start, start + 3600)[0].ticker_count, 10)
+        self.assertEqual(ethereum.get_candles('1h', start, start + 3600)[0].ticker_count, 5)
+        self.assertEqual(ethereum.get_candles(90, start, start + 3600)[-1].timestamp, start + 180)
+        self.assertRaises(Exception, PostgresTesting, constants.POSTGRES_TEST_TICKER_TABLE, symbol="BTC'; DROP TABLE")
+
+    def test_heartbeat(self):
+        table = constants.POSTGRES_TEST_HEARTBEAT_TABLE
+        self.postgres.query(f'DELETE FROM {table}', False)
+        heartbeat = Heartbeat('TestService', self.postgres, table_override=table, interval=0.2)
+        idle = Heartbeat('IdleService', self.postgres, table_override=table, interval=0.2)
+        # A second worker of the same service, as if in another process
+        other = Heartbeat('TestService', self.postgres, table_override=table, interval=0.2)
+        other.worker = 'otherhost:1'
+        heartbeat.progress(5, tickers=5)
+        heartbeat.progress(2, tickers=2)
+        heartbeat.count(dropped=1)
+        heartbeat.tick()
+        try:
+            heartbeat.start()
+            idle.start()
+            other.start()
+            sleep(0.5)
+            states = Heartbeat.read_all(self.postgres, table)
+            self.assertEqual(sorted(states), ['IdleService', 'TestService'])
+            # Each worker has its own row
+            self.assertEqual([state.worker for state in states['TestService']], sorted([heartbeat.worker, 'otherhost:1']))
+            state = next(state for state in states['TestService'] if state.worker == heartbeat.worker)
+            self.assertEqual((state.progress_count, state.counters), (7, {'tickers': 7, 'dropped': 1}))
+            self.assertLess(state.beat_age, 1)
+            self.assertLess(state.progress_age, 2)
+            self.assertLess(state.tick_age, 2)
+            self.assertAlmostEqual(state.started_at, heartbeat.started_at, delta=1)
+            # Never made progress or ticked, so measured from when it started
+            idle_state = states['IdleService'][0]
+            self.assertIsNone(idle_state.progress_at)
+            self.assertIsNone(idle_state.tick_at)
+            self.assertAlmostEqual(idle_state.tick_age, now() - idle.started_at, delta=1)
+        finally:
+            heartbeat.stop()
+            idle.stop()
+        # Stopped workers remove their rows, the rest stay
+        states = Heartbeat.read_all(self.postgres, table)
+        self.assertEqual([state.worker for state in states['TestService']], ['otherhost:1'])
+        self.assertNotIn('IdleService', states)
+        other.stop()
+        # A row left behind by a crashed worker expires once old enough
+        other.publish()
+        self.assertEqual(Heartbeat.expire(self.postgres, 60, table), 0)
+        sleep(1)
+        self.assertEqual(Heartbeat.expire(self.postgres, 0.5, table), 1)
+        self.assertEqual(Heartbeat.read_all(self.postgres, table), {})
+        # Ages come out right whatever the session's time zone
+        with self.postgres.transaction():
+            self.postgres.query("SET LOCAL TimeZone = 'Pacific/Auckland'", False)
+            other.publish()
+            state = Heartbeat.read_all(self.postgres, table)['TestService'][0]
+            self.postgres.query(f'DELETE FROM {table}', False)
+        self.assertLess(abs(state.beat_age), 1)
+        self.assertAlmostEqual(state.started_at, other.started_at, delta=1)
+
+    def test_read_replica_routing(self):
+        # The primary stands in for the replica, under its own DSN & pool
+        read_dsn = f'{self.postgres.pool.dsn} application_name=olympus_read'
+        postgres = PostgresTesting(constants.POSTGRES_TEST_TICKER_TABLE, constants.POSTGRES_TEST_ORDER_TABLE, constants.POSTGRES_TEST_PREDICTION_TABLE, read_dsn=read_dsn)
+        postgres.discord = MockDiscord('Postgres')
+        postgres.insert_ticker(utils.get_basic_ticker())
+        self.assertEqual(postgres.get_ticker_count(), 1)
+        read_pool = PostgresPool.shared(read_dsn)
+        primary_checkouts, read_checkouts = postgres.pool_stats['checkouts'], read_pool.stats['checkouts']
+        postgres.get_ticker_count()
+        postgres.get_order_queue_stats()
+        postgres.get_latest_tickers(1)
+        self.assertEqual(read_pool.stats['checkouts'] - read_checkouts, 2)
+        self.assertEqual(postgres.pool_stats['checkouts'] - primary_checkouts, 1)
+        # Reads inside a transaction see its writes, so they stay on the primary
+        with postgres.transaction():
+            postgres.insert_ticker(utils.get_basic_ticker(timestamp=123456790))
+            self.assertEqual(postgres.get_ticker_count(), 2)
+        self.assertEqual(read_pool.stats['checkouts'] - read_checkouts, 2)
+        read_pool.close()
+        # An unreachable replica falls back to the primary, and is left alone for a while
+        postgres.read_dsn = 'host=127.0.0.1 port=1 connect_timeout=1'
+        self.assertEqual(postgres.get_ticker_count(), 2)
+        self.assertAlmostEqual(postgres.read_replica_failed_at, now(), delta=3)
+        failed_at = postgres.read_replica_failed_at
+        self.assertEqual(postgres.get_ticker_count(), 2)
+        self.assertEqual(postgres.read_replica_failed_at, failed_at)
+
+    def test_read_replica_blank_dsn(self):
+        # .env.example leaves POSTGRES_READ_DSN blank, which means no replica, not one at libpq's default DSN
+        with patch.dict(os.environ, {'POSTGRES_READ_DSN': ' '}):
+            self.assertIsNone(env.postgres_read_dsn)
+            postgres = PostgresTesting(constants.POSTGRES_TEST_TICKER_TABLE, constants.POSTGRES_TEST_ORDER_TABLE, constants.POSTGRES_TEST_PREDICTION_TABLE)
+        postgres.discord = MockDiscord('Postgres')
+        self.assertIsNone(postgres.read_dsn)
+        checkouts = postgres.pool_stats['checkouts']
+        postgres.get_ticker_count()
+        self.assertEqual(postgres.pool_stats['checkouts'] - checkouts, 1)
+        self.assertEqual(postgres.read_replica_failed_at, 0)
+
+    @skipUnless(env.postgres_read_dsn, 'needs a streaming replica of the test database in POSTGRES_READ_DSN')
+    def test_read_replica_streaming(self):
+        postgres = PostgresTesting(constants.POSTGRES_TEST_TICKER_TABLE, constants.POSTGRES_TEST_ORDER_TABLE, constants.POSTGRES_TEST_PREDICTION_TABLE)
+        postgres.discord = MockDiscord('Postgres')
+        self.assertTrue(postgres._query('SELECT pg_is_in_recovery()', True, replica=True)[0][0])
+        postgres.insert_tickers_bulk([utils.get_basic_ticker(timestamp=123456789 + i) for i in range(5)])
+        deadline = now() + 10
+        while postgres.get_ticker_count() != 5 and now() < deadline:
+            sleep(0.1)
+        self.assertEqual(postgres.get_ticker_count(), 5)
+        self.assertEqual(postgres.read_replica_failed_at, 0)
+
+    def test_copy_to(self):
+        tickers = [utils.get_basic_ticker(timestamp=1650000000 + 60 * i) for i in range(10)]
+        self.postgres.insert_tickers_bulk(tickers)
+        self.postgres.update_candles(tickers)
+        file = StringIO()
+        self.assertEqual(self.postgres.copy_to(file, self.postgres.statements.select_latest_tickers, (3,)), 3)
+        self.assertEqual(len(file.getvalue().splitlines()), 4)
+        for interval, row_count in [('raw', 10), ('5m', 2), ('600', 1)]:
+            file = StringIO()
+            query, params = training_query(self.postgres, interval, 1650000000, 1650000600)
+            self.assertEqual(self.postgres.copy_to(file, query, params), row_count)
+            lines = file.getvalue().splitlines()
+            self.assertEqual(lines[0], 'timestamp,price')
+            timestamp, price = lines[-1].split(',')
+            self.assertEqual((int(timestamp), float(price)), (1650000000 + 600 - 600 // row_count, tickers[-1].ask))
+
+    def test_ticker_archive(self):
+        day = 1650067200 # 2022-04-16 UTC
+        archived = [utils.get_basic_ticker(timestamp=day + 3600 * i) for i in range(30)]
+        live = [utils.get_basic_ticker(timestamp=int(now()) - 60 * i) for i in range(3, 0, -1)]
+        self.postgres.insert_tickers_bulk(archived + live)
+        with TemporaryDirectory() as path:
+            archive = TickerArchive(self.postgres, path=path)
+            self.assertEqual(archive.archive(archive_days=None), [])
+            written = archive.archive(archive_days=1)
+            self.assertEqual(len(written), 2)
+            self.assertTrue(written[0].endswith(os.path.join('date=2022-04-16', f'{day}-{day + 23 * 3600}.parquet')))
+            self.assertEqual(archive.days(), [day, day + 86400])
+            self.assertEqual(self.postgres.get_ticker_count(), 3)
+            # Nothing left to move
+            self.assertEqual(archive.archive(archive_days=1), [])
+            tickers = archive.get_tickers(0, int(now()) + 60, columns=['ask', 'volume'])
+            self.assertEqual(list(tickers['timestamp']), [ticker.timestamp for ticker in archived + live])
+            self.assertEqual(tickers['ask'][0], archived[0].ask)
+            self.assertEqual(tickers['volume'][-1], float(live[-1].volume))
+            self.assertEqual(len(archive.get_tickers(day + 3600, day + 7200)), 1)
+            output_path = os.path.join(path, 'training.csv')
+            self.assertEqual(export_training_data(self.postgres, output_path, 'raw', day, int(now()) + 60, archive=archive), 33)
+            with open(output_path) as file:
+                lines = file.read().splitlines()
+            self.assertEqual(lines[0], 'timestamp,price')
+            self.assertEqual([int(line.split(',')[0]) for line in lines[1:]], [ticker.timestamp for ticker in archived + live])
+
+    def test_query_metrics(self):
+        metrics = self.postgres.query_metrics
+        metrics.reset()
+        metrics.enabled = True
+        metrics.slow_threshold_ms = 0
+        try:
+            self.postgres.insert_tickers_bulk([utils.get_basic_ticker(timestamp=123456789 + i) for i in range(5)])
+            self.postgres.get_latest_tickers(3)
+            self.postgres.get_latest_tickers(3)
+            with self.assertRaises(Exception):
+                self.postgres.query('SELECT * FROM missing_table', fetch_result=True)
+            # 3 attempts, so 2 retries. The connection survives the error, so they reuse it rather than reconnect
+            self.assertEqual((metrics.stats['retries'], metrics.stats['reconnects']), (2, 0))
+            # Each attempt kills its own connection, so the pool replaces it before each retry
+            with self.assertRaises(Exception):
+                self.postgres.query('SELECT pg_terminate_backend(pg_backend_pid())', fetch_result=True)
+        finally:
+            metrics.enabled = False
+            metrics.slow_threshold_ms = PostgresConfig.QUERY_SLOW_THRESHOLD_MS
+        stats = metrics.stats
+        self.assertEqual((stats['retries'], stats['reconnects']), (4, 2))
+        inserts = stats['statements'][f'INSERT {constants.POSTGRES_TEST_TICKER_TABLE}']
+        self.assertEqual((inserts['calls'], inserts['rows'], inserts['slow']), (1, 5, 1))
+        selects = stats['statements']['select_latest_tickers']
+        self.assertEqual((selects['calls'], selects['rows']), (2, 6))
+        self.assertEqual(sum(selects['buckets'].values()), 2)
+        self.assertLessEqual(selects['p50_ms'], selects['max_ms'])
+        self.assertEqual(stats['statements']['SELECT missing_table']['errors'], 3)
+        self.assertIn('select_latest_tickers: 2 calls', metrics.summary())
+        self.assertEqual(label_for_sql('CREATE TABLE IF NOT EXISTS ticker_feed_p20220501 PARTITION OF ticker_feed'), 'CREATE ticker_feed_p20220501')
+        metrics.reset()
+
+    def test_query_metrics_summary_once(self):
+        metrics = PostgresQueryMetrics(enabled=True, summary_interval=60)
+        metrics.last_summary = now() - 120
+        with self.assertLogs(metrics.log, 'INFO') as logs:
+            threads = [Thread(target=metrics.record, args=('select_latest_tickers', 'SELECT 1', 1.0, 1)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # Every thread found the summary due, only one logged it
+        self.assertEqual(len([line for line in logs.output if 'Postgres queries' in line]), 1)
+        self.assertEqual(metrics.stats['statements']['select_latest_tickers']['calls'], 8)
+
+    def test_transaction_commits_together(self):
+        order = utils.get_basic_order()
+        prediction = utils.get_basic_prediction()
+        self.postgres.insert_prediction_vector(prediction)
+        seen_from_other_thread = []
+        def count_queued():
+            seen_from_other_thread.append((len(self.postgres.get_queued_orders()), len(self.postgres.get_queued_predictions())))
+        with self.postgres.transaction():
+            self.postgres.insert_order(order, 0.0, 0.0, 0.0)
+            self.postgres.update_prediction_status(prediction.uuid, 'COMPLETE')
+            # Nested blocks join the outer transaction
+            with self.postgres.transaction():
+                self.assertEqual(len(self.postgres.get_queued_orders()), 1)
+            thread = Thread(target=count_queued)
+            thread.start()
+            thread.join()
+        self.assertEqual(seen_from_other_thread, [(0, 1)])
+        self.assertEqual(len(self.postgres.get_queued_orders()), 1)
+        self.assertEqual(len(self.postgres.get_queued_predictions()), 0)
+        self.assertEqual(self.postgres.pool_stats['in_use'], 0)
+
+    def test_transaction_rolls_back(self):
+        order = utils.get_basic_order()
+        with self.assertRaises(ValueError):
+            with self.postgres.transaction():
+                self.postgres.insert_order(order, 0.0, 0.0, 0.0)
+                raise ValueError('abort')
+        self.assertFalse(self.postgres.has_order(order.uuid))
+        # A failed statement aborts the transaction instead of being retried
+        with self.assertRaises(Exception):
+            with self.postgres.transaction():
+                self.postgres.insert_order(order, 0.0, 0.0, 0.0)
+                self.postgres.query('SELECT * FROM missing_table', fetch_result=True)
+        self.assertFalse(self.postgres.has_order(order.uuid))
+        with self.postgres.pool.connection() as conn:
+            self.assertTrue(conn.autocommit)
+
+    def test_ticker_partitions(self):
+        table = f'{constants.POSTGRES_TEST_TICKER_TABLE}_partitioned'
+        self.postgres.query(f'CREATE TABLE {table} (LIKE {constants.POSTGRES_TEST_TICKER_TABLE} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)', False)
+        try:
+            partitions = TickerPartitions(PostgresTesting(ticker_table_override=table), interval='month', premake=1)
+            old = int(now()) - 100 * 86400
+            # The bounds are UTC, whatever the local time zone
+            with patch.dict(os.environ, {'TZ': 'America/New_York'}):
+                tzset()
+                created = partitions.ensure(old)
+            tzset()
+            self.assertEqual(len(created), 2)
+            newest = [partition for partition in partitions.list() if partition.end][-1]
+            self.assertEqual(partitions.covered_until, timegm(newest.end.timetuple()) - 28 * 86400)
+            # Picks up from the newest partition, so there are no gaps up to the current month
+            self.assertGreaterEqual(len(partitions.ensure()), 2)
+            self.assertEqual(partitions.ensure(), [])
+            ranges = [(partition.start, partition.end) for partition in partitions.list()]
+            self.assertTrue(all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:])))
+            partitions.postgres.insert_ticker(utils.get_basic_ticker(timestamp=old))
+            self.assertEqual(partitions.apply_retention(retention_days=None), [])
+            removed = partitions.apply_retention(retention_days=40, drop=True)
+            self.assertIn(created[0], removed)
+            self.assertNotIn(created[0], [partition.name for partition in partitions.list()])
+            self.assertEqual(partitions.postgres.get_ticker_count(), 0)
+            # Testing tables are built from the same migrations, so they're partitioned too
+            testing_partitions = TickerPartitions(self.postgres)
+            self.assertTrue(testing_partitions.is_partitioned())
+            testing_partitions.ensure()
+            self.assertEqual(TickerPartitions(self.postgres).ensure(), [])
+        finally:
+            self.postgres.query(f'DROP TABLE {table}', False)
+
+    def test_prediction_queue_blocking_get(self):
+        queue = PredictionQueueDB(override_postgres=self.postgres)
+        queue.poll_interval = 30
+        self.assertIsNone(queue.get(timeout=0.2))
+        prediction = utils.get_basic_prediction()
+        Thread(target=lambda: (sleep(0.5), queue.put(prediction))).start()
+        start = now()
+        result = queue.get(timeout=10)
+        # Woken by the NOTIFY, well before the 30 second safety poll
+        self.assertLess(now() - start, 5)
+        self.assertEqual(result.uuid, prediction.uuid)
+        self.assertIsNone(queue.get())
+        queue.stop_listening()
+
+    def test_claim_queued_prediction_concurrently(self):
+        predictions = [utils.get_basic_prediction() for i in range(20)]
+        for prediction in predictions:
+            self.postgres.insert_prediction_vector(prediction)
+        claimed = []
+        def claim_all():
+            queue = PredictionQueueDB(override_postgres=self.postgres)
+            while True:
+                prediction = queue.get()
+                if prediction is None:
+                    return
+                claimed.append(prediction.uuid)
+        threads = [Thread(target=claim_all) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every prediction handed out exactly once
+        self.assertEqual(sorted(claimed), sorted(prediction.uuid for prediction in predictions))
+        self.assertEqual(self.postgres.get_queued_predictions(), [])
+
+    def test_requeue_expired_predictions(self):
+        prediction = utils.get_basic_prediction()
+        self.postgres.insert_prediction_vector(prediction)
+        self.assertEqual(self.postgres.claim_queued_prediction().uuid, prediction.uuid)
+        self.assertEqual(self.postgres.requeue_expired_predictions(visibility_timeout=60, max_claims=2), [])
+        expire = f"UPDATE {constants.POSTGRES_TEST_PREDICTION_TABLE} SET claimed_at = NOW() - INTERVAL '2 minutes'"
+        self.postgres.query(expire, False)
+        self.assertEqual(self.postgres.requeue_expired_predictions(visibility_timeout=60, max_claims=2), [(prediction.uuid, 'QUEUED')])
+        self.assertEqual(self.postgres.claim_queued_prediction().uuid, prediction.uuid)
+        self.postgres.query(expire, False)
+        # Second claim was the last allowed
+        self.assertEqual(self.postgres.requeue_expired_predictions(visibility_timeout=60, max_claims=2), [(prediction.uuid, 'FAILED')])
+        self.assertIsNone(self.postgres.claim_queued_prediction())
+
+    def test_prediction_queue_depth_and_peek(self):
+        queue = PredictionQueueDB(override_postgres=self.postgres)
+        self.assertEqual(queue.depth(), 0)
+        self.assertIsNone(queue.oldest_age())
+        self.assertEqual(queue.peek(), [])
+        predictions = [utils.get_basic_prediction() for i in range(3)]
+        for prediction in predictions:
+            queue.put(prediction)
+        self.assertEqual(queue.depth(), 3)
+        self.assertEqual(queue.size, 3)
+        self.assertAlmostEqual(queue.oldest_age(), 0, delta=3)
+        uuids = [prediction.uuid for prediction in predictions]
+        self.assertEqual(len(queue.peek(2)), 2)
+        self.assertIn(self.postgres.get_prediction_queue_stats().newest_uuid, uuids)
+        # Peeking doesn't claim anything, the next get() hands out the same prediction
+        next_uuid = queue.peek()[0].uuid
+        self.assertEqual(queue.get().uuid, next_uuid)
+        self.assertEqual(queue.depth(), 2)
+        self.assertEqual(self.postgres.get_order_queue_stats().depth, 0)
+
+    def record_order(self, side: str, quantity: float) -> None:
+        # As Hermes records an order: size it from the locked run, then store the order & the run it leaves together
+        order = Order.create(quantity, side, 'BTCUSD', uuid=uuid.uuid4().hex)
+        with self.postgres.transaction():
+            run = self.postgres.get_order_run(lock=True)
+            self.postgres.insert_order(order, 0.0, 0.0, 0.0)
+            run.add(order.side, order.quantity)
+            self.postgres.update_order_run(run)
+
+    def test_get_order_run_locked(self):
+        # A second worker sizing an order waits for the first to commit its order, then sees it in the run
+        runs = []
+        def size_order():
+            with self.postgres.transaction():
+                runs.append(self.postgres.get_order_run(lock=True))
+        with self.postgres.transaction():
+            run = self.postgres.get_order_run(lock=True)
+            self.assertIsNone(run.side)
+            worker = Thread(target=size_order)
+            worker.start()
+            sleep(0.5)
+            self.assertEqual(runs, [])
+            run.add('buy', 1.0)
+            self.postgres.update_order_run(run)
+        worker.join(timeout=5)
+        self.assertEqual((runs[0].side, runs[0].count), ('buy', 1))
+
+    def test_get_order_run(self):
+        self.assertIsNone(self.postgres.get_order_run().side)
+        sides = ['buy', 'buy', 'sell'] + ['buy'] * 14
+        for i, side in enumerate(sides):
+            self.record_order(side, 0.01 * (i + 1))
+            if i == 1:
+                self.assertEqual(self.postgres.get_order_run().count, 2)
+        run = self.postgres.get_order_run()
+        self.assertEqual((run.side, run.count), ('buy', 14))
+        # Only the first orders of the run are kept, as many as a reversal sums
+        self.assertEqual(len(run.quantities), TradingConfig.ORDER_RUN_SUM_LIMIT + 1)
+        self.assertTrue(run.reverses('sell'))
+        self.assertFalse(run.reverses('buy'))
+        # Orders 2-11 of the run (the 5th-14th orders overall)
+        self.assertAlmostEqual(run.reversal_quantity, sum(0.01 * (i + 1) for i in range(4, 14)))
+        self.assertEqual(len(self.postgres.get_all_orders()), len(sides))
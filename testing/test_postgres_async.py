@@ -0,0 +1,101 @@
+import asyncio
+from time import time as now
+from unittest import IsolatedAsyncioTestCase
+
+from mock import MockDiscord
+import testing.config as constants
+from testing import utils
+from olympus.helper_objects.order_run import OrderRun
+from olympus.helper_objects.ticker_batch import TickerBatch
+from utils.postgres_async import AsyncPostgres
+
+
+class TestAsyncPostgres(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.postgres = AsyncPostgres(
+            ticker_table_override=constants.POSTGRES_TEST_TICKER_TABLE,
+            order_table_override=constants.POSTGRES_TEST_ORDER_TABLE,
+            prediction_table_override=constants.POSTGRES_TEST_PREDICTION_TABLE
+        )
+        self.postgres.discord = MockDiscord('AsyncPostgres')
+        await self.postgres.connect()
+        await self.clear_tables()
+
+    async def asyncTearDown(self):
+        await self.clear_tables()
+        await self.postgres.close()
+
+    async def clear_tables(self):
+        await self.postgres._query(f'DELETE FROM {constants.POSTGRES_TEST_ORDER_TABLE}', False)
+        await self.postgres._query(f'DELETE FROM {constants.POSTGRES_TEST_PREDICTION_TABLE}', False)
+        await self.postgres._query(f'DELETE FROM {constants.POSTGRES_TEST_TICKER_TABLE}', False)
+        await self.postgres._query(f'DELETE FROM {self.postgres.candle_table_name}', False)
+        await self.postgres.update_order_run(OrderRun())
+
+    async def test_insert_and_get_tickers(self):
+        ticker = utils.get_basic_ticker()
+        await self.postgres.insert_ticker(ticker)
+        await self.postgres.insert_tickers_bulk([utils.get_basic_ticker(timestamp=ticker.timestamp + i) for i in range(1, 10)])
+        rows = await self.postgres.get_latest_tickers(5)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[-1].timestamp, ticker.timestamp + 9)
+        self.assertEqual(rows[-1].ask, ticker.ask)
+        self.assertEqual(await self.postgres.get_ticker_count(), 10)
+        array = await self.postgres.get_latest_tickers_array(3, columns=['ask'])
+        self.assertEqual(list(array['timestamp']), [ticker.timestamp + i for i in range(7, 10)])
+        # A TickerBatch goes in as column arrays, as with the blocking client
+        batch = TickerBatch.from_columns([ticker.timestamp + i for i in range(10, 15)], ask=[2.0] * 5, volume=[4.0] * 5)
+        async with self.postgres.transaction():
+            await self.postgres.insert_tickers_bulk(batch)
+            await self.postgres.update_candles(batch)
+        self.assertEqual(await self.postgres.get_ticker_count(), 15)
+        self.assertEqual((await self.postgres.get_latest_tickers(1))[0].ask, 2.0)
+
+    async def test_candles(self):
+        tickers = [utils.get_basic_ticker(timestamp=1650000000 + 60 * i) for i in range(10)]
+        await self.postgres.update_candles(tickers)
+        candles = await self.postgres.get_candles('5m', 1650000000, 1650000600)
+        self.assertEqual([candle.ticker_count for candle in candles], [5, 5])
+        self.assertEqual(candles[0].close, tickers[0].ask)
+
+    async def test_transaction(self):
+        tickers = [utils.get_basic_ticker(timestamp=1650000000 + i) for i in range(3)]
+        async with self.postgres.transaction():
+            await self.postgres.insert_tickers_bulk(tickers)
+            async with self.postgres.transaction():
+                await self.postgres.update_candles(tickers)
+        self.assertEqual(await self.postgres.get_ticker_count(), 3)
+        with self.assertRaises(Exception):
+            async with self.postgres.transaction():
+                await self.postgres.insert_ticker(utils.get_basic_ticker(timestamp=1650000100))
+                await self.postgres._query('SELECT * FROM missing_table', True)
+        # Rolled back together, & the connection went back to the pool
+        self.assertEqual(await self.postgres.get_ticker_count(), 3)
+        self.assertEqual(len(await self.postgres.get_candles('1m', 0, 2 ** 31)), 1)
+
+    async def test_order_status(self):
+        order = utils.get_basic_order()
+        await self.postgres.insert_order(order, 0.0, 0.0, 0.0)
+        rows = await self.postgres.get_queued_orders()
+        self.assertEqual(len(rows), 1)
+        self.assertAlmostEqual(rows[0].timestamp, int(now()), delta=3)
+        self.assertEqual((await self.postgres.get_order_queue_stats()).newest_uuid, order.uuid)
+        await self.postgres.update_order_status(order.uuid, 'COMPLETE')
+        self.assertEqual(await self.postgres.get_queued_orders(), [])
+        self.assertTrue(await self.postgres.has_order(order.uuid))
+        async with self.postgres.transaction():
+            run = await self.postgres.get_order_run(lock=True)
+            run.add(order.side, order.quantity)
+            await self.postgres.update_order_run(run)
+        self.assertEqual((await self.postgres.get_order_run()).side, order.side)
+
+    async def test_claim_prediction(self):
+        prediction = utils.get_basic_prediction()
+        await self.postgres.insert_prediction_vector(prediction)
+        claimed = await asyncio.gather(*[self.postgres.claim_queued_prediction() for i in range(3)])
+        # Only one of the concurrent claims gets the prediction
+        claimed = [row for row in claimed if row]
+        self.assertEqual([row.uuid for row in claimed], [prediction.uuid])
+        self.assertEqual(claimed[0].prediction_history, [float(value) for value in prediction.prediction_history])
+        self.assertEqual((await self.postgres.get_prediction_queue_stats()).depth, 0)
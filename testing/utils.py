@@ -5,12 +5,18 @@ import os
 import uuid
 from crosstower.models import Ticker, Order
 from olympus.helper_objects import PredictionVector
+from olympus.helper_objects.order_run import OrderRun
 from utils import Postgres
+from utils.config import CrosstowerConfig
+from utils.migrations import PostgresMigrations
 import testing.config as constants
 from mock.mock_discord import MockDiscord
 
 class PostgresTesting(Postgres):
 
+    # Set once the testing tables are migrated, in this process
+    migrated = False
+
     # Expose query method for testing
     def query(self, query_str: str, fetch_result: bool):
         return self._query(query_str, fetch_result)
@@ -19,6 +25,8 @@ class PostgresTesting(Postgres):
         self._query(f'DELETE FROM {constants.POSTGRES_TEST_ORDER_TABLE}', fetch_result=False)
         self._query(f'DELETE FROM {constants.POSTGRES_TEST_PREDICTION_TABLE}', fetch_result=False)
         self._query(f'DELETE FROM {constants.POSTGRES_TEST_TICKER_TABLE}', fetch_result=False)
+        self._query(f'DELETE FROM {self.candle_table_name}', fetch_result=False)
+        self.update_order_run(OrderRun())
     
     @classmethod
     def setUp(cls):
@@ -28,6 +36,10 @@ class PostgresTesting(Postgres):
             prediction_table_override=constants.POSTGRES_TEST_PREDICTION_TABLE
         )
         postgres.discord = MockDiscord('Postgres')
+        if not PostgresTesting.migrated:
+            # Creates the testing tables, or brings them up to date, from the same history as production
+            PostgresMigrations(override_postgres=postgres, table_names=constants.POSTGRES_TEST_TABLE_NAMES).apply()
+            PostgresTesting.migrated = True
         # Clear any possible leftover data
         postgres.tearDown()
         return postgres
@@ -81,10 +93,10 @@ def save_dict_to_json(dict: dict, file_name: str):
     with open(file_name, 'w') as f:
         json.dump(dict, f)
 
-def get_basic_ticker() -> Ticker:
+def get_basic_ticker(timestamp: int = 123456789, symbol: str = CrosstowerConfig.DEFAULT_SYMBOL) -> Ticker:
     return Ticker({
-        'symbol': 'BTCUSD',
-        't': 123456789,
+        'symbol': symbol,
+        't': timestamp,
         'b': '1',
         'a': '2',
         'c': '3',
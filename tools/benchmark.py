@@ -0,0 +1,367 @@
+import json
+import sys
+import tracemalloc
+import uuid
+from statistics import mean, median
+from time import perf_counter
+from typing import Callable, List
+
+import crosstower.socket_api.utils as socket_utils
+from crosstower.models import Order, Ticker
+from crosstower.socket_api.public import parse_tickers
+from olympus.helper_objects import PredictionVector
+from utils import Postgres
+from utils.config import PostgresConfig
+from utils.migrations import PostgresMigrations
+from utils.postgres import PostgresOrder, PostgresTicker
+
+"""
+Benchmark
+
+Measure the latency of hot-path Postgres operations. Runs against the testing tables, which are emptied afterwards.
+
+`$ python -m tools.benchmark <mode> <iterations>`
+
+<mode>
+    --statements : Per-call latency of insert_ticker and update_order_status,
+                   comparing inline f-string SQL (planned on every call) against
+                   server-side prepared statements with bound parameters
+    --fetch      : Latency of reading the newest tickers, comparing get_latest_tickers
+                   (a PostgresTicker per row) against get_latest_tickers_array (NumPy)
+    --transactions : Latency of the writes Hermes makes for one order (insert_order, closing the
+                   prediction, two update_order_status) and of a single read, comparing a
+                   transaction & explicit COMMIT per statement against autocommit, and the
+                   writes grouped under one `postgres.transaction()`
+    --memory     : Memory held by 1M PostgresTicker & 100k PostgresOrder rows, comparing
+                   dict-backed rows (with an eager csv_line) against the slotted row types.
+                   <iterations> is ignored.
+    --decode     : Time to decode one ticker/1s/batch websocket frame of DECODE_SYMBOL_COUNT symbols & read every
+                   field of each ticker, comparing json with dict-backed Tickers against parse_tickers, with the
+                   json module and with orjson (if installed). Doesn't touch Postgres.
+
+<iterations> : int
+    Number of calls to time for each case. Defaults to 1000.
+
+Compare 5000 inline vs. prepared inserts & updates
+`$ python -m tools.benchmark --statements 5000`
+"""
+
+FETCH_ROW_COUNTS = [100, 1000, 10000]
+'''Number of tickers read per call in --fetch mode'''
+
+MEMORY_TICKER_COUNT = 1000000
+'''Number of tickers loaded in --memory mode'''
+
+MEMORY_ORDER_COUNT = 100000
+'''Number of orders loaded in --memory mode'''
+
+DECODE_SYMBOL_COUNT = 20
+'''Number of symbols in each frame decoded in --decode mode'''
+
+# Same tables as testing/config.py, which can't be imported without loading every test module
+TICKER_TABLE = '_ticker_feed_testing'
+ORDER_TABLE = '_order_feed_testing'
+PREDICTION_TABLE = '_prediction_feed_testing'
+TABLE_NAMES = {
+    'ticker_feed': TICKER_TABLE,
+    'order_feed': ORDER_TABLE,
+    'prediction_feed': PREDICTION_TABLE,
+    'service_heartbeats': '_service_heartbeats_testing',
+    'schema_migrations': '_schema_migrations_testing',
+}
+
+
+class DictTicker:
+    '''PostgresTicker as it was before __slots__, for comparison'''
+
+    def __init__(self, data: tuple) -> None:
+        self.timestamp = int(data[0])
+        self.ask, self.bid, self.last, self.low, self.high, self.open, self.volume, self.volume_quote = [float(value) for value in data[1:9]]
+        self.csv_line = f"{self.ask},{self.bid},{self.last},{self.low},{self.high},{self.open},{self.volume},{self.volume_quote},{self.timestamp}\n"
+
+
+class DictTickerModel:
+    '''crosstower.models.Ticker as it was before parsing its fields up front, for comparison'''
+
+    def __init__(self, data: dict) -> None:
+        self._data = data
+
+    @property
+    def csv_line(self) -> str:
+        return f"{self.ask},{self.bid},{self.last},{self.low},{self.high},{self.open},{self.volume},{self.volume_quote},{self.timestamp}\n"
+
+    @property
+    def symbol(self) -> str:
+        return self._data.get('symbol')
+
+    @property
+    def ask(self) -> float:
+        return float(self._data.get('a'))
+
+    @property
+    def bid(self) -> float:
+        return float(self._data.get('b'))
+
+    @property
+    def last(self) -> float:
+        return self._data.get('c')
+
+    @property
+    def open(self) -> float:
+        return self._data.get('o')
+
+    @property
+    def high(self) -> float:
+        return self._data.get('h')
+
+    @property
+    def low(self) -> float:
+        return self._data.get('l')
+
+    @property
+    def volume(self) -> float:
+        return self._data.get('v')
+
+    @property
+    def volume_quote(self) -> float:
+        return self._data.get('q')
+
+    @property
+    def timestamp(self) -> int:
+        epoch = int(self._data.get('t'))
+        if epoch > 2147483647:
+            epoch = int(epoch/1000)
+        return epoch
+
+
+class DictOrder:
+    '''PostgresOrder as it was before __slots__, for comparison'''
+
+    def __init__(self, data: tuple) -> None:
+        self.timestamp = int(data[0])
+        self.quantity = float(data[1])
+        self.side = str(data[2])
+        self.status = str(data[3])
+        self.uuid = str(data[4])
+        self.usd_balance = float(data[5])
+        self.btc_balance = float(data[6])
+        self.current_price = float(data[7])
+
+
+def sample_ticker(timestamp: int = 1650000000) -> Ticker:
+    return Ticker({'symbol': 'BTCUSD', 't': timestamp, 'a': '40001.5', 'b': '40000.5', 'c': '40001.0',
+                   'l': '39000.0', 'h': '41000.0', 'o': '39500.0', 'v': '1234.5', 'q': '49380000.0'})
+
+
+def sample_order() -> Order:
+    return Order.create(0.01, 'buy', 'BTCUSD', uuid=uuid.uuid4().hex)
+
+
+def time_calls(label: str, call: Callable[[int], None], iterations: int) -> List[float]:
+    # Warm up, so connection setup & the first PREPARE aren't counted
+    call(0)
+    timings = []
+    for i in range(iterations):
+        start = perf_counter()
+        call(i)
+        timings.append((perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<40} mean: {mean(timings):.3f}ms   median: {median(timings):.3f}ms   p95: {p95:.3f}ms")
+    return timings
+
+
+def print_speedup(before: List[float], after: List[float]):
+    print(f"{'':<40} median latency change: {(median(after) - median(before)) / median(before) * 100:+.1f}%\n")
+
+
+def benchmark_statements(postgres: Postgres, iterations: int):
+    ticker = sample_ticker()
+    order = sample_order()
+    postgres.insert_order(order, 0.0, 0.0, 0.0)
+
+    def inline_insert_ticker(i: int):
+        postgres._query(f"""INSERT INTO {postgres.ticker_table_name} {PostgresConfig.TICKER_COLUMNS}
+        VALUES (TO_TIMESTAMP({ticker.timestamp + i}), {ticker.ask}, {ticker.bid}, {ticker.last}, {ticker.low}, {ticker.high}, {ticker.open}, {ticker.volume}, {ticker.volume_quote}, '{postgres.symbol}')""", False)
+
+    def inline_update_order_status(i: int):
+        status = PostgresConfig.ALLOWED_STATUSES[i % len(PostgresConfig.ALLOWED_STATUSES)]
+        postgres._query(f"""UPDATE {postgres.order_table_name} SET status = '{status}' WHERE uuid = '{order.uuid}'""", False)
+
+    # Go through _query directly in both cases, so the per-call debug logging in the public methods isn't measured
+    def prepared_insert_ticker(i: int):
+        params = (ticker.timestamp + i, ticker.ask, ticker.bid, ticker.last, ticker.low, ticker.high, ticker.open, ticker.volume, ticker.volume_quote, postgres.symbol)
+        postgres._query(postgres.statements.insert_ticker, False, params)
+
+    def prepared_update_order_status(i: int):
+        status = PostgresConfig.ALLOWED_STATUSES[i % len(PostgresConfig.ALLOWED_STATUSES)]
+        postgres._query(postgres.statements.update_order_status, False, (status, order.uuid))
+
+    before = time_calls('insert_ticker (inline SQL)', inline_insert_ticker, iterations)
+    after = time_calls('insert_ticker (prepared)', prepared_insert_ticker, iterations)
+    print_speedup(before, after)
+    before = time_calls('update_order_status (inline SQL)', inline_update_order_status, iterations)
+    after = time_calls('update_order_status (prepared)', prepared_update_order_status, iterations)
+    print_speedup(before, after)
+
+
+def benchmark_fetch(postgres: Postgres, iterations: int):
+    postgres.insert_tickers_bulk([sample_ticker(timestamp=1650000000 + i) for i in range(max(FETCH_ROW_COUNTS))])
+    for row_count in FETCH_ROW_COUNTS:
+        before = time_calls(f'get_latest_tickers ({row_count} rows)', lambda i: postgres.get_latest_tickers(row_count), iterations)
+        after = time_calls(f'get_latest_tickers_array ({row_count} rows)', lambda i: postgres.get_latest_tickers_array(row_count), iterations)
+        print_speedup(before, after)
+
+
+def benchmark_transactions(postgres: Postgres, iterations: int):
+    prediction = PredictionVector(0.5, [40000.0], 1650000000)
+    postgres.insert_prediction_vector(prediction)
+    postgres.insert_ticker(sample_ticker())
+
+    def order_writes(i: int) -> list:
+        order = sample_order()
+        return [
+            (postgres.statements.insert_order, (1650000000 + i, order.quantity, order.side, PostgresConfig.STATUS_QUEUED, order.uuid, 1000.0, 0.5, 40000.0)),
+            (postgres.statements.update_prediction_status, (PostgresConfig.STATUS_COMPLETE, prediction.uuid)),
+            (postgres.statements.update_order_status, (PostgresConfig.STATUS_PROCESSING, order.uuid)),
+            (postgres.statements.update_order_status, (PostgresConfig.STATUS_COMPLETE, order.uuid))
+        ]
+
+    # How every query used to run: BEGIN, the statement, then COMMIT
+    def commit_per_statement(i: int):
+        for statement, params in order_writes(i):
+            with postgres.transaction():
+                postgres._query(statement, False, params)
+
+    def autocommit(i: int):
+        for statement, params in order_writes(i):
+            postgres._query(statement, False, params)
+
+    def one_transaction(i: int):
+        with postgres.transaction():
+            for statement, params in order_writes(i):
+                postgres._query(statement, False, params)
+
+    def read_with_commit(i: int):
+        with postgres.transaction():
+            postgres._query(postgres.statements.select_latest_tickers, True, (1,))
+
+    def read_autocommit(i: int):
+        postgres._query(postgres.statements.select_latest_tickers, True, (1,))
+
+    before = time_calls('order writes (COMMIT per statement)', commit_per_statement, iterations)
+    after = time_calls('order writes (autocommit)', autocommit, iterations)
+    print_speedup(before, after)
+    after = time_calls('order writes (one transaction)', one_transaction, iterations)
+    print_speedup(before, after)
+    before = time_calls('select_latest_tickers (explicit COMMIT)', read_with_commit, iterations)
+    after = time_calls('select_latest_tickers (autocommit)', read_autocommit, iterations)
+    print_speedup(before, after)
+
+
+def measure_memory(label: str, row_type: type, rows: list) -> int:
+    tracemalloc.start()
+    objects = [row_type(row) for row in rows]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<40} {size / 1024 / 1024:.1f}MB   ({size / len(objects):.0f} bytes/row)")
+    del objects
+    return size
+
+
+def benchmark_memory(postgres: Postgres):
+    postgres._query(f"""INSERT INTO {postgres.ticker_table_name} {PostgresConfig.TICKER_COLUMNS}
+        SELECT TO_TIMESTAMP(1650000000 + i), 40001.5, 40000.5, 40001.0, 39000.0, 41000.0, 39500.0, 1234.5, 49380000.0, %s
+        FROM generate_series(1, %s) AS i""", False, (postgres.symbol, MEMORY_TICKER_COUNT))
+    postgres._query(f"""INSERT INTO {postgres.order_table_name} {PostgresConfig.ORDER_COLUMNS}
+        SELECT TO_TIMESTAMP(1650000000 + i), 0.01, 'buy', 'COMPLETE', md5(i::text), 1000.0, 0.5, 40000.0
+        FROM generate_series(1, %s) AS i""", False, (MEMORY_ORDER_COUNT,))
+    # Raw rows are fetched once up front, so only the row objects are measured
+    tickers = postgres._query(postgres.statements.select_latest_tickers, True, (MEMORY_TICKER_COUNT,))
+    orders = postgres._query(f"SELECT {PostgresConfig.ORDER_SELECT_COLUMNS} FROM {postgres.order_table_name}", True)
+    before = measure_memory(f'{len(tickers)} tickers (dict-backed)', DictTicker, tickers)
+    after = measure_memory(f'{len(tickers)} tickers (slotted)', PostgresTicker, tickers)
+    print(f"{'':<40} memory change: {(after - before) / before * 100:+.1f}%\n")
+    before = measure_memory(f'{len(orders)} orders (dict-backed)', DictOrder, orders)
+    after = measure_memory(f'{len(orders)} orders (slotted)', PostgresOrder, orders)
+    print(f"{'':<40} memory change: {(after - before) / before * 100:+.1f}%\n")
+
+
+def sample_frame(symbols: List[str]) -> str:
+    '''A ticker/1s/batch frame as the exchange sends it, timestamps in milliseconds'''
+    return json.dumps({'ch': 'ticker/1s/batch', 'data': {
+        symbol: {'t': 1650000000123, 'a': '40001.50', 'b': '40000.50', 'c': '40001.00', 'o': '39500.00', 'h': '41000.00',
+                 'l': '39000.00', 'v': '1234.56789', 'q': '49380000.12'} for symbol in symbols
+    }})
+
+
+def benchmark_decode(iterations: int):
+    symbols = [f'SYMBOL{i}USD_TR' for i in range(DECODE_SYMBOL_COUNT)]
+    frame = sample_frame(symbols)
+
+    # What the SQL ingest path reads: the interval filter, the insert parameters, and the candle prices
+    def read_fields(tickers: list):
+        for ticker in tickers:
+            (ticker.symbol, ticker.timestamp)
+            (ticker.timestamp, ticker.ask, ticker.bid, ticker.last, ticker.low, ticker.high, ticker.open, ticker.volume, ticker.volume_quote)
+            (ticker.timestamp, ticker.ask, ticker.volume)
+
+    def dict_backed(i: int):
+        data = json.loads(frame)['data']
+        read_fields([DictTickerModel({**data[symbol], 'symbol': symbol}) for symbol in symbols if data.get(symbol)])
+
+    def parsed_once(i: int):
+        read_fields(parse_tickers(frame, symbols))
+
+    before = time_calls(f'decode {DECODE_SYMBOL_COUNT} symbols (dict-backed)', dict_backed, iterations)
+    fast_json, socket_utils.orjson = socket_utils.orjson, None
+    try:
+        after = time_calls(f'decode {DECODE_SYMBOL_COUNT} symbols (slotted, json)', parsed_once, iterations)
+    finally:
+        socket_utils.orjson = fast_json
+    print_speedup(before, after)
+    if fast_json is None:
+        print('orjson is not installed, skipping the orjson case')
+        return
+    after = time_calls(f'decode {DECODE_SYMBOL_COUNT} symbols (slotted, orjson)', parsed_once, iterations)
+    print_speedup(before, after)
+
+
+def clear_testing_tables(postgres: Postgres):
+    postgres._query(f'DELETE FROM {postgres.order_table_name}', False)
+    postgres._query(f'DELETE FROM {postgres.prediction_table_name}', False)
+    postgres._query(f'DELETE FROM {postgres.ticker_table_name}', False)
+
+
+if __name__ == "__main__":
+    try:
+        mode = sys.argv[1]
+        iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    except:
+        print(sys.argv)
+        print("Bad args read docs!")
+        exit()
+    if mode == '--decode':
+        benchmark_decode(iterations)
+        exit()
+    postgres = Postgres(
+        ticker_table_override=TICKER_TABLE,
+        order_table_override=ORDER_TABLE,
+        prediction_table_override=PREDICTION_TABLE
+    )
+    # Creates the testing tables if no test has yet
+    PostgresMigrations(override_postgres=postgres, table_names=TABLE_NAMES).apply()
+    clear_testing_tables(postgres)
+    try:
+        if mode == '--statements':
+            benchmark_statements(postgres, iterations)
+        elif mode == '--fetch':
+            benchmark_fetch(postgres, iterations)
+        elif mode == '--transactions':
+            benchmark_transactions(postgres, iterations)
+        elif mode == '--memory':
+            benchmark_memory(postgres)
+        else:
+            print(f'Expected --statements, --fetch, --transactions, --memory or --decode, got "{mode}"')
+    finally:
+        clear_testing_tables(postgres)
@@ -0,0 +1,98 @@
+import sys
+from time import perf_counter
+from time import time as now
+
+import numpy as np
+
+from olympus.helper_objects.ticker_batch import TickerBatch
+from utils import Postgres
+from utils.archive import TickerArchive
+from utils.postgres import candle_resolution_seconds
+
+"""
+Export Training Data
+
+Stream ticker history straight out of Postgres into a training CSV, in the "timestamp,price" format
+read by Prometheus.intake_preprocess. Rows go from COPY to the file as they arrive, so any range
+can be exported without loading it into memory, and without a separate pass through filter_csv.py.
+
+`$ python -m tools.export_training_data <output_path> <interval> <start> <end>`
+
+<output_path> : str
+    File path of the output CSV. Will overwrite if already exists.
+
+<interval>
+    raw      : Every ticker, priced by its ask. Includes tickers moved to the Parquet archive (see utils/archive.py)
+    <period> : One row per candle, priced by the candle's close. Either seconds (ex. 900),
+               or a duration like 1m, 15m, 4h or 1d. Built from the candle rollups
+               (see Postgres.get_candles), so months of history stay cheap.
+
+<start> : int
+    Epoch seconds of the first row to export. Defaults to 0.
+
+<end> : int
+    Epoch seconds to stop at, exclusive. Defaults to now.
+
+Export the last 30 days as 5-minute closes
+`$ python -m tools.export_training_data training.csv 5m $(($(date +%s) - 2592000))`
+
+Export every ticker ever scraped
+`$ python -m tools.export_training_data training.csv raw`
+"""
+
+
+def training_query(postgres: Postgres, interval: str, start: int, end: int):
+    '''
+    The query & params for one export, selecting epoch "timestamp" and "price" columns oldest first
+    '''
+    if interval == 'raw':
+        return f"""SELECT FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint AS timestamp, ask AS price
+        FROM {postgres.ticker_table_name}
+        WHERE symbol = %s AND timestamp >= TO_TIMESTAMP(%s) AND timestamp < TO_TIMESTAMP(%s) AND ask IS NOT NULL
+        ORDER BY timestamp ASC""", (postgres.symbol, start, end)
+    resolution = int(interval) if interval.isdigit() else interval
+    statement, params = postgres.statements.select_candles_for(candle_resolution_seconds(resolution), start, end)
+    candle_sql, params = statement.inline_sql(params)
+    return f"""SELECT timestamp, close AS price
+        FROM ({candle_sql}) AS candles (timestamp, open, high, low, close, volume, ticker_count)
+        WHERE close IS NOT NULL ORDER BY timestamp ASC""", params
+
+
+def export_archived_tickers(file, archive: TickerArchive, start: int, end: int) -> int:
+    '''
+    Write the archived tickers in [start, end) as "timestamp,price" rows, one archived day at a time
+    '''
+    row_count = 0
+    for table in archive.read(start, end, ['ask']):
+        tickers = TickerBatch.from_columns(table.column('timestamp').to_numpy(), ask=table.column('ask').fill_null(np.nan).to_numpy())
+        row_count += tickers[~np.isnan(tickers['ask'])].to_csv(file, columns=['timestamp', 'ask'])
+    return row_count
+
+
+def export_training_data(postgres: Postgres, output_path: str, interval: str, start: int, end: int, archive: TickerArchive = None) -> int:
+    with open(output_path, 'w') as file:
+        if interval != 'raw':
+            query, params = training_query(postgres, interval, start, end)
+            return postgres.copy_to(file, query, params)
+        # Older tickers may have been archived, those are written first & the rest streamed from Postgres
+        archive = archive if archive is not None else TickerArchive(postgres)
+        live_start = archive.live_start(start, end)
+        file.write('timestamp,price\n')
+        row_count = export_archived_tickers(file, archive, start, live_start)
+        query, params = training_query(postgres, interval, live_start, end)
+        return row_count + postgres.copy_to(file, query, params, header=False)
+
+
+if __name__ == "__main__":
+    try:
+        output_path = sys.argv[1]
+        interval = sys.argv[2]
+        start = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        end = int(sys.argv[4]) if len(sys.argv) > 4 else int(now())
+    except:
+        print(sys.argv)
+        print("Bad args read docs!")
+        exit()
+    started = perf_counter()
+    row_count = export_training_data(Postgres(), output_path, interval, start, end)
+    print(f"Exported {row_count} rows to {output_path} in {perf_counter() - started:.1f}s")
@@ -0,0 +1,164 @@
+import os
+from datetime import datetime, timezone
+from time import time as now
+from typing import Iterable, Iterator, List
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import Logger, Postgres
+from utils.config import PostgresConfig
+from utils.postgres import ticker_array_dtype
+
+DAY_SECONDS = 86400
+
+
+class TickerArchive:
+
+    '''
+    Moves old tickers out of the ticker table into compressed Parquet files, partitioned by UTC day, and reads them back
+    merged with the tickers still in Postgres, so training & backtesting can query any range the same way.
+
+    Each day is deleted from Postgres in the same transaction that writes its file, so a failed write leaves the tickers in place.
+    Every symbol shares the day's files, reads only return the Postgres client's symbol.
+    Candles are never archived, so `Postgres.get_candles` keeps covering the whole history.
+    Run the archival job by hand with `python -m utils.archive`
+    '''
+
+    SCHEMA = pa.schema([('timestamp', pa.int64())] + [(column, pa.float64()) for column in PostgresConfig.TICKER_ARRAY_COLUMNS] + [('symbol', pa.string())])
+
+    def __init__(self, override_postgres: Postgres = None, path: str = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.postgres = override_postgres if override_postgres is not None else Postgres()
+        self.table = self.postgres.ticker_table_name
+        self.path = os.path.join(path if path else PostgresConfig.TICKER_ARCHIVE_PATH, self.table)
+
+    def days(self) -> List[int]:
+        '''
+        Epoch seconds at the start of every archived day, oldest first
+        '''
+        if not os.path.isdir(self.path):
+            return []
+        days = []
+        for name in os.listdir(self.path):
+            if name.startswith('date='):
+                day = datetime.strptime(name[len('date='):], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                days.append(int(day.timestamp()))
+        return sorted(days)
+
+    def day_path(self, day: int) -> str:
+        '''
+        Directory holding the files for the UTC day starting at `day`, ex. archive/ticker_feed/date=2022-05-01
+        '''
+        return os.path.join(self.path, f"date={datetime.fromtimestamp(day, timezone.utc):%Y-%m-%d}")
+
+    def archive(self, archive_days: int = None) -> List[str]:
+        '''
+        Move every whole day of tickers older than `archive_days` into the archive, oldest first.
+
+        :param archive_days: Defaults to PostgresConfig.TICKER_ARCHIVE_DAYS, None archives nothing
+        :return: Paths of the files written
+        '''
+        archive_days = archive_days if archive_days is not None else PostgresConfig.TICKER_ARCHIVE_DAYS
+        if archive_days is None:
+            return []
+        cutoff = (int(now()) - archive_days * DAY_SECONDS) // DAY_SECONDS * DAY_SECONDS
+        written = []
+        oldest = self.__oldest_since(0)
+        # Skips straight over days without tickers
+        while oldest is not None and oldest < cutoff:
+            day = oldest // DAY_SECONDS * DAY_SECONDS
+            path = self.archive_day(day)
+            if path:
+                written.append(path)
+            oldest = self.__oldest_since(day + DAY_SECONDS)
+        return written
+
+    def archive_day(self, day: int) -> str:
+        '''
+        Move one UTC day of tickers into a Parquet file in that day's directory.
+        Files are named after the first & last timestamp they hold, so archiving the same rows twice rewrites the same file.
+
+        :param day: Epoch seconds at the start of the day
+        :return: Path of the file written, or None if Postgres had no tickers that day
+        '''
+        columns = ', '.join(PostgresConfig.TICKER_ARRAY_COLUMNS)
+        with self.postgres.transaction():
+            rows = self.postgres._query(f"""DELETE FROM {self.table} WHERE timestamp >= TO_TIMESTAMP(%s) AND timestamp < TO_TIMESTAMP(%s)
+            RETURNING FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint, {columns}, symbol""", True, (day, day + DAY_SECONDS))
+            if not rows:
+                return None
+            rows.sort(key=lambda row: row[0])
+            table = pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(zip(*rows), self.SCHEMA)], schema=self.SCHEMA
+            )
+            directory = self.day_path(day)
+            path = os.path.join(directory, f'{rows[0][0]}-{rows[-1][0]}.parquet')
+            temporary_path = os.path.join(directory, f'.{rows[0][0]}-{rows[-1][0]}.parquet.tmp')
+            os.makedirs(directory, exist_ok=True)
+            # Written under a hidden name first, so readers never see half a file
+            pq.write_table(table, temporary_path, compression=PostgresConfig.TICKER_ARCHIVE_COMPRESSION)
+            os.replace(temporary_path, path)
+        self.log.info(f'Archived {len(rows)} tickers to {path}')
+        return path
+
+    def read(self, start: int, end: int, columns: Iterable[str] = PostgresConfig.TICKER_ARRAY_COLUMNS) -> Iterator[pa.Table]:
+        '''
+        Archived tickers of the Postgres client's symbol in [start, end), as one Arrow table per archived day, oldest first.
+        Only the requested columns are read from disk.
+
+        :param start: Epoch seconds
+        :param end: Epoch seconds, exclusive
+        '''
+        columns = ['timestamp', *columns]
+        for day in self.days():
+            if day + DAY_SECONDS <= start or day >= end:
+                continue
+            table = pq.read_table(
+                self.day_path(day), columns=columns, schema=self.SCHEMA,
+                filters=[('symbol', '=', self.postgres.symbol), ('timestamp', '>=', start), ('timestamp', '<', end)]
+            )
+            if table.num_rows:
+                yield table.sort_by('timestamp')
+
+    def live_start(self, start: int, end: int) -> int:
+        '''
+        Epoch seconds of the first ticker of the Postgres client's symbol in [start, end) still in Postgres, or `end` if there isn't one.
+        Days are archived oldest first, so anything archived before this is read from the archive, and everything after from Postgres.
+        '''
+        result = self.postgres._query(f"""SELECT FLOOR(EXTRACT(EPOCH FROM MIN(timestamp)))::bigint FROM {self.table}
+        WHERE symbol = %s AND timestamp >= TO_TIMESTAMP(%s) AND timestamp < TO_TIMESTAMP(%s)""", True, (self.postgres.symbol, start, end), replica=True)
+        return result[0][0] if result[0][0] is not None else end
+
+    def get_tickers(self, start: int, end: int, columns: Iterable[str] = PostgresConfig.TICKER_ARRAY_COLUMNS) -> np.ndarray:
+        '''
+        Every ticker of the Postgres client's symbol in [start, end) from the archive and Postgres together, as a NumPy structured array oldest first,
+        in the same format as `Postgres.get_latest_tickers_array`. NULL prices come back as NaN.
+
+        :param start: Epoch seconds
+        :param end: Epoch seconds, exclusive
+        :param columns: Ticker columns to include, from PostgresConfig.TICKER_ARRAY_COLUMNS
+        '''
+        columns = list(columns)
+        live = self.postgres.get_tickers_array(start, end, columns)
+        # Rows that are in both (ex. archival failed before committing) are read from Postgres only
+        archived_until = int(live['timestamp'][0]) if len(live) else end
+        archived = [self.__to_array(table, columns) for table in self.read(start, archived_until, columns)]
+        return np.concatenate(archived + [live])
+
+    def __oldest_since(self, timestamp: int) -> int:
+        result = self.postgres._query(f"""SELECT FLOOR(EXTRACT(EPOCH FROM MIN(timestamp)))::bigint FROM {self.table}
+        WHERE timestamp >= TO_TIMESTAMP(%s)""", True, (timestamp,))
+        return result[0][0]
+
+    def __to_array(self, table: pa.Table, columns: List[str]) -> np.ndarray:
+        array = np.empty(table.num_rows, dtype=ticker_array_dtype(columns))
+        array['timestamp'] = table.column('timestamp').to_numpy()
+        for column in columns:
+            array[column] = table.column(column).fill_null(float('nan')).to_numpy()
+        return array
+
+
+if __name__ == "__main__":
+    TickerArchive().archive()
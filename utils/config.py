@@ -37,11 +37,14 @@ class PostgresConfig:
     TICKER_TABLE_NAME = 'ticker_feed'
     '''The name of the pSQL table that stores live ticker data.'''
 
-    TICKER_COLUMNS = '(timestamp, ask, bid, last, low, high, open, volume, volume_quote)'
+    TICKER_COLUMNS = '(timestamp, ask, bid, last, low, high, open, volume, volume_quote, symbol)'
     '''The columns of the pSQL table that stores live ticker data. Used for sql insert queries.'''
 
-    TICKER_SELECT_NEWEST = "SELECT FLOOR(EXTRACT(EPOCH FROM timestamp)) AS timestamp_epoch, ask, bid, last, low, high, open, volume, volume_quote FROM ticker_feed ORDER BY timestamp_epoch DESC LIMIT %s"
-    '''Used to select the newest rows from ticker_feed. Use '%' after this string to format a LIMIT number into the query'''
+    TICKER_SELECT_COLUMNS = 'FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint AS timestamp_epoch, ask, bid, last, low, high, open, volume, volume_quote'
+    '''The columns to select from the ticker table, in the order PostgresTicker expects them. Timestamp is converted to epoch seconds.'''
+
+    TICKER_ARRAY_COLUMNS = ('ask', 'bid', 'last', 'low', 'high', 'open', 'volume', 'volume_quote')
+    '''The ticker columns that can be fetched as float64 arrays by Postgres.get_latest_tickers_array, alongside the timestamp.'''
 
     ORDER_TABLE_NAME = 'order_feed'
     '''The name of the pSQL table that stores order data & history.'''
@@ -49,12 +52,18 @@ class PostgresConfig:
     ORDER_COLUMNS = '(timestamp, quantity, side, status, uuid, usd_balance, btc_balance, current_price)'
     '''The columns of the pSQL table that stores order data & history. Used for sql insert queries.'''
 
+    ORDER_SELECT_COLUMNS = 'FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint AS timestamp_epoch, quantity, side, status, uuid, usd_balance, btc_balance, current_price'
+    '''The columns to select from the order table, in the order PostgresOrder expects them. Timestamp is converted to epoch seconds.'''
+
     PREDICTION_TABLE_NAME = 'prediction_feed'
     '''The name of the pSQL table that stores prediction data & history.'''
 
     PREDICTION_COLUMNS = '(timestamp, prediction_timestamp, prediction_weight, prediction_history, status, uuid, prediction_percent)'
     '''The columns of the pSQL table that stores prediction data & history. Used for sql insert queries.'''
 
+    PREDICTION_SELECT_COLUMNS = 'FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint AS timestamp_epoch, prediction_timestamp, prediction_weight, prediction_history, status, uuid, prediction_percent'
+    '''The columns to select from the prediction table, in the order PostgresPredictionVector expects them. Timestamp is converted to epoch seconds.'''
+
     STATUS_QUEUED = 'QUEUED'
     '''The postgres.order_feed & prediction_feed status of a prediction that has been queued for order.'''
 
@@ -72,6 +81,93 @@ class PostgresConfig:
     UNRESPONSIVE_TIMEOUT_THRESHOLD = 240
     '''Number of seconds before the monitoring service should give up sending alerts over an lack of table updates.'''
 
+    HEARTBEAT_TABLE_NAME = 'service_heartbeats'
+    '''The name of the pSQL table each service publishes its heartbeat to, one row per worker process. See utils/heartbeat.py'''
+
+    HEARTBEAT_INTERVAL = 5
+    '''How often each service upserts its heartbeat row, in seconds. Progress between upserts is only counted in memory.'''
+
+    HEARTBEAT_EXPIRY = 3600
+    '''Seconds after its last beat that a worker's heartbeat row is removed by PostgresMonitor, ex. after a crash. Well past UNRESPONSIVE_TIMEOUT_THRESHOLD, so it is alerted on first.'''
+
+    SCHEMA_PATH = 'schema.sql'
+    '''The original tables, run by the Postgres container on a new database. `migrations/` holds every change since.'''
+
+    MIGRATIONS_PATH = 'migrations'
+    '''Directory of versioned schema migrations, applied by `python -m utils.migrations`.'''
+
+    MIGRATIONS_TABLE_NAME = 'schema_migrations'
+    '''The name of the pSQL table that records which migrations have been applied.'''
+
+    MIGRATIONS_TABLE_SCHEMA = f'CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE_NAME} (version INTEGER PRIMARY KEY, name TEXT, applied_at TIMESTAMP DEFAULT NOW())'
+    '''Creates the migrations table on first run.'''
+
+    MIGRATIONS_LOCK_ID = 7263548
+    '''Postgres advisory lock key held while migrations are applied, so two services never migrate at once.'''
+
+    TICKER_PARTITION_INTERVAL = 'month'
+    '''How much time each ticker table partition covers, 'week' or 'month'. Changing it only affects partitions created afterwards.'''
+
+    TICKER_PARTITION_PREMAKE = 1
+    '''Number of future partitions to keep created ahead of the newest ticker, so inserts never land in the default partition.'''
+
+    TICKER_RETENTION_DAYS = None
+    '''Ticker partitions that end more than this many days ago are removed by the retention job. None keeps every partition.'''
+
+    TICKER_RETENTION_DROP = False
+    '''When True the retention job drops old partitions. Otherwise they are only detached, and left as standalone tables to archive.'''
+
+    TICKER_RETENTION_CHECK_INTERVAL = 86400 # 1 day
+    '''How often the ticker scraper runs the retention job, in seconds.'''
+
+    TICKER_ARCHIVE_DAYS = None
+    '''Tickers from whole (UTC) days older than this many days are moved out of Postgres into Parquet files by the archival job, before retention runs. None keeps every ticker in Postgres.'''
+
+    TICKER_ARCHIVE_PATH = 'archive'
+    '''Directory holding the ticker archive, one Parquet file per table per day, ex. archive/ticker_feed/date=2022-05-01/tickers.parquet'''
+
+    TICKER_ARCHIVE_COMPRESSION = 'zstd'
+    '''Parquet compression codec for archived tickers.'''
+
+    CANDLE_TABLE_SUFFIX = '_candles'
+    '''Appended to the ticker table name for its table of OHLCV candle rollups, ex. ticker_feed_candles.'''
+
+    ORDER_RUN_TABLE_SUFFIX = '_run'
+    '''Appended to the order table name for its one-row table holding the current run of same-side orders, ex. order_feed_run.'''
+
+    CANDLE_RESOLUTIONS = {'1m': 60, '5m': 300, '1h': 3600, '1d': 86400}
+    '''Candle resolutions (in seconds) kept up to date as tickers arrive. Changing these needs a rebuild of the candle table, see migrations/0004_ticker_candles.sql'''
+
+    POOL_MIN_SIZE = 1
+    '''Number of connections the shared connection pool opens up front.'''
+
+    POOL_MAX_SIZE = 5
+    '''Maximum number of connections the shared connection pool will hold open, per process.'''
+
+    POOL_CHECKOUT_TIMEOUT = 30
+    '''Number of seconds to wait for a free pooled connection before giving up.'''
+
+    POOL_HEALTH_CHECK_INTERVAL = 30
+    '''Pooled connections idle for longer than this many seconds are pinged before being handed out.'''
+
+    READ_REPLICA_RETRY_INTERVAL = 60
+    '''After a query on the read replica fails, reads go to the primary for this many seconds before the replica is tried again.'''
+
+    QUERY_METRICS_ENABLED = False
+    '''Record per-statement latency histograms, row counts, retries & slow queries for every Postgres query. See utils/postgres_metrics.py'''
+
+    QUERY_METRICS_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+    '''Upper bounds of the query latency histogram buckets, in milliseconds. Slower queries land in one overflow bucket.'''
+
+    QUERY_SLOW_THRESHOLD_MS = 250
+    '''Queries slower than this many milliseconds are logged as slow, while query metrics are enabled.'''
+
+    QUERY_METRICS_SUMMARY_INTERVAL = 300 # 5 minutes
+    '''How often a one-line summary of the query metrics is logged, in seconds. None never logs it.'''
+
+    QUERY_METRICS_SUMMARY_TOP = 5
+    '''Number of statements, by total time spent, listed in the query metrics summary.'''
+
 ################# Ticker Scraper  #################
 
 class ScraperConfig:
@@ -82,6 +178,42 @@ class ScraperConfig:
     SOCKET_TIMEOUT_INTERVAL_MULTIPLIER = 2
     '''Multiplies the TICKER_INTERVAL for length of time without any new data from ticker scraper before we attempt a socket reconnect'''
 
+    SQL_BATCH_SIZE = 1
+    '''Maximum number of tickers Athena writes to Postgres in one bulk insert. 1 inserts each ticker as it arrives.'''
+
+    SQL_BATCH_MAX_LATENCY = 5
+    '''Maximum number of seconds a ticker can wait in a partially filled batch before the batch is written anyway.'''
+
+    SYMBOLS = None
+    '''Symbols the ticker scraper subscribes to, all over one websocket & stored in the same ticker table, ex. ['BTCUSD_TR', 'ETHUSD_TR']. None scrapes CrosstowerConfig.DEFAULT_SYMBOL only.'''
+
+    ASYNC_SCRAPER = True
+    '''When True the ticker scraper service runs AsyncAthena, on a single event loop. Otherwise it runs the threaded Athena.'''
+
+    TICKER_QUEUE_SIZE = 1000
+    '''Maximum number of tickers AsyncAthena holds between the websocket & Postgres. Once full, the oldest ticker is dropped for each new one.'''
+
+    SOCKET_MAX_RECONNECTS = 5
+    '''Number of reconnects in a row, without a ticker in between, before AsyncAthena gives up.'''
+
+    WATCHDOG_INTERVAL = 5
+    '''How often AsyncAthena's watchdog checks for a stalled socket, in seconds.'''
+
+    CSV_BATCH_SIZE = 100
+    '''Maximum number of tickers Athena's CSV mode takes off the queue & writes at once.'''
+
+    CSV_FLUSH_INTERVAL = 1
+    '''How often Athena's CSV mode flushes buffered lines to the file, in seconds. 0 flushes after every write.'''
+
+    CSV_FSYNC = False
+    '''When True each CSV flush is also fsync'd, so written tickers survive a power loss, at the cost of a disk sync per flush.'''
+
+    CSV_ROTATE_BYTES = None
+    '''Once the CSV file reaches this many bytes it is renamed with a timestamp suffix & a new file started. None never rotates by size.'''
+
+    CSV_ROTATE_INTERVAL = None
+    '''Once the CSV file has been open this many seconds it is renamed with a timestamp suffix & a new file started. None never rotates by age.'''
+
     # For these headers, the prediction engine is looking for the "price" column in the table. 
     # 
     DEFAULT_ASK_CSV_HEADERS = 'price,bid,last,low,high,open,volume,volumeQuote,timestamp\n'
@@ -90,6 +222,9 @@ class ScraperConfig:
     DEFAULT_BID_CSV_HEADERS = 'ask,price,last,low,high,open,volume,volumeQuote,timestamp\n'
     '''The default headers to use when creating a new bid-based ticker/prediction CSV file'''
 
+    PRICE_CSV_HEADERS = 'price,timestamp\n'
+    '''The headers of a ticker/prediction CSV file with only the columns the prediction engine reads'''
+
 ################# Hermes Trading #################
 
 class TradingConfig:
@@ -106,6 +241,9 @@ class TradingConfig:
     TRADING_SYMBOL = 'BTCUSD_TR'
     '''The symbol of the trading pair to trade, used when creating Order objects and fetching tickers'''
 
+    ORDER_RUN_SUM_LIMIT = 10
+    '''When an order reverses a run of same-side orders, the quantities of up to this many orders in the run are added to it'''
+
 ################# Crosstower API #################
 
 class CrosstowerConfig:
@@ -114,7 +252,7 @@ class CrosstowerConfig:
     '''[]The default currency to use when making API market requests'''
 
     DEFAULT_SYMBOL = 'BTCUSD_TR'
-    '''[UNUSED] The default symbol to use when making API market requests, representing the trading pair'''
+    '''The default symbol to scrape, and the one Postgres reads tickers & candles for unless given another, representing the trading pair'''
 
     SOCKET_V3_URL = 'wss://api.us.crosstower.com/api/3/ws'
     '''The base socket URL for the Crosstower V3 API'''
@@ -151,6 +289,15 @@ class PredictionConfig:
     PREDICTION_QUEUE_MAX_SIZE = 5
     '''The maximum number of queued predictions before alerting'''
 
+    PREDICTION_QUEUE_POLL_INTERVAL = 5
+    '''Seconds a blocking prediction queue get() waits for a NOTIFY before checking the table anyway, in case one was missed.'''
+
+    PREDICTION_QUEUE_VISIBILITY_TIMEOUT = 300
+    '''Seconds a prediction can stay PROCESSING before it is assumed stuck (ex. its worker died) and put back in the queue.'''
+
+    PREDICTION_QUEUE_MAX_CLAIMS = 3
+    '''Number of times a prediction can be claimed before a stuck prediction is marked FAILED instead of requeued.'''
+
 ################# Robinhood #################
 
 class RobinhoodConfig:
@@ -0,0 +1,110 @@
+import os
+from datetime import datetime, timezone
+from io import TextIOWrapper
+from time import time as now
+from typing import List
+
+from utils.config import ScraperConfig
+
+
+class CsvSink:
+
+    '''
+    Appends lines to a CSV file through one buffered handle, kept open between writes.
+
+    Buffered lines reach the file every `flush_interval` seconds (0 flushes every write), and are fsync'd as well if `fsync` is set.
+    Once the file holds `rotate_bytes`, or was opened `rotate_interval` seconds ago, it is renamed with a UTC timestamp suffix
+    (ex. tickers.csv -> tickers.20220501T000000.csv, then tickers.20220501T000000.1.csv within the same second)
+    and a fresh file is started, beginning with `header` if given.
+    The last line written is kept in memory, so watching the sink never reads the file back.
+    '''
+
+    def __init__(self, path: str, header: str = None, flush_interval: float = None, fsync: bool = None,
+                 rotate_bytes: int = None, rotate_interval: int = None) -> None:
+        self.path = path
+        self.header = header
+        self.flush_interval: float = flush_interval if flush_interval is not None else ScraperConfig.CSV_FLUSH_INTERVAL
+        self.fsync: bool = fsync if fsync is not None else ScraperConfig.CSV_FSYNC
+        self.rotate_bytes: int = rotate_bytes if rotate_bytes is not None else ScraperConfig.CSV_ROTATE_BYTES
+        self.rotate_interval: int = rotate_interval if rotate_interval is not None else ScraperConfig.CSV_ROTATE_INTERVAL
+        self.last_line: str = ''
+        self.lines_written: int = 0
+        self.file: TextIOWrapper = None
+        # Tracked here, asking the text handle for its position would flush it
+        self.size: int = 0
+        self.opened_at: float = None
+        self.flushed_at: float = None
+
+    def write(self, line: str):
+        self.write_lines([line])
+
+    def write_lines(self, lines: List[str]):
+        '''
+        Append lines, each ending in a newline. The file is opened on the first write, and rotated or flushed afterwards as needed,
+        so calling this with no lines flushes anything buffered once it is due.
+        '''
+        if lines:
+            if self.file is None:
+                self.__open()
+            self.file.writelines(lines)
+            self.size += sum(len(line) for line in lines)
+            self.last_line = lines[-1]
+            self.lines_written += len(lines)
+        if self.file is None:
+            return
+        if self.__rotation_due():
+            self.rotate()
+        elif now() - self.flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.file is None:
+            return
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.flushed_at = now()
+
+    def rotate(self) -> str:
+        '''
+        Close the current file & move it aside, the next write starts a new one.
+
+        :return: Path the file was moved to, or None if no file was open
+        '''
+        if self.file is None:
+            return None
+        self.close()
+        base, extension = os.path.splitext(self.path)
+        stamped = f"{base}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S}"
+        rotated_path = f"{stamped}{extension}"
+        # Never replace an earlier rotation, ex. two within a second or after a restart
+        sequence = 0
+        while os.path.exists(rotated_path):
+            sequence += 1
+            rotated_path = f"{stamped}.{sequence}{extension}"
+        os.replace(self.path, rotated_path)
+        return rotated_path
+
+    def close(self):
+        '''
+        Flush & close the file, if open. Writing again reopens it.
+        '''
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+    def __open(self):
+        self.file = open(self.path, 'a')
+        self.size = self.file.tell()
+        if self.header and self.size == 0:
+            self.file.write(self.header)
+            self.size += len(self.header)
+        self.opened_at = now()
+        self.flushed_at = now()
+
+    def __rotation_due(self) -> bool:
+        if self.rotate_bytes and self.size >= self.rotate_bytes:
+            return True
+        return bool(self.rotate_interval) and now() - self.opened_at >= self.rotate_interval
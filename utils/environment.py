@@ -46,6 +46,11 @@ class env_meta(type):
     def postgres_database(cls) -> str:
         return os.getenv('POSTGRES_DB')
 
+    @property
+    def postgres_read_dsn(cls) -> str:
+        # Unset & blank (as in .env.example) both mean there is no replica
+        return os.getenv('POSTGRES_READ_DSN', '').strip() or None
+
     @property
     def keras_model_path(cls) -> str:
         return os.getenv('KERAS_MODEL_PATH')
@@ -0,0 +1,177 @@
+import json
+import os
+import socket
+import traceback
+from threading import Event, Lock, Thread
+from time import time as now
+from typing import Dict, List
+
+from utils import Logger, Postgres
+from utils.config import PostgresConfig
+from utils.postgres import PostgresStatement
+
+
+class HeartbeatState:
+
+    '''
+    One worker's heartbeat, as last published
+    '''
+
+    __slots__ = ('service', 'worker', 'started_at', 'beat_at', 'progress_at', 'tick_at', 'progress_count', 'counters')
+
+    def __init__(self, data: tuple) -> None:
+        self.service: str = data[0]
+        self.worker: str = data[1]
+        # Epoch seconds. progress_at & tick_at are None until the worker first reports progress, or ticks
+        self.started_at: float = data[2]
+        self.beat_at: float = data[3]
+        self.progress_at: float = data[4]
+        self.tick_at: float = data[5]
+        self.progress_count: int = data[6]
+        self.counters: Dict[str, int] = data[7]
+
+    @property
+    def beat_age(self) -> float:
+        '''Seconds since the service last published'''
+        return now() - self.beat_at
+
+    @property
+    def progress_age(self) -> float:
+        '''Seconds since the service last reported progress, or since it started if it never has'''
+        return now() - (self.progress_at if self.progress_at is not None else self.started_at)
+
+    @property
+    def tick_age(self) -> float:
+        '''Seconds since the worker's main loop last ticked, or since it started if it never has'''
+        return now() - (self.tick_at if self.tick_at is not None else self.started_at)
+
+
+class Heartbeat:
+
+    '''
+    Liveness & progress of one worker process of a service. Reporting progress only updates memory, so it is cheap enough for hot loops.
+    Once started, a background thread upserts the worker's row in the heartbeat table every HEARTBEAT_INTERVAL seconds,
+    and stopping removes it. Each worker (hostname:pid) has its own row, so one healthy worker can't hide a dead one.
+    Without a Postgres client nothing is published, and the heartbeat is only read in-process (ex. by a watchdog).
+
+    The publishing thread keeps beating even if the service's own loop hangs. A service that can sit idle, with no progress
+    to report, should call `tick()` from its main loop instead, and be monitored on tick_age.
+
+    Read every worker's heartbeat with `Heartbeat.read_all(postgres)`.
+    '''
+
+    def __init__(self, service: str, override_postgres: Postgres = None, table_override: str = None, interval: float = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.service = service
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.postgres = override_postgres
+        self.table = table_override if table_override else PostgresConfig.HEARTBEAT_TABLE_NAME
+        self.interval: float = interval if interval else PostgresConfig.HEARTBEAT_INTERVAL
+        self.started_at: float = now()
+        self.progress_at: float = None
+        self.tick_at: float = None
+        self.progress_count: int = 0
+        self.counters: Dict[str, int] = {}
+        self.upsert = PostgresStatement('upsert_heartbeat', f"""
+            INSERT INTO {self.table} (service, worker, started_at, beat_at, progress_at, tick_at, progress_count, counters)
+            VALUES ($1, $2, TO_TIMESTAMP($3), TO_TIMESTAMP($4), TO_TIMESTAMP($5), TO_TIMESTAMP($6), $7, $8::jsonb)
+            ON CONFLICT (service, worker) DO UPDATE SET started_at = EXCLUDED.started_at, beat_at = EXCLUDED.beat_at,
+                progress_at = EXCLUDED.progress_at, tick_at = EXCLUDED.tick_at, progress_count = EXCLUDED.progress_count,
+                counters = EXCLUDED.counters""")
+        self.delete = PostgresStatement('delete_heartbeat', f'DELETE FROM {self.table} WHERE service = $1 AND worker = $2')
+        self.__lock = Lock()
+        self.__stopped = Event()
+        self.__thread: Thread = None
+
+    def progress(self, count: int = 1, **counters: int):
+        '''
+        Record work done, ex. `heartbeat.progress(len(batch), tickers=len(batch))`
+
+        :param count: Added to progress_count
+        :param counters: Added to the named counters
+        '''
+        with self.__lock:
+            self.progress_at = now()
+            self.progress_count += count
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def tick(self):
+        '''
+        Record that the main loop is still turning, whether or not it got anything done. Call it every time the loop wakes up
+        '''
+        self.tick_at = now()
+
+    def count(self, **counters: int):
+        '''
+        Add to the named counters without counting it as progress, ex. `heartbeat.count(dropped=1)`
+        '''
+        with self.__lock:
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def start(self):
+        '''
+        Publish now, then every `interval` seconds from a daemon thread until stopped. Does nothing without a Postgres client
+        '''
+        if self.postgres is None or self.__thread is not None:
+            return
+        self.__stopped.clear()
+        self.__thread = Thread(target=self.__publish_loop, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        Stop publishing & remove this worker's row, a worker that stopped cleanly is no longer expected to beat
+        '''
+        if self.__thread is None:
+            return
+        self.__stopped.set()
+        self.__thread.join(timeout=self.interval + 5)
+        self.__thread = None
+
+    def publish(self):
+        with self.__lock:
+            params = (self.service, self.worker, self.started_at, now(), self.progress_at, self.tick_at, self.progress_count, json.dumps(self.counters))
+        self.postgres._query(self.upsert, False, params)
+
+    @staticmethod
+    def read_all(postgres: Postgres, table_override: str = None) -> Dict[str, List[HeartbeatState]]:
+        '''
+        Every worker's last published heartbeat, grouped by service name. One small query, whatever the size of the data tables.
+        '''
+        table = table_override if table_override else PostgresConfig.HEARTBEAT_TABLE_NAME
+        rows = postgres._query(f"""SELECT service, worker, EXTRACT(EPOCH FROM started_at)::float8, EXTRACT(EPOCH FROM beat_at)::float8,
+            EXTRACT(EPOCH FROM progress_at)::float8, EXTRACT(EPOCH FROM tick_at)::float8, progress_count, counters
+            FROM {table} ORDER BY service, worker""", True, replica=True)
+        heartbeats: Dict[str, List[HeartbeatState]] = {}
+        for row in rows:
+            heartbeats.setdefault(row[0], []).append(HeartbeatState(row))
+        return heartbeats
+
+    @staticmethod
+    def expire(postgres: Postgres, max_age: float = None, table_override: str = None) -> int:
+        '''
+        Remove the rows of workers that haven't beaten in `max_age` seconds (default PostgresConfig.HEARTBEAT_EXPIRY),
+        ex. left behind by a crash, once they have long since been alerted on
+
+        :return: Number of rows removed
+        '''
+        table = table_override if table_override else PostgresConfig.HEARTBEAT_TABLE_NAME
+        max_age = max_age if max_age is not None else PostgresConfig.HEARTBEAT_EXPIRY
+        rows = postgres._query(f"DELETE FROM {table} WHERE beat_at < NOW() - %s * INTERVAL '1 second' RETURNING service", True, (max_age,))
+        return len(rows)
+
+    def __publish_loop(self):
+        while True:
+            try:
+                self.publish()
+            except Exception:
+                # A missed beat shows up in the monitor, it shouldn't take the service down
+                self.log.error(f'[{self.service}] Failed to publish heartbeat: {traceback.format_exc()}')
+            if self.__stopped.wait(self.interval):
+                break
+        try:
+            self.postgres._query(self.delete, False, (self.service, self.worker))
+        except Exception:
+            self.log.error(f'[{self.service}] Failed to remove heartbeat: {traceback.format_exc()}')
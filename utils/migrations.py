@@ -0,0 +1,110 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+from utils import Logger, Postgres
+from utils.config import PostgresConfig
+
+
+class PostgresMigrations:
+
+    '''
+    Applies the versioned SQL files in `migrations/` that haven't been run against this database yet.
+    Files are named `<version>_<description>.sql` and applied in version order, each in its own transaction.
+    The base schema (`schema.sql`) runs first against a database with no migrations recorded.
+
+    Pass `table_names` to run the same history against other tables, ex. the testing tables. Every table, index & constraint
+    name starting with a key is renamed, so `ticker_feed_candles` becomes `_ticker_feed_testing_candles` for `ticker_feed`.
+
+    Run from the project root with `python -m utils.migrations`
+    '''
+
+    def __init__(self, override_postgres: Postgres = None, override_migrations_path: str = None, override_schema_path: str = None,
+                 table_names: Dict[str, str] = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.postgres = override_postgres if override_postgres is not None else Postgres()
+        self.path = override_migrations_path if override_migrations_path else PostgresConfig.MIGRATIONS_PATH
+        self.schema_path = override_schema_path if override_schema_path else PostgresConfig.SCHEMA_PATH
+        self.table_names: Dict[str, str] = table_names if table_names else {}
+        self.table = self.rename(PostgresConfig.MIGRATIONS_TABLE_NAME)
+        self.table_schema = self.rename(PostgresConfig.MIGRATIONS_TABLE_SCHEMA)
+
+    def available(self) -> List[Tuple[int, str]]:
+        '''
+        All migration files on disk, as (version, filename) sorted by version
+        '''
+        migrations = []
+        for filename in os.listdir(self.path):
+            match = re.match(r'^(\d+)_\w+\.sql$', filename)
+            if match:
+                migrations.append((int(match.group(1)), filename))
+        migrations.sort()
+        versions = [version for version, _ in migrations]
+        if len(versions) != len(set(versions)):
+            raise Exception(f"Duplicate migration versions found in {self.path}")
+        return migrations
+
+    def applied(self) -> List[int]:
+        self.postgres._query(self.table_schema, False)
+        result = self.postgres._query(f"SELECT version FROM {self.table} ORDER BY version", True)
+        return [row[0] for row in result]
+
+    def pending(self) -> List[Tuple[int, str]]:
+        applied = self.applied()
+        return [(version, filename) for version, filename in self.available() if version not in applied]
+
+    def rename(self, sql: str) -> str:
+        '''
+        The SQL with every name starting with a `table_names` key renamed, longest key first
+        '''
+        if not self.table_names:
+            return sql
+        names = sorted(self.table_names, key=len, reverse=True)
+        pattern = r'\b(' + '|'.join(re.escape(name) for name in names) + ')'
+        return re.sub(pattern, lambda match: self.table_names[match.group(1)], sql)
+
+    def apply(self) -> List[str]:
+        '''
+        Apply every pending migration. Holds an advisory lock, so services starting at the same time can't run a migration twice.
+
+        :return: The filenames that were applied
+        '''
+        self.postgres._query(self.table_schema, False)
+        completed = []
+        with self.postgres.pool.connection() as conn:
+            # Each migration commits together with its schema_migrations row
+            conn.autocommit = False
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', (PostgresConfig.MIGRATIONS_LOCK_ID,))
+                conn.commit()
+                try:
+                    cursor.execute(f"SELECT version FROM {self.table}")
+                    applied = [row[0] for row in cursor.fetchall()]
+                    if not applied:
+                        # Only creates what's missing, so it's a no-op where the Postgres container already ran it
+                        self.log.info(f"Applying base schema {self.schema_path}...")
+                        with open(self.schema_path) as file:
+                            cursor.execute(self.rename(file.read()))
+                        conn.commit()
+                    for version, filename in self.available():
+                        if version in applied:
+                            continue
+                        self.log.info(f"Applying migration {filename}...")
+                        with open(os.path.join(self.path, filename)) as file:
+                            cursor.execute(self.rename(file.read()))
+                        cursor.execute(f"INSERT INTO {self.table} (version, name) VALUES (%s, %s)", (version, filename))
+                        conn.commit()
+                        completed.append(filename)
+                finally:
+                    conn.rollback()
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', (PostgresConfig.MIGRATIONS_LOCK_ID,))
+                    conn.commit()
+        if completed:
+            self.log.info(f"Applied {len(completed)} migration(s)")
+        else:
+            self.log.info("Database schema is up to date")
+        return completed
+
+
+if __name__ == "__main__":
+    PostgresMigrations().apply()
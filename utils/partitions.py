@@ -0,0 +1,152 @@
+import re
+from datetime import datetime, timezone
+from time import time as now
+from typing import List
+
+from utils import Logger, Postgres
+from utils.config import PostgresConfig
+
+
+class TickerPartition:
+
+    def __init__(self, name: str, bound: str) -> None:
+        '''
+        :param bound: Partition bound as printed by pg_get_expr, ex. "FOR VALUES FROM ('2022-05-01 00:00:00') TO ('2022-06-01 00:00:00')"
+        '''
+        self.name: str = name
+        self.is_default: bool = bound == 'DEFAULT'
+        self.start: datetime = None
+        self.end: datetime = None
+        match = re.match(r"^FOR VALUES FROM \((.+)\) TO \((.+)\)$", bound)
+        if match:
+            self.start = self.__parse_bound(match.group(1))
+            self.end = self.__parse_bound(match.group(2))
+
+    def __parse_bound(self, value: str) -> datetime:
+        # MINVALUE / MAXVALUE leave the bound open
+        if not value.startswith("'"):
+            return None
+        return datetime.fromisoformat(value.strip("'"))
+
+    def __repr__(self) -> str:
+        return f'{self.name} [{self.start} -> {self.end})'
+
+
+class TickerPartitions:
+
+    '''
+    Keeps the range-partitioned ticker table (see migrations/0002_partition_ticker_feed.sql) covered with
+    partitions ahead of incoming tickers, and detaches or drops partitions older than the retention period.
+
+    Both are no-ops against a ticker table that isn't partitioned. The testing tables are built from the same migrations,
+    so they are partitioned too.
+    Run the retention job by hand with `python -m utils.partitions`
+    '''
+
+    def __init__(self, override_postgres: Postgres = None, interval: str = None, premake: int = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.postgres = override_postgres if override_postgres is not None else Postgres()
+        self.table = self.postgres.ticker_table_name
+        self.interval = interval if interval else PostgresConfig.TICKER_PARTITION_INTERVAL
+        if self.interval not in ['week', 'month']:
+            raise Exception(f"Invalid partition interval '{self.interval}', expected 'week' or 'month'")
+        self.premake = premake if premake is not None else PostgresConfig.TICKER_PARTITION_PREMAKE
+        # Epoch time up to which partitions are known to exist, so ensure() only hits the database near the edge
+        self.covered_until: float = 0
+
+    def is_partitioned(self) -> bool:
+        result = self.postgres._query("SELECT relkind FROM pg_class WHERE relname = %s", True, (self.table,))
+        return len(result) > 0 and result[0][0] == 'p'
+
+    def list(self) -> List[TickerPartition]:
+        '''
+        Every partition of the ticker table, oldest first, with the default partition last
+        '''
+        result = self.postgres._query("""SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = %s""", True, (self.table,))
+        partitions = [TickerPartition(name, bound) for name, bound in result]
+        return sorted(partitions, key=lambda partition: (partition.is_default, partition.end or datetime.min))
+
+    def ensure(self, timestamp: int = None) -> List[str]:
+        '''
+        Create any missing partitions, from the newest existing one up to `premake` periods past the given ticker timestamp.
+        Cheap to call on every insert, the catalog is only checked once the timestamp nears the end of the known partitions.
+
+        :param timestamp: Epoch seconds of the ticker about to be written, defaults to now
+        :return: Names of the partitions created
+        '''
+        timestamp = timestamp if timestamp else int(now())
+        if timestamp < self.covered_until:
+            return []
+        if not self.is_partitioned():
+            self.log.debug(f'{self.table} is not partitioned, skipping partition maintenance')
+            self.covered_until = float('inf')
+            return []
+        ranged = [partition for partition in self.list() if partition.end]
+        latest_end = ranged[-1].end if ranged else None
+        # Each row is a missing period: picks up from the newest partition (or the period holding the timestamp),
+        # and runs through `premake` periods after the period holding the timestamp
+        periods = self.postgres._query("""SELECT period_start, period_start + %(step)s::interval
+        FROM generate_series(
+            COALESCE(%(latest_end)s::timestamp, date_trunc(%(interval)s, TO_TIMESTAMP(%(timestamp)s)::timestamp)),
+            date_trunc(%(interval)s, TO_TIMESTAMP(%(timestamp)s)::timestamp) + %(premake)s * %(step)s::interval,
+            %(step)s::interval
+        ) AS period_start""", True, {
+            'step': f'1 {self.interval}',
+            'interval': self.interval,
+            'latest_end': latest_end,
+            'timestamp': timestamp,
+            'premake': self.premake
+        })
+        created = []
+        for start, end in periods:
+            name = f'{self.table}_p{start:%Y%m%d}'
+            self.log.info(f'Creating ticker partition {name} for [{start} -> {end})')
+            self.postgres._query(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {self.table} FOR VALUES FROM (%s) TO (%s)",
+                False, (str(start), str(end))
+            )
+            created.append(name)
+            latest_end = end
+        # Start checking again once the timestamp reaches the last premade period
+        if latest_end:
+            # Bounds are UTC like the ticker timestamps, not the local time naive datetime.timestamp() would assume
+            self.covered_until = latest_end.replace(tzinfo=timezone.utc).timestamp() - self.__period_seconds() * self.premake
+        return created
+
+    def apply_retention(self, retention_days: int = None, drop: bool = None) -> List[str]:
+        '''
+        Detach (or drop) every partition that ends more than `retention_days` ago.
+        Detached partitions stay in the database as regular tables until removed by hand.
+
+        :param retention_days: Defaults to PostgresConfig.TICKER_RETENTION_DAYS, None keeps everything
+        :param drop: Defaults to PostgresConfig.TICKER_RETENTION_DROP
+        :return: Names of the partitions removed
+        '''
+        retention_days = retention_days if retention_days is not None else PostgresConfig.TICKER_RETENTION_DAYS
+        drop = drop if drop is not None else PostgresConfig.TICKER_RETENTION_DROP
+        if retention_days is None or not self.is_partitioned():
+            return []
+        cutoff = self.postgres._query("SELECT (NOW() - %s * INTERVAL '1 day')::timestamp", True, (retention_days,))[0][0]
+        removed = []
+        for partition in self.list():
+            if partition.is_default or partition.end is None or partition.end > cutoff:
+                continue
+            self.log.info(f"{'Dropping' if drop else 'Detaching'} ticker partition {partition}")
+            self.postgres._query(f'ALTER TABLE {self.table} DETACH PARTITION {partition.name}', False)
+            if drop:
+                self.postgres._query(f'DROP TABLE {partition.name}', False)
+            removed.append(partition.name)
+        return removed
+
+    def __period_seconds(self) -> int:
+        return 7 * 86400 if self.interval == 'week' else 28 * 86400
+
+
+if __name__ == "__main__":
+    partitions = TickerPartitions()
+    partitions.ensure()
+    partitions.apply_retention()
@@ -1,20 +1,32 @@
 import json
+import re
 import traceback
+from hashlib import md5
+from time import perf_counter, sleep
 from time import time as now
-from time import sleep
-from typing import List, Tuple
+from typing import Dict, Iterable, List, Tuple, Union
+
+import numpy as np
 
-import psycopg2 as psql
 from crosstower.models import Order, Ticker
 from olympus.helper_objects import PredictionVector
+from olympus.helper_objects.order_run import OrderRun
+from olympus.helper_objects.ticker_batch import TickerBatch
 
 from utils import DiscordWebhook, Logger
 import utils.config as constants
-from utils.config import PostgresConfig
+from utils.config import CrosstowerConfig, PostgresConfig, TradingConfig
 from utils.environment import env
+from utils.postgres_metrics import PostgresQueryMetrics, label_for_sql
+from utils.postgres_pool import PostgresPool
 
 class PostgresCursor:
 
+    '''
+    Cursor over a pooled connection. Nothing is committed here: pooled connections autocommit each statement,
+    and statements inside `Postgres.transaction()` are committed together when the block ends.
+    '''
+
     def __init__(self, connection) -> None:
         self.conn = connection
 
@@ -23,25 +35,324 @@ class PostgresCursor:
         return self.cursor
 
     def __exit__(self, exc_type, exc_value, tb):
-        self.conn.commit()
         self.cursor.close()
         self.cursor = None
 
 
+class PostgresStatement:
+
+    '''
+    A named SQL statement with `$1`-style placeholders.
+    It is prepared server-side the first time it runs on a pooled connection, and executed with bound parameters after that.
+    '''
+
+    def __init__(self, name: str, sql: str) -> None:
+        self.sql: str = ' '.join(sql.split())
+        self.label: str = name
+        # Hash the SQL into the name, so objects using different tables never collide on a shared connection
+        self.name: str = f"{name}_{md5(self.sql.encode()).hexdigest()[:8]}"
+        self.param_count: int = len(set(re.findall(r'\$(\d+)', self.sql)))
+        placeholders = ', '.join(['%s'] * self.param_count)
+        self.execute_sql: str = f"EXECUTE {self.name} ({placeholders})" if self.param_count else f"EXECUTE {self.name}"
+
+    def inline_sql(self, params: tuple = ()) -> Tuple[str, dict]:
+        '''
+        The SQL with `%(n)s` placeholders & matching params, for running it where a prepared statement can't go, ex. inside COPY
+        '''
+        return re.sub(r'\$(\d+)', r'%(\1)s', self.sql), {str(index + 1): value for index, value in enumerate(params)}
+
+    def execute(self, cursor, params: tuple = ()):
+        conn = cursor.connection
+        if self.name not in conn.prepared:
+            cursor.execute(f"PREPARE {self.name} AS {self.sql}")
+            conn.prepared.add(self.name)
+        cursor.execute(self.execute_sql, params)
+
+
+class PostgresStatements:
+
+    '''
+    The hot-path statements for one set of ticker/order/prediction tables.
+    Ticker & candle reads are for one symbol, written into the SQL so each symbol gets its own prepared statements.
+    '''
+
+    def __init__(self, ticker_table: str, order_table: str, prediction_table: str, symbol: str = CrosstowerConfig.DEFAULT_SYMBOL) -> None:
+        if not re.match(r'^[A-Za-z0-9_\-]+$', symbol):
+            raise Exception(f"Invalid symbol: {symbol}")
+        self.symbol = symbol
+        self.__ticker_table = ticker_table
+        self.__ticker_arrays: Dict[Tuple[str, ...], PostgresStatement] = {}
+        self.__ticker_ranges: Dict[Tuple[str, ...], PostgresStatement] = {}
+        self.insert_ticker = PostgresStatement('insert_ticker', f"""
+            INSERT INTO {ticker_table} {PostgresConfig.TICKER_COLUMNS}
+            VALUES (TO_TIMESTAMP($1), $2, $3, $4, $5, $6, $7, $8, $9, $10)""")
+        # One array per column, so a TickerBatch of any length is one fixed statement
+        self.insert_ticker_batch = PostgresStatement('insert_ticker_batch', f"""
+            INSERT INTO {ticker_table} {PostgresConfig.TICKER_COLUMNS}
+            SELECT TO_TIMESTAMP(ts), ask, bid, last, low, high, open, volume, volume_quote, symbol
+            FROM UNNEST($1::bigint[], $2::float8[], $3::float8[], $4::float8[], $5::float8[], $6::float8[], $7::float8[], $8::float8[], $9::float8[], $10::text[])
+                AS ticker (ts, ask, bid, last, low, high, open, volume, volume_quote, symbol)""")
+        self.insert_order = PostgresStatement('insert_order', f"""
+            INSERT INTO {order_table} {PostgresConfig.ORDER_COLUMNS}
+            VALUES (TO_TIMESTAMP($1), $2, $3, $4, $5, $6, $7, $8)""")
+        self.insert_prediction_vector = PostgresStatement('insert_prediction_vector', f"""
+            INSERT INTO {prediction_table} {PostgresConfig.PREDICTION_COLUMNS}
+            VALUES (TO_TIMESTAMP($1), $2, $3, $4, $5, $6, $7)""")
+        self.select_latest_tickers = PostgresStatement('select_latest_tickers', f"""
+            SELECT {PostgresConfig.TICKER_SELECT_COLUMNS} FROM {ticker_table}
+            WHERE symbol = '{symbol}' ORDER BY timestamp DESC LIMIT $1""")
+        self.select_latest_orders = PostgresStatement('select_latest_orders', f"""
+            SELECT {PostgresConfig.ORDER_SELECT_COLUMNS} FROM {order_table}
+            ORDER BY timestamp DESC LIMIT $1""")
+        self.select_all_orders = PostgresStatement('select_all_orders', f"""
+            SELECT {PostgresConfig.ORDER_SELECT_COLUMNS} FROM {order_table} ORDER BY timestamp ASC""")
+        self.select_order_exists = PostgresStatement('select_order_exists', f"""
+            SELECT 1 FROM {order_table} WHERE uuid = $1""")
+        # One row, kept up to date by Hermes as it records each order. FOR UPDATE holds it until the transaction ends
+        self.order_run_table = f'{order_table}{PostgresConfig.ORDER_RUN_TABLE_SUFFIX}'
+        self.select_order_run = PostgresStatement('select_order_run', f"""
+            SELECT side, count, quantities FROM {self.order_run_table}""")
+        self.lock_order_run = PostgresStatement('lock_order_run', f"""
+            SELECT side, count, quantities FROM {self.order_run_table} FOR UPDATE""")
+        self.update_order_run = PostgresStatement('update_order_run', f"""
+            UPDATE {self.order_run_table} SET side = $1, count = $2, quantities = $3""")
+        self.count_tickers = PostgresStatement('count_tickers', f"""
+            SELECT COUNT(*) FROM {ticker_table}""")
+        self.count_tickers_since = PostgresStatement('count_tickers_since', f"""
+            SELECT COUNT(*) FROM {ticker_table} WHERE timestamp > TO_TIMESTAMP($1)""")
+        self.select_latest_prediction_timestamp = PostgresStatement('select_latest_prediction_timestamp', f"""
+            SELECT FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint FROM {prediction_table} ORDER BY timestamp DESC LIMIT 1""")
+        self.notify = PostgresStatement('notify', "SELECT pg_notify($1, $2)")
+        # The status is written into the SQL rather than bound, so the generic plan can use the partial QUEUED indexes
+        self.select_queued_orders = PostgresStatement('select_queued_orders', f"""
+            SELECT {PostgresConfig.ORDER_SELECT_COLUMNS} FROM {order_table}
+            WHERE status = '{PostgresConfig.STATUS_QUEUED}' ORDER BY timestamp ASC""")
+        self.select_queued_predictions = PostgresStatement('select_queued_predictions', f"""
+            SELECT {PostgresConfig.PREDICTION_SELECT_COLUMNS} FROM {prediction_table}
+            WHERE status = '{PostgresConfig.STATUS_QUEUED}' ORDER BY timestamp ASC""")
+        # Depth, age of the oldest entry & the newest uuid of a queue, all answered from the partial QUEUED index
+        self.queued_order_stats = PostgresStatement('queued_order_stats', self.__queue_stats_sql(order_table))
+        self.queued_prediction_stats = PostgresStatement('queued_prediction_stats', self.__queue_stats_sql(prediction_table))
+        self.peek_queued_predictions = PostgresStatement('peek_queued_predictions', f"""
+            SELECT {PostgresConfig.PREDICTION_SELECT_COLUMNS} FROM {prediction_table}
+            WHERE status = '{PostgresConfig.STATUS_QUEUED}' ORDER BY timestamp ASC LIMIT $1""")
+        # Claim the oldest queued prediction & mark it in one statement. SKIP LOCKED lets concurrent workers each take a different row
+        self.claim_queued_prediction = PostgresStatement('claim_queued_prediction', f"""
+            UPDATE {prediction_table} SET status = '{PostgresConfig.STATUS_PROCESSING}', claimed_at = NOW(), claim_count = claim_count + 1
+            WHERE uuid = (
+                SELECT uuid FROM {prediction_table} WHERE status = '{PostgresConfig.STATUS_QUEUED}'
+                ORDER BY timestamp ASC LIMIT 1 FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {PostgresConfig.PREDICTION_SELECT_COLUMNS}""")
+        self.requeue_expired_predictions = PostgresStatement('requeue_expired_predictions', f"""
+            UPDATE {prediction_table}
+            SET status = CASE WHEN claim_count < $1 THEN '{PostgresConfig.STATUS_QUEUED}' ELSE '{PostgresConfig.STATUS_FAILED}' END
+            WHERE status = '{PostgresConfig.STATUS_PROCESSING}' AND claimed_at < NOW() - $2 * INTERVAL '1 second'
+            RETURNING uuid, status""")
+        self.update_order_status = PostgresStatement('update_order_status', f"""
+            UPDATE {order_table} SET status = $1 WHERE uuid = $2""")
+        self.update_prediction_status = PostgresStatement('update_prediction_status', f"""
+            UPDATE {prediction_table} SET status = $1 WHERE uuid = $2""")
+        self.candle_table = f'{ticker_table}{PostgresConfig.CANDLE_TABLE_SUFFIX}'
+        # Merge a batch of tickers into the candles at every resolution. Each candle keeps the open of its earliest ticker
+        # and the close of its latest, so batches can arrive in any order
+        self.upsert_candles = PostgresStatement('upsert_candles', f"""
+            INSERT INTO {self.candle_table} AS candle (symbol, resolution, bucket, open, high, low, close, volume, ticker_count, first_timestamp, last_timestamp)
+            SELECT symbol, resolution, TO_TIMESTAMP(bucket_epoch)::timestamp,
+                (ARRAY_AGG(price ORDER BY ts))[1], MAX(price), MIN(price), (ARRAY_AGG(price ORDER BY ts DESC))[1],
+                (ARRAY_AGG(volume ORDER BY ts DESC))[1], COUNT(*), TO_TIMESTAMP(MIN(ts))::timestamp, TO_TIMESTAMP(MAX(ts))::timestamp
+            FROM (
+                SELECT symbol, resolution, ts, price, volume, ts / resolution * resolution AS bucket_epoch
+                FROM UNNEST($1::bigint[], $2::float8[], $3::float8[], $4::text[]) AS ticker (ts, price, volume, symbol), UNNEST($5::int[]) AS resolution
+            ) AS rows
+            GROUP BY symbol, resolution, bucket_epoch
+            ON CONFLICT (symbol, resolution, bucket) DO UPDATE SET
+                open = CASE WHEN EXCLUDED.first_timestamp < candle.first_timestamp THEN EXCLUDED.open ELSE candle.open END,
+                high = GREATEST(candle.high, EXCLUDED.high),
+                low = LEAST(candle.low, EXCLUDED.low),
+                close = CASE WHEN EXCLUDED.last_timestamp >= candle.last_timestamp THEN EXCLUDED.close ELSE candle.close END,
+                volume = CASE WHEN EXCLUDED.last_timestamp >= candle.last_timestamp THEN EXCLUDED.volume ELSE candle.volume END,
+                ticker_count = candle.ticker_count + EXCLUDED.ticker_count,
+                first_timestamp = LEAST(candle.first_timestamp, EXCLUDED.first_timestamp),
+                last_timestamp = GREATEST(candle.last_timestamp, EXCLUDED.last_timestamp)""")
+        self.select_candles = PostgresStatement('select_candles', f"""
+            SELECT FLOOR(EXTRACT(EPOCH FROM bucket))::bigint, open, high, low, close, volume, ticker_count FROM {self.candle_table}
+            WHERE symbol = '{symbol}' AND resolution = $1 AND bucket >= TO_TIMESTAMP($2) AND bucket < TO_TIMESTAMP($3) ORDER BY bucket ASC""")
+        # Coarser candles built server-side from a stored resolution that divides them ($1)
+        self.rollup_candles = PostgresStatement('rollup_candles', f"""
+            SELECT bucket_epoch, (ARRAY_AGG(open ORDER BY bucket))[1], MAX(high), MIN(low), (ARRAY_AGG(close ORDER BY bucket DESC))[1],
+                (ARRAY_AGG(volume ORDER BY bucket DESC))[1], SUM(ticker_count)
+            FROM (
+                SELECT FLOOR(EXTRACT(EPOCH FROM bucket))::bigint / $2::int * $2::int AS bucket_epoch, * FROM {self.candle_table}
+                WHERE symbol = '{symbol}' AND resolution = $1 AND bucket >= TO_TIMESTAMP($3) AND bucket < TO_TIMESTAMP($4)
+            ) AS candles
+            GROUP BY bucket_epoch ORDER BY bucket_epoch ASC""")
+        # Candles no stored resolution divides, straight from the raw tickers
+        self.bucket_tickers = PostgresStatement('bucket_tickers', f"""
+            SELECT bucket_epoch, (ARRAY_AGG(price ORDER BY timestamp))[1], MAX(price), MIN(price), (ARRAY_AGG(price ORDER BY timestamp DESC))[1],
+                (ARRAY_AGG(volume ORDER BY timestamp DESC))[1], COUNT(*)
+            FROM (
+                SELECT FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint / $1::int * $1::int AS bucket_epoch, timestamp, ask AS price, volume
+                FROM {ticker_table} WHERE symbol = '{symbol}' AND timestamp >= TO_TIMESTAMP($2) AND timestamp < TO_TIMESTAMP($3)
+            ) AS tickers
+            GROUP BY bucket_epoch ORDER BY bucket_epoch ASC""")
+
+    def select_latest_tickers_array(self, columns: Iterable[str]) -> PostgresStatement:
+        '''
+        The statement behind get_latest_tickers_array, built once per selection of columns
+        '''
+        columns = self.__ticker_array_columns(columns)
+        if columns not in self.__ticker_arrays:
+            select_columns = self.__ticker_array_select(columns)
+            # Limit before converting the timestamps, so only the returned rows are converted, and flip to oldest first in the same query
+            self.__ticker_arrays[columns] = PostgresStatement('select_latest_tickers_array', f"""
+                SELECT FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint{select_columns} FROM (
+                    SELECT * FROM {self.__ticker_table} WHERE symbol = '{self.symbol}' AND timestamp IS NOT NULL ORDER BY timestamp DESC LIMIT $1
+                ) AS latest ORDER BY timestamp ASC""")
+        return self.__ticker_arrays[columns]
+
+    def select_tickers_array_between(self, columns: Iterable[str]) -> PostgresStatement:
+        '''
+        The statement behind get_tickers_array, built once per selection of columns
+        '''
+        columns = self.__ticker_array_columns(columns)
+        if columns not in self.__ticker_ranges:
+            self.__ticker_ranges[columns] = PostgresStatement('select_tickers_array_between', f"""
+                SELECT FLOOR(EXTRACT(EPOCH FROM timestamp))::bigint{self.__ticker_array_select(columns)} FROM {self.__ticker_table}
+                WHERE symbol = '{self.symbol}' AND timestamp >= TO_TIMESTAMP($1) AND timestamp < TO_TIMESTAMP($2) ORDER BY timestamp ASC""")
+        return self.__ticker_ranges[columns]
+
+    def select_candles_for(self, resolution: Union[str, int], start: int, end: int) -> Tuple[PostgresStatement, tuple]:
+        '''
+        The statement & parameters behind get_candles. Stored resolutions are read as they are, anything else is rolled up
+        from the largest stored resolution that divides it, or bucketed from the raw tickers if none does.
+        '''
+        seconds = candle_resolution_seconds(resolution)
+        stored = PostgresConfig.CANDLE_RESOLUTIONS.values()
+        if seconds in stored:
+            return self.select_candles, (seconds, start, end)
+        divisors = [base for base in stored if seconds % base == 0]
+        if divisors:
+            return self.rollup_candles, (max(divisors), seconds, start, end)
+        return self.bucket_tickers, (seconds, start, end)
+
+    def __ticker_array_columns(self, columns: Iterable[str]) -> Tuple[str, ...]:
+        columns = tuple(columns)
+        for column in columns:
+            if column not in PostgresConfig.TICKER_ARRAY_COLUMNS:
+                raise Exception(f"Invalid ticker column: {column}")
+        return columns
+
+    def __ticker_array_select(self, columns: Tuple[str, ...]) -> str:
+        # NULL prices come back as NaN rather than breaking the float64 columns
+        return ''.join(f", COALESCE({column}, 'NaN')" for column in columns)
+
+    def __queue_stats_sql(self, table: str) -> str:
+        return f"""
+            SELECT COUNT(*), EXTRACT(EPOCH FROM NOW()::timestamp - MIN(timestamp))::float8, (
+                SELECT uuid FROM {table} WHERE status = '{PostgresConfig.STATUS_QUEUED}' ORDER BY timestamp DESC LIMIT 1
+            ) FROM {table} WHERE status = '{PostgresConfig.STATUS_QUEUED}'"""
+
+
+def ticker_array_dtype(columns: Iterable[str]) -> np.dtype:
+    '''
+    NumPy dtype of a get_latest_tickers_array result: int64 epoch timestamp, then a float64 per column
+    '''
+    return np.dtype([('timestamp', np.int64)] + [(column, np.float64) for column in columns])
+
+
+def candle_resolution_seconds(resolution: Union[str, int]) -> int:
+    '''
+    Length of a candle in seconds, from a key of PostgresConfig.CANDLE_RESOLUTIONS, a duration like '15m', '4h' or '1w', or seconds
+    '''
+    if type(resolution) is int:
+        seconds = resolution
+    elif resolution in PostgresConfig.CANDLE_RESOLUTIONS:
+        seconds = PostgresConfig.CANDLE_RESOLUTIONS[resolution]
+    else:
+        match = re.match(r'^(\d+)([smhdw])$', str(resolution))
+        if not match:
+            raise Exception(f"Invalid candle resolution: {resolution}")
+        seconds = int(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}[match.group(2)]
+    if seconds <= 0:
+        raise Exception(f"Invalid candle resolution: {resolution}")
+    return seconds
+
+
+def ticker_symbol(ticker: Ticker, default_symbol: str) -> str:
+    '''
+    Symbol a ticker is stored under. Tickers built without one belong to `default_symbol`
+    '''
+    return ticker.symbol if ticker.symbol else default_symbol
+
+
+def nullable_list(column: np.ndarray) -> list:
+    '''
+    A TickerBatch column as a list of Python values, NaN becoming None so it is stored as NULL
+    '''
+    values = column.tolist()
+    if column.dtype.kind == 'f' and np.isnan(column).any():
+        return [None if value != value else value for value in values]
+    return values
+
+
+def batch_symbols(batch: TickerBatch, default_symbol: str) -> list:
+    '''
+    The symbol every ticker of a TickerBatch is stored under, like ticker_symbol
+    '''
+    return [symbol if symbol else default_symbol for symbol in batch['symbol'].tolist()]
+
+
+def ticker_batch_params(batch: TickerBatch, default_symbol: str = CrosstowerConfig.DEFAULT_SYMBOL) -> tuple:
+    '''
+    Parameters of PostgresStatements.insert_ticker_batch
+    '''
+    return (
+        batch['timestamp'].tolist(),
+        *[nullable_list(batch[column]) for column in PostgresConfig.TICKER_ARRAY_COLUMNS],
+        batch_symbols(batch, default_symbol)
+    )
+
+
+def candle_params(tickers: Union[List[Ticker], TickerBatch], default_symbol: str = CrosstowerConfig.DEFAULT_SYMBOL) -> tuple:
+    '''
+    Parameters of PostgresStatements.upsert_candles for a batch of tickers, of any mix of symbols
+    '''
+    if isinstance(tickers, TickerBatch):
+        return (
+            tickers['timestamp'].tolist(),
+            nullable_list(tickers['ask']),
+            nullable_list(tickers['volume']),
+            batch_symbols(tickers, default_symbol),
+            list(PostgresConfig.CANDLE_RESOLUTIONS.values())
+        )
+    return (
+        [ticker.timestamp for ticker in tickers],
+        [ticker.ask for ticker in tickers],
+        [ticker.volume for ticker in tickers],
+        [ticker_symbol(ticker, default_symbol) for ticker in tickers],
+        list(PostgresConfig.CANDLE_RESOLUTIONS.values())
+    )
+
+
 class PostgresOrder:
 
+    __slots__ = ('timestamp', 'quantity', 'side', 'status', 'uuid', 'usd_balance', 'btc_balance', 'current_price')
+
     def __init__(self, data: tuple) -> None:
-        self.timestamp: int = int(data[0])
-        self.quantity: float = float(data[1])
-        self.side: str = str(data[2])
-        self.status: str = str(data[3])
-        self.uuid: str = str(data[4])
-        self.usd_balance: float = float(data[5])
-        self.btc_balance: float = float(data[6])
-        self.current_price: float = float(data[7])
+        self.timestamp: int = data[0]
+        self.quantity: float = data[1]
+        self.side: str = data[2]
+        self.status: str = data[3]
+        self.uuid: str = data[4]
+        self.usd_balance: float = data[5]
+        self.btc_balance: float = data[6]
+        self.current_price: float = data[7]
 
 
 class MockPostgresOrder:
+
+    __slots__ = ('timestamp', 'quantity', 'side', 'ending_usd_balance', 'ending_btc_balance', 'current_price', 'local_timestamp', 'uuid', 'total_value', 'status')
     
     def __init__(self, data: tuple) -> None:
         self.timestamp = int(data[0])
@@ -57,39 +368,85 @@ class MockPostgresOrder:
 
 class PostgresTicker:
 
+    __slots__ = ('timestamp', 'ask', 'bid', 'last', 'low', 'high', 'open', 'volume', 'volume_quote')
+
     def __init__(self, data: tuple) -> None:
+        # Every column is bigint or float8, so the driver's values are used as they are
+        self.timestamp: int = data[0]
+        self.ask: float = data[1]
+        self.bid: float = data[2]
+        self.last: float = data[3]
+        self.low: float = data[4]
+        self.high: float = data[5]
+        self.open: float = data[6]
+        self.volume: float = data[7]
+        self.volume_quote: float = data[8]
+
+    @property
+    def csv_line(self) -> str:
+        # Built on request, most tickers are never written out
+        return f"{self.ask},{self.bid},{self.last},{self.low},{self.high},{self.open},{self.volume},{self.volume_quote},{self.timestamp}\n"
+
+class PostgresCandle:
+
+    __slots__ = ('timestamp', 'open', 'high', 'low', 'close', 'volume', 'ticker_count')
+
+    def __init__(self, data: tuple) -> None:
+        # Epoch seconds at the start of the candle
         self.timestamp: int = int(data[0])
-        self.ask: float = float(data[1])
-        self.bid: float = float(data[2])
-        self.last: float = float(data[3])
-        self.low: float = float(data[4])
-        self.high: float = float(data[5])
-        self.open: float = float(data[6])
-        self.volume: float = float(data[7])
-        self.volume_quote: float = float(data[8])
-        self.csv_line: str = f"{self.ask},{self.bid},{self.last},{self.low},{self.high},{self.open},{self.volume},{self.volume_quote},{self.timestamp}\n"
+        self.open: float = data[1]
+        self.high: float = data[2]
+        self.low: float = data[3]
+        self.close: float = data[4]
+        self.volume: float = data[5]
+        self.ticker_count: int = int(data[6])
+
+class PostgresQueueStats:
+
+    __slots__ = ('depth', 'oldest_age', 'newest_uuid')
+
+    def __init__(self, data: tuple) -> None:
+        self.depth: int = int(data[0])
+        self.oldest_age: float = float(data[1]) if data[1] is not None else None
+        self.newest_uuid: str = data[2]
 
 class PostgresPredictionVector:
 
+    __slots__ = ('timestamp', 'prediction_timestamp', 'weight', 'prediction_history', 'status', 'uuid', 'percent')
+
     def __init__(self, data: tuple) -> None:
         self.timestamp: int = data[0]
         self.prediction_timestamp: int = data[1]
-        self.weight: float = float(data[2])
-        self.prediction_history: List[float] = []
-        for prediction in data[3]:
-            self.prediction_history.append(float(prediction))
+        self.weight: float = data[2]
+        self.prediction_history: List[float] = list(data[3])
         self.status: str = data[4]
         self.uuid: str = data[5]
         self.percent: float = data[6]
 
 class Postgres:
 
-    def __init__(self, ticker_table_override: str = None, order_table_override: str = None, prediction_table_override: str = None) -> None:
+    '''
+    Reads & writes for the ticker, order and prediction tables.
+
+    Given a read-only DSN (the `read_dsn` argument, or the POSTGRES_READ_DSN environment variable), monitoring, reporting and
+    export reads go to that replica instead, so they can't slow down the writes on the primary. Those reads may lag the primary slightly.
+    If the replica fails, they fall back to the primary for READ_REPLICA_RETRY_INTERVAL seconds.
+    '''
+
+    def __init__(self, ticker_table_override: str = None, order_table_override: str = None, prediction_table_override: str = None, read_dsn: str = None,
+                 symbol: str = None) -> None:
         self.ticker_table_name = ticker_table_override if ticker_table_override is not None else PostgresConfig.TICKER_TABLE_NAME
         self.order_table_name = order_table_override if order_table_override is not None else PostgresConfig.ORDER_TABLE_NAME
         self.prediction_table_name = prediction_table_override if prediction_table_override is not None else PostgresConfig.PREDICTION_TABLE_NAME
+        # Ticker & candle reads are for this symbol. Writes store each ticker under its own symbol, or this one if it has none
+        self.symbol: str = symbol if symbol else CrosstowerConfig.DEFAULT_SYMBOL
+        self.statements = PostgresStatements(self.ticker_table_name, self.order_table_name, self.prediction_table_name, self.symbol)
+        self.candle_table_name = self.statements.candle_table
         self.log = Logger.setup(self.__class__.__name__)
         self.discord = DiscordWebhook("Postgres")
+        # Include connect_timeout in the DSN, so an unreachable replica fails fast
+        self.read_dsn: str = read_dsn if read_dsn is not None else env.postgres_read_dsn
+        self.read_replica_failed_at: float = 0
         try:
             self.__setup_connection()
         except:
@@ -101,22 +458,52 @@ class Postgres:
 
     def insert_ticker(self, ticker: Ticker):
         self.log.debug(f"Inserting ticker with timestamp: {ticker.timestamp}")
+        params = (ticker.timestamp, ticker.ask, ticker.bid, ticker.last, ticker.low, ticker.high, ticker.open, ticker.volume, ticker.volume_quote,
+                  ticker_symbol(ticker, self.symbol))
+        self._query(self.statements.insert_ticker, False, params)
+
+    def insert_tickers_bulk(self, tickers: Union[List[Ticker], TickerBatch]):
+        '''
+        Insert many tickers with a single multi-row INSERT, in one round trip and one commit.
+        A TickerBatch goes in as one array per column, through a prepared statement.
+
+        :param tickers: The tickers to insert, in any order & of any mix of symbols
+        '''
+        if not len(tickers):
+            return
+        if isinstance(tickers, TickerBatch):
+            self.log.debug(f"Bulk inserting a batch of {len(tickers)} tickers, latest timestamp: {tickers['timestamp'][-1]}")
+            self._query(self.statements.insert_ticker_batch, False, ticker_batch_params(tickers, self.symbol))
+            return
+        self.log.debug(f"Bulk inserting {len(tickers)} tickers, latest timestamp: {tickers[-1].timestamp}")
+        row_template = '(TO_TIMESTAMP(%s), %s, %s, %s, %s, %s, %s, %s, %s, %s)'
         query = f"""INSERT INTO {self.ticker_table_name} {PostgresConfig.TICKER_COLUMNS}
-        VALUES (TO_TIMESTAMP({ticker.timestamp}), {ticker.ask}, {ticker.bid}, {ticker.last}, {ticker.low}, {ticker.high}, {ticker.open}, {ticker.volume}, {ticker.volume_quote})"""
-        self._query(query, False)
+        VALUES {', '.join([row_template] * len(tickers))}"""
+        params = []
+        for ticker in tickers:
+            params.extend((ticker.timestamp, ticker.ask, ticker.bid, ticker.last, ticker.low, ticker.high, ticker.open, ticker.volume, ticker.volume_quote,
+                           ticker_symbol(ticker, self.symbol)))
+        self._query(query, False, tuple(params))
+
+    def update_candles(self, tickers: Union[List[Ticker], TickerBatch]):
+        '''
+        Merge tickers into the OHLCV candles at every resolution in PostgresConfig.CANDLE_RESOLUTIONS.
+        Run it in the same transaction as the ticker insert, so the candles never drift from the raw tickers.
+        '''
+        if not tickers:
+            return
+        self._query(self.statements.upsert_candles, False, candle_params(tickers, self.symbol))
 
     def insert_order(self, order: Order, current_price: float, crypto_balance: float, fiat_balance: float):
         self.log.debug(f"Inserting order with uuid: {order.uuid}")
-        query = f"""INSERT INTO {self.order_table_name} {PostgresConfig.ORDER_COLUMNS}
-        VALUES (TO_TIMESTAMP({int(now())}), {order.quantity}, '{order.side}', '{PostgresConfig.STATUS_QUEUED}', '{order.uuid}', {fiat_balance}, {crypto_balance}, {current_price})"""
-        self._query(query, False)
+        params = (int(now()), order.quantity, order.side, PostgresConfig.STATUS_QUEUED, order.uuid, fiat_balance, crypto_balance, current_price)
+        self._query(self.statements.insert_order, False, params)
 
     def insert_prediction_vector(self, prediction_vector: PredictionVector):
         self.log.debug(f"Inserting prediction vector with uuid: {prediction_vector.uuid}")
-        history = self.__convert_prediction_history_to_string(prediction_vector.prediction_history)
-        query = f"""INSERT INTO {self.prediction_table_name} {PostgresConfig.PREDICTION_COLUMNS}
-        VALUES (TO_TIMESTAMP({int(now())}), {prediction_vector.timestamp}, {prediction_vector.weight}, {history}, '{PostgresConfig.STATUS_QUEUED}', '{prediction_vector.uuid}', {prediction_vector.percent})"""
-        self._query(query, False)
+        history = self.__convert_prediction_history_to_floats(prediction_vector.prediction_history)
+        params = (int(now()), prediction_vector.timestamp, prediction_vector.weight, history, PostgresConfig.STATUS_QUEUED, prediction_vector.uuid, prediction_vector.percent)
+        self._query(self.statements.insert_prediction_vector, False, params)
 
     # Public Methods - SELECT
 
@@ -127,17 +514,71 @@ class Postgres:
         :param row_count: The number of rows to return
         :return: A list of PostgresTicker objects
         """
-        query = PostgresConfig.TICKER_SELECT_NEWEST % row_count
-        result = self._query(query, True)
+        result = self._query(self.statements.select_latest_tickers, True, (row_count,))
         if type(result) is list:
             result.reverse()
             return list(map(self.__convert_result_to_ticker, result))
         else:
             return []
 
+    def get_latest_tickers_batch(self, row_count: int) -> TickerBatch:
+        '''
+        The newest tickers as a TickerBatch, oldest first, with every price column
+
+        :param row_count: The number of rows to return
+        '''
+        result = self._query(self.statements.select_latest_tickers, True, (row_count,))
+        if not result:
+            return TickerBatch()
+        result.reverse()
+        return TickerBatch.from_db_rows(result, self.symbol)
+
+    def get_latest_tickers_array(self, row_count: int, columns: Iterable[str] = PostgresConfig.TICKER_ARRAY_COLUMNS) -> np.ndarray:
+        """
+        Fetch the newest tickers as a NumPy structured array, oldest first.
+        Every value comes back as bigint/float8, so rows go straight from the cursor into the array
+        without building a PostgresTicker per row.
+
+        :param row_count: The number of rows to return
+        :param columns: Ticker columns to include, from PostgresConfig.TICKER_ARRAY_COLUMNS. `timestamp` (epoch seconds) is always included.
+        :return: Structured array with an int64 `timestamp` field and a float64 field per column, ex. `array['ask']`
+        """
+        columns = list(columns)
+        statement = self.statements.select_latest_tickers_array(columns)
+        dtype = ticker_array_dtype(columns)
+        result = self._query(statement, True, (row_count,))
+        if not result:
+            return np.empty(0, dtype=dtype)
+        return np.array(result, dtype=dtype)
+
+    def get_tickers_array(self, start: int, end: int, columns: Iterable[str] = PostgresConfig.TICKER_ARRAY_COLUMNS) -> np.ndarray:
+        '''
+        Every ticker in [start, end) still in Postgres, as a NumPy structured array oldest first, like get_latest_tickers_array.
+        Runs on the read replica if there is one. Use `TickerArchive.get_tickers` to include archived tickers.
+
+        :param start: Epoch seconds
+        :param end: Epoch seconds, exclusive
+        '''
+        columns = list(columns)
+        dtype = ticker_array_dtype(columns)
+        result = self._query(self.statements.select_tickers_array_between(columns), True, (start, end), replica=True)
+        if not result:
+            return np.empty(0, dtype=dtype)
+        return np.array(result, dtype=dtype)
+
+    def get_candles(self, resolution: Union[str, int], start: int, end: int) -> List[PostgresCandle]:
+        '''
+        OHLCV candles of the ask price, oldest first, for every bucket starting in [start, end)
+
+        :param resolution: A key of PostgresConfig.CANDLE_RESOLUTIONS (ex. '5m'), another duration (ex. '15m', '4h', '1w'), or seconds
+        :param start: Epoch seconds, best aligned to the resolution so the first candle is complete
+        :param end: Epoch seconds, exclusive
+        '''
+        statement, params = self.statements.select_candles_for(resolution, start, end)
+        return [PostgresCandle(row) for row in self._query(statement, True, params, replica=True)]
+
     def get_ticker_count(self):
-        query = f"SELECT COUNT(*) FROM {self.ticker_table_name}"
-        result = self._query(query, True)
+        result = self._query(self.statements.count_tickers, True, replica=True)
         return result[0][0]
 
     def get_queued_orders(self) -> List[PostgresOrder]:
@@ -145,8 +586,7 @@ class Postgres:
         Get all the orders that have not been processed.
         :return: A list of Order objects
         """
-        query = f"""SELECT * FROM {self.order_table_name} WHERE status = 'QUEUED' ORDER BY timestamp ASC"""
-        result = self._query(query, True)
+        result = self._query(self.statements.select_queued_orders, True)
         return list(map(self.__convert_result_to_order, result))
     
     def get_latest_orders(self, row_count: int) -> List[PostgresOrder]:
@@ -156,8 +596,7 @@ class Postgres:
         :param row_count: The number of rows to return
         :return: A list of PostgresOrder objects
         """
-        query = f"SELECT * FROM {self.order_table_name} ORDER BY timestamp DESC LIMIT {row_count}"
-        result = self._query(query, True)
+        result = self._query(self.statements.select_latest_orders, True, (row_count,), replica=True)
         if type(result) is list:
             result.reverse()
             return list(map(self.__convert_result_to_order, result))
@@ -170,8 +609,7 @@ class Postgres:
         
         :return: A list of Order objects
         """
-        query = f"""SELECT {PostgresConfig.ORDER_COLUMNS} FROM {self.order_table_name} ORDER BY timestamp ASC"""
-        result = self._query(query, True)
+        result = self._query(self.statements.select_all_orders, True, replica=True)
         return list(map(self.__convert_result_to_order, result))
 
     def get_queued_predictions(self) -> List[PostgresPredictionVector]:
@@ -179,48 +617,110 @@ class Postgres:
         Get all the enqueued predictions from the database
         :return: A list of PredictionVector objects.
         """
-        query = f"""SELECT * FROM {self.prediction_table_name} WHERE status = 'QUEUED' ORDER BY timestamp ASC"""
-        result = self._query(query, True)
+        result = self._query(self.statements.select_queued_predictions, True)
         return list(map(self.__convert_result_to_prediction, result))
     
+    def get_order_queue_stats(self) -> PostgresQueueStats:
+        """
+        Size of the order queue, without loading the queued orders
+        :return: Queue depth, age of the oldest queued order in seconds (None if empty), and the newest queued uuid
+        """
+        return PostgresQueueStats(self._query(self.statements.queued_order_stats, True, replica=True)[0])
+
+    def get_prediction_queue_stats(self) -> PostgresQueueStats:
+        """
+        Size of the prediction queue, without loading the queued predictions
+        :return: Queue depth, age of the oldest queued prediction in seconds (None if empty), and the newest queued uuid
+        """
+        return PostgresQueueStats(self._query(self.statements.queued_prediction_stats, True, replica=True)[0])
+
+    def peek_queued_predictions(self, row_count: int) -> List[PostgresPredictionVector]:
+        """
+        The oldest queued predictions, without claiming them
+        """
+        result = self._query(self.statements.peek_queued_predictions, True, (row_count,))
+        return list(map(self.__convert_result_to_prediction, result))
+
     def get_latest_prediction_timestamp(self) -> int:
         """
         Get the latest prediction from the database
         :return: A PredictionVector object
         """
-        query = f"""SELECT timestamp FROM {self.prediction_table_name} ORDER BY timestamp DESC LIMIT 1"""
-        result = self._query(query, True)
-        return int(result[0][0])
+        result = self._query(self.statements.select_latest_prediction_timestamp, True)
+        return result[0][0]
 
     def get_ticker_count_for_last_hour(self) -> int:
         """
         Get the number of tickers in the last hour
         :return: The number of tickers in the last hour
         """
-        query = f"""SELECT COUNT(*) FROM ticker_feed WHERE local_timestamp > {int(now()) - 3600}"""
-        result = self._query(query, True)
+        result = self._query(self.statements.count_tickers_since, True, (int(now()) - 3600,), replica=True)
         return result[0][0]
     
-    def get_latest_stack_of_same_orders(self) -> List[PostgresOrder]:
-        query = f"""SELECT side FROM {self.order_table_name} ORDER BY timestamp DESC LIMIT 1"""
-        last_side = self._query(query, True)[0][0]
-        query = f"SELECT timestamp from {self.order_table_name} where side != '{last_side}' ORDER BY timestamp DESC LIMIT 1"
-        earliest_timestamp = self._query(query, True)[0][0]
-        query = f"SELECT * FROM {self.order_table_name} where timestamp > {earliest_timestamp} and side = '{last_side}' ORDER BY timestamp ASC"
-        result = self._query(query, True)
-        return list(map(self.__convert_result_to_order, result))
+    def get_order_run(self, sum_limit: int = TradingConfig.ORDER_RUN_SUM_LIMIT, lock: bool = False) -> OrderRun:
+        """
+        Get the current run of same-side orders, as last written by update_order_run.
+        :param sum_limit: Number of orders after the first whose quantities are needed to size a reversal
+        :param lock: Inside a transaction, lock the run until the transaction ends. Any other transaction locking
+            it waits, then sees the run as this one leaves it
+        :return: An OrderRun, empty if there are no orders
+        """
+        result = self._query(self.statements.lock_order_run if lock else self.statements.select_order_run, True)
+        if not result:
+            return OrderRun(sum_limit=sum_limit)
+        return OrderRun(side=result[0][0], count=result[0][1], quantities=result[0][2], sum_limit=sum_limit)
 
     # Public Methods - UPDATE
 
     def update_prediction_status(self, prediction_uuid: str, new_status: str):
         status = self.__parse_allowed_statuses(new_status)
-        query = f"""UPDATE {self.prediction_table_name} SET status = '{status}' WHERE uuid = '{prediction_uuid}'"""
-        self._query(query, False)
+        self._query(self.statements.update_prediction_status, False, (status, prediction_uuid))
         
     def update_order_status(self, uuid: str, new_status: str):
         status = self.__parse_allowed_statuses(new_status)
-        query = f"""UPDATE {self.order_table_name} SET status = '{status}' WHERE uuid = '{uuid}'"""
-        self._query(query, False)
+        self._query(self.statements.update_order_status, False, (status, uuid))
+
+    def update_order_run(self, order_run: OrderRun):
+        """
+        Store the run of same-side orders. Call it in the same transaction as the order that changed the run.
+        """
+        self._query(self.statements.update_order_run, False, (order_run.side, order_run.count, order_run.quantities))
+
+    def claim_queued_prediction(self) -> PostgresPredictionVector:
+        """
+        Atomically take the oldest queued prediction and mark it as processing.
+        Safe to call from several workers at once, each prediction is only ever handed to one of them.
+        :return: The claimed prediction, or None if nothing is queued
+        """
+        result = self._query(self.statements.claim_queued_prediction, True)
+        return self.__convert_result_to_prediction(result[0]) if result else None
+
+    def requeue_expired_predictions(self, visibility_timeout: int, max_claims: int) -> List[Tuple[str, str]]:
+        """
+        Put predictions that have been processing for longer than the visibility timeout back in the queue,
+        ex. because the worker that claimed them died. Predictions already claimed `max_claims` times are failed instead.
+        :return: (uuid, new status) for each prediction that was reset
+        """
+        return self._query(self.statements.requeue_expired_predictions, True, (max_claims, visibility_timeout))
+
+    def has_order(self, uuid: str) -> bool:
+        result = self._query(self.statements.select_order_exists, True, (uuid,))
+        return len(result) > 0
+
+    # Public Methods - NOTIFY
+
+    def notify(self, channel: str, payload: str = ''):
+        '''
+        Wake anything listening on a channel (see PostgresListener)
+        '''
+        self._query(self.statements.notify, False, (channel, payload))
+
+    @property
+    def prediction_channel(self) -> str:
+        '''
+        The channel notified when a prediction is queued. Named after the table, so the testing tables don't wake production.
+        '''
+        return f'{self.prediction_table_name}_queued'
 
     # Public Methods - MOCK/TESTING
 
@@ -233,13 +733,13 @@ class Postgres:
     
     def insert_mock_order(self, quantity: float, side: str, ending_usd_balance: float, ending_btc_balance: float, current_btc_price: float, total_value: float, uuid: str):
         self.log.debug(f"Inserting mock order with uuid: {uuid}")
-        query = f"""INSERT INTO _mock_order_feed (timestamp, quantity, side, ending_usd_balance, ending_btc_balance, current_btc_price, total_value, uuid)
-        VALUES ({int(now())}, {quantity}, '{side}', {ending_usd_balance}, {ending_btc_balance}, {current_btc_price}, {total_value}, '{uuid}')"""
-        self._query(query, False)
+        query = """INSERT INTO _mock_order_feed (timestamp, quantity, side, ending_usd_balance, ending_btc_balance, current_btc_price, total_value, uuid)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"""
+        self._query(query, False, (int(now()), quantity, side, ending_usd_balance, ending_btc_balance, current_btc_price, total_value, uuid))
         
     def get_latest_mock_orders(self, row_count: int) -> List[MockPostgresOrder]:
-        query = f"SELECT {PostgresConfig.ORDER_COLUMNS} FROM {self.order_table_name} ORDER BY timestamp DESC LIMIT {row_count}"
-        result = self._query(query, True)
+        query = f"SELECT {PostgresConfig.ORDER_COLUMNS} FROM {self.order_table_name} ORDER BY timestamp DESC LIMIT %s"
+        result = self._query(query, True, (row_count,))
         return list(map(self.__convert_result_to_order, result))
     
     def __convert_result_to_mock_order(self, result) -> MockPostgresOrder:
@@ -257,8 +757,9 @@ class Postgres:
     def __convert_result_to_prediction(self, result) -> PostgresPredictionVector:
         return PostgresPredictionVector(result)
 
-    def __convert_prediction_history_to_string(self, prediction_history: List[float]) -> str:
-        return "ARRAY " + str(prediction_history)
+    def __convert_prediction_history_to_floats(self, prediction_history: List[float]) -> List[float]:
+        # prediction_history is a float8[] column, and the model hands back numpy floats the driver can't adapt
+        return [float(prediction) for prediction in prediction_history]
 
     def __parse_allowed_statuses(self, status: str):
         for allowed_status in PostgresConfig.ALLOWED_STATUSES:
@@ -266,24 +767,59 @@ class Postgres:
                 return allowed_status
         raise Exception(f"Invalid status: {status}")
 
-    def _query(self, query_str: str, fetch_result: bool):
+    def _query(self, query: Union[str, PostgresStatement], fetch_result: bool, params: tuple = None, replica: bool = False):
+        '''
+        Run a query on a pooled connection, retrying up to 3 times.
+        `query` is either a plain SQL string using `%s` placeholders, or a PostgresStatement using `$1` placeholders.
+        `replica` sends a read to the read replica, if there is one. Inside a transaction it stays on the primary.
+        '''
+        query_str = query.sql if type(query) is PostgresStatement else query
+        # Per-query logging is too noisy, enable PostgresConfig.QUERY_METRICS_ENABLED to see where the time goes
+        metrics = self.query_metrics if self.query_metrics.enabled else None
+        if metrics:
+            label = query.label if type(query) is PostgresStatement else label_for_sql(query_str)
         result = None
         attempt = 0
         completed = False
+        use_replica = replica and self.__read_replica_available()
         while attempt < 3:
+            conn = None
             try:
-                with PostgresCursor(self.conn) as cursor:
-                    # Too noisy
-                    # self.log.debug('Submitting query to Postgres: "%s"', query_str)
-                    cursor.execute(query_str)
+                pool = self.__read_pool() if use_replica else self.pool
+                with pool.connection() as conn, PostgresCursor(conn) as cursor:
+                    # Timed from checkout, time spent waiting on a busy pool is counted in pool_stats instead
+                    start = perf_counter()
+                    if type(query) is PostgresStatement:
+                        query.execute(cursor, params)
+                    else:
+                        cursor.execute(query, params)
                     if fetch_result:
                         result = cursor.fetchall()
+                    rows = len(result) if fetch_result else max(cursor.rowcount, 0)
+                if metrics:
+                    metrics.record(label, query_str, (perf_counter() - start) * 1000, rows)
                 completed = True
                 break
             except:
-                message = f"**SQL Query Failed**: {query_str}\n{traceback.format_exc()}"
+                if use_replica:
+                    self.log.warning(f'Read replica query failed, reading from the primary for the next {PostgresConfig.READ_REPLICA_RETRY_INTERVAL}s: {query_str}\n{traceback.format_exc()}')
+                    self.read_replica_failed_at = now()
+                    use_replica = False
+                    continue
+                message = f"**SQL Query Failed**: {query_str} {params if params else ''}\n{traceback.format_exc()}"
                 self.log.error(message)
-                self.__reconnect()
+                in_transaction = self.pool.pinned is not None
+                retrying = not in_transaction and attempt < 2
+                if metrics:
+                    metrics.record_error(label, retrying=retrying)
+                if in_transaction:
+                    # The transaction is aborted, so retrying here can't work. Let transaction() roll it back.
+                    raise
+                if retrying and conn is not None and conn.closed:
+                    # The pool closes a connection it can't reset & discards it, so the retry checks out a new one
+                    self.log.debug("Retrying on a new connection...")
+                    if metrics:
+                        metrics.record_reconnect()
                 attempt += 1
                 continue
         if not completed:
@@ -293,11 +829,56 @@ class Postgres:
         return result        
 
     def __setup_connection(self):
-        self.conn = psql.connect(f"dbname='{env.postgres_database}' user='{env.postgres_user}' host='{env.postgres_host}' password='{env.postgres_password}'")
-    
-    def __reconnect(self):
-        self.log.debug("Attempting to reconnect...")
-        self.__setup_connection()
+        # Connections are shared process-wide, so every Postgres object draws from the same pool
+        self.pool = PostgresPool.shared(f"dbname='{env.postgres_database}' user='{env.postgres_user}' host='{env.postgres_host}' password='{env.postgres_password}'")
+
+    def __read_pool(self) -> PostgresPool:
+        # Opened on first use, so a replica that is down never stops the primary from being used
+        return PostgresPool.shared(self.read_dsn)
+
+    def __read_replica_available(self) -> bool:
+        return (bool(self.read_dsn) and self.pool.pinned is None
+                and now() - self.read_replica_failed_at >= PostgresConfig.READ_REPLICA_RETRY_INTERVAL)
+
+    def copy_to(self, file, query: Union[str, PostgresStatement], params: tuple = None, header: bool = True) -> int:
+        '''
+        Stream the result of a query into a file as CSV, using `COPY (...) TO STDOUT`.
+        Rows are written as they arrive from the server, so memory use stays flat however large the result.
+        Runs on the read replica if there is one. Not retried, since part of the result may already be written.
+
+        :param file: Any object with a `write()` method
+        :param query: A plain SQL string using `%s` placeholders, or a PostgresStatement
+        :param header: Start with a row of column names
+        :return: Number of rows written
+        '''
+        if type(query) is PostgresStatement:
+            query, params = query.inline_sql(params or ())
+        pool = self.__read_pool() if self.__read_replica_available() else self.pool
+        with pool.connection() as conn, PostgresCursor(conn) as cursor:
+            sql = cursor.mogrify(query, params).decode()
+            cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT CSV, HEADER {'TRUE' if header else 'FALSE'})", file)
+            return cursor.rowcount
+
+    def transaction(self):
+        '''
+        Group every query made from this thread inside a `with postgres.transaction():` block into one commit.
+        Rolls everything back if the block raises. Queries are not retried inside a transaction.
+        '''
+        return self.pool.transaction()
+
+    @property
+    def query_metrics(self) -> PostgresQueryMetrics:
+        '''
+        Query latency & retry metrics, shared by every Postgres object in the process. Off by default.
+        '''
+        return PostgresQueryMetrics.shared()
+
+    @property
+    def pool_stats(self) -> dict:
+        '''
+        Connection counters for the shared pool behind this object (created, discarded, checkouts, waits, timeouts, in_use, idle...)
+        '''
+        return self.pool.stats
 
 
 if __name__ == "__main__":
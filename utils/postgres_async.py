@@ -0,0 +1,260 @@
+import asyncio
+import traceback
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from time import time as now
+from typing import Iterable, List, Tuple, Union
+
+import asyncpg
+import numpy as np
+
+from crosstower.models import Order, Ticker
+from olympus.helper_objects import PredictionVector
+from olympus.helper_objects.order_run import OrderRun
+from olympus.helper_objects.ticker_batch import TickerBatch
+
+from utils import DiscordWebhook, Logger
+from utils.config import CrosstowerConfig, PostgresConfig, TradingConfig
+from utils.environment import env
+from utils.postgres import (PostgresCandle, PostgresOrder, PostgresPredictionVector, PostgresQueueStats, PostgresStatement,
+                            PostgresStatements, PostgresTicker, candle_params, ticker_array_dtype, ticker_batch_params, ticker_symbol)
+
+
+class AsyncPostgres:
+
+    '''
+    asyncio counterpart to `utils.postgres.Postgres`, backed by asyncpg and its own connection pool.
+    Same methods & return types, as coroutines, running the same SQL (see PostgresStatements).
+
+    The pool belongs to the event loop that first uses it. Either use `async with AsyncPostgres() as postgres:`,
+    or `await postgres.connect()` up front & `await postgres.close()` when done.
+    '''
+
+    def __init__(self, ticker_table_override: str = None, order_table_override: str = None, prediction_table_override: str = None, symbol: str = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.discord = DiscordWebhook(self.__class__.__name__)
+        self.ticker_table_name = ticker_table_override if ticker_table_override else PostgresConfig.TICKER_TABLE_NAME
+        self.order_table_name = order_table_override if order_table_override else PostgresConfig.ORDER_TABLE_NAME
+        self.prediction_table_name = prediction_table_override if prediction_table_override else PostgresConfig.PREDICTION_TABLE_NAME
+        self.symbol: str = symbol if symbol else CrosstowerConfig.DEFAULT_SYMBOL
+        self.statements = PostgresStatements(self.ticker_table_name, self.order_table_name, self.prediction_table_name, self.symbol)
+        self.candle_table_name = self.statements.candle_table
+        self.pool: asyncpg.Pool = None
+        # The connection of the enclosing `transaction()` block, per task
+        self.__pinned: ContextVar = ContextVar(f'AsyncPostgres.pinned.{id(self)}', default=None)
+
+    async def __aenter__(self) -> 'AsyncPostgres':
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        await self.close()
+
+    async def connect(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                host=env.postgres_host,
+                user=env.postgres_user,
+                password=env.postgres_password,
+                database=env.postgres_database,
+                min_size=PostgresConfig.POOL_MIN_SIZE,
+                max_size=PostgresConfig.POOL_MAX_SIZE
+            )
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    @asynccontextmanager
+    async def transaction(self):
+        '''
+        Group every query made from this task inside an `async with postgres.transaction():` block into one commit.
+        Rolls everything back if the block raises. Queries are not retried inside a transaction, and nested blocks join the outer one.
+        '''
+        if self.__pinned.get() is not None:
+            yield
+            return
+        await self.connect()
+        async with self.pool.acquire() as conn, conn.transaction():
+            token = self.__pinned.set(conn)
+            try:
+                yield
+            finally:
+                self.__pinned.reset(token)
+
+    # Public Methods - INSERT
+
+    async def insert_ticker(self, ticker: Ticker):
+        self.log.debug(f"Inserting ticker with timestamp: {ticker.timestamp}")
+        await self._query(self.statements.insert_ticker, False, self.__ticker_params(ticker))
+
+    async def insert_tickers_bulk(self, tickers: Union[List[Ticker], TickerBatch]):
+        '''
+        Insert many tickers in one transaction. asyncpg pipelines the rows, so this is a single round trip.
+        A TickerBatch goes in as one array per column, in a single statement.
+        '''
+        if not len(tickers):
+            return
+        if isinstance(tickers, TickerBatch):
+            self.log.debug(f"Bulk inserting a batch of {len(tickers)} tickers, latest timestamp: {tickers['timestamp'][-1]}")
+            await self._query(self.statements.insert_ticker_batch, False, ticker_batch_params(tickers, self.symbol))
+            return
+        self.log.debug(f"Bulk inserting {len(tickers)} tickers, latest timestamp: {tickers[-1].timestamp}")
+        await self._execute_many(self.statements.insert_ticker, [self.__ticker_params(ticker) for ticker in tickers])
+
+    async def update_candles(self, tickers: Union[List[Ticker], TickerBatch]):
+        if not len(tickers):
+            return
+        await self._query(self.statements.upsert_candles, False, candle_params(tickers, self.symbol))
+
+    async def insert_order(self, order: Order, current_price: float, crypto_balance: float, fiat_balance: float):
+        self.log.debug(f"Inserting order with uuid: {order.uuid}")
+        params = (int(now()), order.quantity, order.side, PostgresConfig.STATUS_QUEUED, order.uuid, fiat_balance, crypto_balance, current_price)
+        await self._query(self.statements.insert_order, False, params)
+
+    async def insert_prediction_vector(self, prediction_vector: PredictionVector):
+        self.log.debug(f"Inserting prediction vector with uuid: {prediction_vector.uuid}")
+        # prediction_history is a float8[] column
+        history = [float(prediction) for prediction in prediction_vector.prediction_history]
+        params = (int(now()), prediction_vector.timestamp, prediction_vector.weight, history, PostgresConfig.STATUS_QUEUED, prediction_vector.uuid, prediction_vector.percent)
+        await self._query(self.statements.insert_prediction_vector, False, params)
+
+    # Public Methods - SELECT
+
+    async def get_latest_tickers(self, row_count: int) -> List[PostgresTicker]:
+        result = await self._query(self.statements.select_latest_tickers, True, (row_count,))
+        return [PostgresTicker(row) for row in reversed(result)]
+
+    async def get_latest_tickers_array(self, row_count: int, columns: Iterable[str] = PostgresConfig.TICKER_ARRAY_COLUMNS) -> np.ndarray:
+        columns = list(columns)
+        statement = self.statements.select_latest_tickers_array(columns)
+        dtype = ticker_array_dtype(columns)
+        result = await self._query(statement, True, (row_count,))
+        if not result:
+            return np.empty(0, dtype=dtype)
+        return np.array([tuple(row) for row in result], dtype=dtype)
+
+    async def get_candles(self, resolution: Union[str, int], start: int, end: int) -> List[PostgresCandle]:
+        statement, params = self.statements.select_candles_for(resolution, start, end)
+        return [PostgresCandle(row) for row in await self._query(statement, True, params)]
+
+    async def get_ticker_count(self) -> int:
+        result = await self._query(self.statements.count_tickers, True)
+        return result[0][0]
+
+    async def get_ticker_count_for_last_hour(self) -> int:
+        result = await self._query(self.statements.count_tickers_since, True, (int(now()) - 3600,))
+        return result[0][0]
+
+    async def get_queued_orders(self) -> List[PostgresOrder]:
+        result = await self._query(self.statements.select_queued_orders, True)
+        return [PostgresOrder(row) for row in result]
+
+    async def get_latest_orders(self, row_count: int) -> List[PostgresOrder]:
+        result = await self._query(self.statements.select_latest_orders, True, (row_count,))
+        return [PostgresOrder(row) for row in reversed(result)]
+
+    async def get_all_orders(self) -> List[PostgresOrder]:
+        result = await self._query(self.statements.select_all_orders, True)
+        return [PostgresOrder(row) for row in result]
+
+    async def has_order(self, uuid: str) -> bool:
+        result = await self._query(self.statements.select_order_exists, True, (uuid,))
+        return len(result) > 0
+
+    async def get_order_run(self, sum_limit: int = TradingConfig.ORDER_RUN_SUM_LIMIT, lock: bool = False) -> OrderRun:
+        result = await self._query(self.statements.lock_order_run if lock else self.statements.select_order_run, True)
+        if not result:
+            return OrderRun(sum_limit=sum_limit)
+        return OrderRun(side=result[0][0], count=result[0][1], quantities=result[0][2], sum_limit=sum_limit)
+
+    async def get_queued_predictions(self) -> List[PostgresPredictionVector]:
+        result = await self._query(self.statements.select_queued_predictions, True)
+        return [PostgresPredictionVector(row) for row in result]
+
+    async def peek_queued_predictions(self, row_count: int) -> List[PostgresPredictionVector]:
+        result = await self._query(self.statements.peek_queued_predictions, True, (row_count,))
+        return [PostgresPredictionVector(row) for row in result]
+
+    async def get_order_queue_stats(self) -> PostgresQueueStats:
+        return PostgresQueueStats((await self._query(self.statements.queued_order_stats, True))[0])
+
+    async def get_prediction_queue_stats(self) -> PostgresQueueStats:
+        return PostgresQueueStats((await self._query(self.statements.queued_prediction_stats, True))[0])
+
+    async def get_latest_prediction_timestamp(self) -> int:
+        result = await self._query(self.statements.select_latest_prediction_timestamp, True)
+        return result[0][0]
+
+    # Public Methods - UPDATE
+
+    async def update_prediction_status(self, prediction_uuid: str, new_status: str):
+        await self._query(self.statements.update_prediction_status, False, (self.__parse_allowed_statuses(new_status), prediction_uuid))
+
+    async def update_order_status(self, uuid: str, new_status: str):
+        await self._query(self.statements.update_order_status, False, (self.__parse_allowed_statuses(new_status), uuid))
+
+    async def update_order_run(self, order_run: OrderRun):
+        await self._query(self.statements.update_order_run, False, (order_run.side, order_run.count, order_run.quantities))
+
+    async def claim_queued_prediction(self) -> PostgresPredictionVector:
+        result = await self._query(self.statements.claim_queued_prediction, True)
+        return PostgresPredictionVector(result[0]) if result else None
+
+    async def requeue_expired_predictions(self, visibility_timeout: int, max_claims: int) -> List[Tuple[str, str]]:
+        result = await self._query(self.statements.requeue_expired_predictions, True, (max_claims, visibility_timeout))
+        return [tuple(row) for row in result]
+
+    # Public Methods - NOTIFY
+
+    async def notify(self, channel: str, payload: str = ''):
+        await self._query(self.statements.notify, False, (channel, payload))
+
+    @property
+    def prediction_channel(self) -> str:
+        return f'{self.prediction_table_name}_queued'
+
+    # Private Methods
+
+    def __ticker_params(self, ticker: Ticker) -> tuple:
+        return (ticker.timestamp, ticker.ask, ticker.bid, ticker.last, ticker.low, ticker.high, ticker.open, ticker.volume, ticker.volume_quote,
+                ticker_symbol(ticker, self.symbol))
+
+    def __parse_allowed_statuses(self, status: str):
+        for allowed_status in PostgresConfig.ALLOWED_STATUSES:
+            if status.lower() == allowed_status.lower():
+                return allowed_status
+        raise Exception(f"Invalid status: {status}")
+
+    async def _query(self, query: Union[str, PostgresStatement], fetch_result: bool, params: tuple = ()):
+        '''
+        Run a query on a pooled connection, retrying up to 3 times.
+        `query` is either a PostgresStatement or a plain SQL string, both using `$1` placeholders.
+        asyncpg prepares & caches every statement per connection on its own.
+        '''
+        sql = query.sql if type(query) is PostgresStatement else query
+        return await self.__with_retries(sql, params, lambda conn: conn.fetch(sql, *params) if fetch_result else conn.execute(sql, *params))
+
+    async def _execute_many(self, query: Union[str, PostgresStatement], rows: List[tuple]):
+        sql = query.sql if type(query) is PostgresStatement else query
+        return await self.__with_retries(sql, f'({len(rows)} rows)', lambda conn: conn.executemany(sql, rows))
+
+    async def __with_retries(self, sql: str, params, run):
+        pinned = self.__pinned.get()
+        if pinned is not None:
+            # Part of a transaction, the whole block fails instead
+            return await run(pinned)
+        await self.connect()
+        message = None
+        for attempt in range(3):
+            try:
+                async with self.pool.acquire() as conn:
+                    return await run(conn)
+            # InterfaceError covers a connection the server or the pool closed under us, ex. after a restart
+            except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError):
+                message = f"**SQL Query Failed**: {sql} {params if params else ''}\n{traceback.format_exc()}"
+                self.log.error(message)
+        # Discord's client blocks, keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.discord.send_alert, message)
+        raise Exception("Failed to submit query to Postgres after 3 attempts. Giving up.")
@@ -0,0 +1,61 @@
+import select
+
+import psycopg2 as psql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from utils import Logger
+
+
+class PostgresListener:
+
+    '''
+    A dedicated connection that LISTENs on one channel, for blocking until another process sends a NOTIFY.
+    Kept outside the shared pool, since the subscription belongs to the session and would be lost on checkin.
+    '''
+
+    def __init__(self, dsn: str, channel: str) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.dsn = dsn
+        self.channel = channel
+        self.conn = None
+
+    def listen(self) -> None:
+        '''
+        Open the connection and subscribe, if that hasn't happened yet.
+        Notifications sent from this point on are buffered until the next `wait()`.
+        '''
+        if self.conn is not None and not self.conn.closed:
+            return
+        self.conn = psql.connect(self.dsn)
+        self.conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with self.conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.channel}')
+        self.log.debug(f'Listening for notifications on {self.channel}')
+
+    def wait(self, timeout: float) -> bool:
+        '''
+        Block until a notification arrives on the channel, or until the timeout passes.
+        A broken connection is dropped & counts as a timeout, it is reopened on the next call.
+
+        :return: True if at least one notification was received
+        '''
+        try:
+            self.listen()
+            self.conn.poll()
+            if not self.conn.notifies and select.select([self.conn], [], [], max(timeout, 0)) != ([], [], []):
+                self.conn.poll()
+            notified = len(self.conn.notifies) > 0
+            self.conn.notifies.clear()
+            return notified
+        except Exception as err:
+            self.log.warning(f'Lost connection while listening on {self.channel}: {err}')
+            self.close()
+            return False
+
+    def close(self) -> None:
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
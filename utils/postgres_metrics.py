@@ -0,0 +1,180 @@
+import re
+import threading
+from time import time as now
+from typing import Dict, List
+
+from utils import Logger
+from utils.config import PostgresConfig
+
+
+def label_for_sql(sql: str) -> str:
+    '''
+    Metrics name for a plain SQL string, ex. "INSERT ticker_feed".
+    Built from the command & the first table only, so inline values never create new names.
+    '''
+    words = sql.split(None, 1)
+    if not words:
+        return 'EMPTY'
+    table = re.search(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(\w+)', sql, re.IGNORECASE)
+    return f'{words[0].upper()} {table.group(1)}' if table else words[0].upper()
+
+
+class PostgresStatementMetrics:
+
+    '''
+    Latency histogram, row & error counts for one statement name
+    '''
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.calls: int = 0
+        self.errors: int = 0
+        self.slow: int = 0
+        self.rows: int = 0
+        self.total_ms: float = 0
+        self.max_ms: float = 0
+        # One count per bucket in QUERY_METRICS_BUCKETS_MS, plus an overflow bucket
+        self.buckets: List[int] = [0] * (len(PostgresConfig.QUERY_METRICS_BUCKETS_MS) + 1)
+
+    def record(self, duration_ms: float, rows: int, slow: bool) -> None:
+        self.calls += 1
+        self.rows += rows
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.slow += int(slow)
+        for index, bound in enumerate(PostgresConfig.QUERY_METRICS_BUCKETS_MS):
+            if duration_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def percentile(self, fraction: float) -> float:
+        '''
+        Upper bound of the histogram bucket holding the given fraction of calls, in milliseconds.
+        The overflow bucket reports the slowest call seen.
+        '''
+        if self.calls == 0:
+            return 0
+        target = fraction * self.calls
+        seen = 0
+        for index, bound in enumerate(PostgresConfig.QUERY_METRICS_BUCKETS_MS):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'slow': self.slow,
+            'rows': self.rows,
+            'total_ms': self.total_ms,
+            'mean_ms': self.total_ms / self.calls if self.calls else 0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'max_ms': self.max_ms,
+            'buckets': dict(zip([*PostgresConfig.QUERY_METRICS_BUCKETS_MS, float('inf')], self.buckets)),
+        }
+
+
+class PostgresQueryMetrics:
+
+    '''
+    Opt-in instrumentation for `Postgres._query`, shared by every `Postgres` object in the process.
+    Records latency histograms & row counts per statement name, retry & reconnect counters, logs queries slower
+    than QUERY_SLOW_THRESHOLD_MS, and logs a one-line summary every QUERY_METRICS_SUMMARY_INTERVAL.
+
+    Off unless PostgresConfig.QUERY_METRICS_ENABLED is set, or turned on at runtime with
+    `PostgresQueryMetrics.shared().enabled = True`. Read the numbers with `stats` or `summary()`.
+    '''
+
+    __shared: 'PostgresQueryMetrics' = None
+    __shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> 'PostgresQueryMetrics':
+        with cls.__shared_lock:
+            if cls.__shared is None:
+                cls.__shared = cls()
+            return cls.__shared
+
+    def __init__(self, enabled: bool = None, slow_threshold_ms: float = None, summary_interval: int = None) -> None:
+        self.log = Logger.setup(self.__class__.__name__)
+        self.enabled: bool = enabled if enabled is not None else PostgresConfig.QUERY_METRICS_ENABLED
+        self.slow_threshold_ms: float = slow_threshold_ms if slow_threshold_ms is not None else PostgresConfig.QUERY_SLOW_THRESHOLD_MS
+        self.summary_interval: int = summary_interval if summary_interval is not None else PostgresConfig.QUERY_METRICS_SUMMARY_INTERVAL
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.retries: int = 0
+            self.reconnects: int = 0
+            self.statements: Dict[str, PostgresStatementMetrics] = {}
+            self.last_summary: float = now()
+
+    def record(self, name: str, sql: str, duration_ms: float, rows: int) -> None:
+        '''
+        Record one successful query
+        '''
+        slow = duration_ms >= self.slow_threshold_ms
+        with self.__lock:
+            self.__statement(name).record(duration_ms, rows, slow)
+        if slow:
+            self.log.warning(f'Slow query {name} took {duration_ms:.1f}ms, {rows} rows: {sql[:200]}')
+        self.__log_summary_if_due()
+
+    def record_error(self, name: str, retrying: bool) -> None:
+        with self.__lock:
+            self.__statement(name).errors += 1
+            if retrying:
+                self.retries += 1
+
+    def record_reconnect(self) -> None:
+        with self.__lock:
+            self.reconnects += 1
+
+    @property
+    def stats(self) -> dict:
+        '''
+        Every counter so far, with one dict of histogram & row counts per statement name
+        '''
+        with self.__lock:
+            return {
+                'retries': self.retries,
+                'reconnects': self.reconnects,
+                'statements': {name: statement.as_dict() for name, statement in self.statements.items()}
+            }
+
+    def summary(self, top: int = None) -> str:
+        '''
+        One line covering the totals and the statements that took the most time overall
+        '''
+        top = top if top is not None else PostgresConfig.QUERY_METRICS_SUMMARY_TOP
+        with self.__lock:
+            statements = sorted(self.statements.values(), key=lambda statement: statement.total_ms, reverse=True)
+            calls = sum(statement.calls for statement in statements)
+            errors = sum(statement.errors for statement in statements)
+            slow = sum(statement.slow for statement in statements)
+            line = f'Postgres queries: {calls} calls, {slow} slow, {errors} errors, {self.retries} retries, {self.reconnects} reconnects'
+            for statement in statements[:top]:
+                mean_ms = statement.total_ms / statement.calls if statement.calls else 0
+                line += (f' | {statement.name}: {statement.calls} calls, {statement.total_ms:.0f}ms total, {mean_ms:.2f}ms mean,'
+                         f' p50 {statement.percentile(0.5):g}ms, p95 {statement.percentile(0.95):g}ms, max {statement.max_ms:.1f}ms, {statement.rows} rows')
+        return line
+
+    def __statement(self, name: str) -> PostgresStatementMetrics:
+        if name not in self.statements:
+            self.statements[name] = PostgresStatementMetrics(name)
+        return self.statements[name]
+
+    def __log_summary_if_due(self) -> None:
+        if self.summary_interval is None:
+            return
+        # Checked & claimed under the lock, so only one thread logs each summary
+        with self.__lock:
+            if now() - self.last_summary < self.summary_interval:
+                return
+            self.last_summary = now()
+        self.log.info(self.summary())
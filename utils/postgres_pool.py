@@ -0,0 +1,295 @@
+import threading
+from contextlib import contextmanager
+from time import time as now
+from typing import Dict, List, Set
+
+import psycopg2 as psql
+from psycopg2.extensions import connection as PsqlConnection
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+from utils import Logger
+from utils.config import PostgresConfig
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection(PsqlConnection):
+    '''
+    psycopg2 connection that keeps track of when it was last returned to the pool,
+    and which server-side prepared statements already exist on it
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used: float = now()
+        self.prepared: Set[str] = set()
+
+    def reset(self):
+        '''
+        Roll back any open transaction and drop all prepared statements,
+        in case a failure left them out of date (ex. after a schema change)
+        '''
+        self.rollback()
+        if self.prepared:
+            with self.cursor() as cursor:
+                cursor.execute('DEALLOCATE ALL')
+            self.commit()
+            self.prepared.clear()
+
+
+class PostgresPoolMetrics:
+
+    '''
+    Running counters for a single PostgresPool
+    '''
+
+    def __init__(self) -> None:
+        self.created: int = 0
+        self.discarded: int = 0
+        self.checkouts: int = 0
+        self.waits: int = 0
+        self.timeouts: int = 0
+        self.failed_health_checks: int = 0
+
+    def as_dict(self, in_use: int, idle: int) -> dict:
+        return {
+            'created': self.created,
+            'discarded': self.discarded,
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'failed_health_checks': self.failed_health_checks,
+            'in_use': in_use,
+            'idle': idle,
+        }
+
+
+class PostgresPool:
+
+    '''
+    Thread-safe pool of psycopg2 connections, shared by every `Postgres` object in the process.
+    Use `PostgresPool.shared(dsn)` rather than creating a pool directly.
+
+    Connections are in autocommit mode, so each statement commits on its own without a COMMIT round trip.
+    Use `transaction()` to group several statements into one commit.
+    '''
+
+    __shared: Dict[str, 'PostgresPool'] = {}
+    __shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        dsn: str,
+        min_size: int = PostgresConfig.POOL_MIN_SIZE,
+        max_size: int = PostgresConfig.POOL_MAX_SIZE,
+        checkout_timeout: float = PostgresConfig.POOL_CHECKOUT_TIMEOUT,
+        health_check_interval: float = PostgresConfig.POOL_HEALTH_CHECK_INTERVAL
+    ) -> None:
+        if min_size > max_size:
+            raise Exception(f"Invalid pool size: min_size ({min_size}) is larger than max_size ({max_size})")
+        self.log = Logger.setup(self.__class__.__name__)
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.metrics = PostgresPoolMetrics()
+        self.__idle: List[PooledConnection] = []
+        self.__size: int = 0
+        self.__closed: bool = False
+        self.__condition = threading.Condition()
+        # Connection pinned to the current thread by transaction()
+        self.__local = threading.local()
+        for _ in range(self.min_size):
+            self.__idle.append(self.__open_connection())
+            self.__size += 1
+
+    @classmethod
+    def shared(cls, dsn: str) -> 'PostgresPool':
+        '''
+        Return the process-wide pool for a given DSN, creating it on first use
+        '''
+        with cls.__shared_lock:
+            pool = cls.__shared.get(dsn)
+            if pool is None or pool.closed:
+                pool = cls(dsn)
+                cls.__shared[dsn] = pool
+            return pool
+
+    # Public
+
+    @contextmanager
+    def connection(self):
+        '''
+        Borrow a connection for the duration of a `with` block.
+        If the block raises, the connection is rolled back, or discarded if it is no longer usable.
+        '''
+        pinned = self.pinned
+        if pinned is not None:
+            # Inside transaction(), which commits or rolls back once the whole block is done
+            yield pinned
+            return
+        conn = self.checkout()
+        try:
+            yield conn
+        except Exception:
+            self.checkin(conn, broken=True)
+            raise
+        self.checkin(conn)
+
+    @contextmanager
+    def transaction(self):
+        '''
+        Run every query made from this thread inside the `with` block on one connection, in one transaction.
+        Commits when the block finishes, or rolls back if it raises. A nested block joins the outer transaction.
+        '''
+        if self.pinned is not None:
+            yield self.pinned
+            return
+        conn = self.checkout()
+        try:
+            conn.autocommit = False
+            self.__local.conn = conn
+            yield conn
+            conn.commit()
+        except Exception:
+            self.__local.conn = None
+            self.checkin(conn, broken=True)
+            raise
+        self.__local.conn = None
+        self.checkin(conn)
+
+    @property
+    def pinned(self) -> PooledConnection:
+        '''
+        The connection of the transaction open on this thread, if any
+        '''
+        return getattr(self.__local, 'conn', None)
+
+    def checkout(self) -> PooledConnection:
+        '''
+        Take a healthy connection from the pool, opening a new one if there is room.
+        Blocks for up to `checkout_timeout` seconds when every connection is in use.
+        '''
+        deadline = now() + self.checkout_timeout
+        while True:
+            conn = self.__take_or_reserve(deadline)
+            if conn is None:
+                # A slot was reserved for a brand new connection
+                try:
+                    conn = self.__open_connection()
+                except Exception:
+                    self.__release_slot()
+                    raise
+            elif not self.__is_healthy(conn):
+                with self.__condition:
+                    self.metrics.failed_health_checks += 1
+                self.__discard(conn)
+                continue
+            with self.__condition:
+                self.metrics.checkouts += 1
+            return conn
+
+    def checkin(self, conn: PooledConnection, broken: bool = False) -> None:
+        '''
+        Return a borrowed connection to the pool
+        '''
+        if broken or conn.closed:
+            try:
+                conn.reset()
+            except Exception:
+                self.__discard(conn)
+                return
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE or self.__closed:
+            self.__discard(conn)
+            return
+        # Borrowers may have turned autocommit off for a transaction
+        if not conn.autocommit:
+            conn.autocommit = True
+        conn.last_used = now()
+        with self.__condition:
+            self.__idle.append(conn)
+            self.__condition.notify()
+
+    def close(self) -> None:
+        '''
+        Close every idle connection. Connections that are checked out are closed when they are returned.
+        '''
+        with self.__condition:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+        for conn in idle:
+            self.__discard(conn)
+
+    @property
+    def closed(self) -> bool:
+        return self.__closed
+
+    @property
+    def stats(self) -> dict:
+        with self.__condition:
+            idle = len(self.__idle)
+            return self.metrics.as_dict(in_use=self.__size - idle, idle=idle)
+
+    # Private
+
+    def __take_or_reserve(self, deadline: float) -> PooledConnection:
+        '''
+        Pop an idle connection, or reserve a slot for a new one (returns None).
+        Raises PoolTimeout if neither is possible before the deadline.
+        '''
+        with self.__condition:
+            waited = False
+            while True:
+                if self.__closed:
+                    raise Exception("Tried to check out a connection from a closed pool")
+                if self.__idle:
+                    return self.__idle.pop()
+                if self.__size < self.max_size:
+                    self.__size += 1
+                    return None
+                remaining = deadline - now()
+                if remaining <= 0:
+                    self.metrics.timeouts += 1
+                    raise PoolTimeout(f"No Postgres connection available after {self.checkout_timeout} seconds (max_size={self.max_size})")
+                if not waited:
+                    self.metrics.waits += 1
+                    waited = True
+                self.__condition.wait(remaining)
+
+    def __is_healthy(self, conn: PooledConnection) -> bool:
+        if conn.closed or conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if now() - conn.last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            self.log.debug('Pooled connection failed health check, discarding it')
+            return False
+
+    def __open_connection(self) -> PooledConnection:
+        conn = psql.connect(self.dsn, connection_factory=PooledConnection)
+        conn.autocommit = True
+        with self.__condition:
+            self.metrics.created += 1
+        return conn
+
+    def __discard(self, conn: PooledConnection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.__condition:
+            self.metrics.discarded += 1
+        self.__release_slot()
+
+    def __release_slot(self) -> None:
+        with self.__condition:
+            self.__size -= 1
+            self.__condition.notify()